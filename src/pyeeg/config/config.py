@@ -0,0 +1,59 @@
+import os
+import functools
+
+from dotenv import load_dotenv
+
+
+class Settings:
+    """
+    Paths and options of the environment (.env file and variables), resolved on first use.
+
+    Folders are searched upwards from the working directory the first time they are needed
+    and kept afterwards, use get_settings.cache_clear() to resolve them again.
+    """
+
+    def __init__(self):
+        load_dotenv()
+
+    def getenv(self, key, default=None) -> str | None:
+        return os.getenv(key, default)
+
+    @functools.cached_property
+    def data_dir(self) -> str | None:
+        return find_folder(target_folder='data')
+
+    @functools.cached_property
+    def log_dir(self) -> str | None:
+        return find_folder(target_folder=self.getenv('LOG_DIR', 'logs'))
+
+    @functools.cached_property
+    def export_dir(self) -> str | None:
+        if self.data_dir is None or self.getenv('EXPORT_DATA_DIR') is None:
+            return None
+        return self.data_dir + '/' + self.getenv('EXPORT_DATA_DIR')
+
+    @functools.cached_property
+    def interim_dir(self) -> str | None:
+        if self.data_dir is None:
+            return None
+        return self.data_dir + '/interim'
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Returns the settings of the process, .env is read once on the first call."""
+    return Settings()
+
+def find_folder(start_dir=None, target_folder=None) -> str | None:
+    """Finds a folder by going upwards in directory """    
+    current_dir = os.path.abspath(start_dir or os.getcwd())
+
+    while True:
+        candidate = os.path.join(current_dir, target_folder)
+        if os.path.isdir(candidate):
+            return candidate
+
+        parent_dir = os.path.dirname(current_dir)
+        if parent_dir == current_dir:
+            return None
+
+        current_dir = parent_dir
@@ -0,0 +1,197 @@
+import os
+import json
+import sqlite3
+import numpy as np
+
+from pyeeg.io.getdir import set_interimdir
+from pyeeg.io.loader import annotation_events, open_raw
+from pyeeg.preprocess.find_montage import adjust_chan_kind, get_chanlocs
+from pyeeg.preprocess.montage_fingerprint import chanlocs_fingerprint
+from pyeeg.utils.constants import CATALOG_FILE, CATALOG_EXTENSIONS
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    format TEXT,
+    mtime_ns INTEGER,
+    size INTEGER,
+    sfreq REAL,
+    n_channels INTEGER,
+    duration REAL,
+    ch_names TEXT,
+    event_counts TEXT,
+    fingerprint TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    path TEXT REFERENCES recordings(path) ON DELETE CASCADE,
+    event TEXT,
+    count INTEGER
+);
+CREATE TABLE IF NOT EXISTS channels (
+    path TEXT REFERENCES recordings(path) ON DELETE CASCADE,
+    ch_name TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_sfreq ON recordings(sfreq);
+CREATE INDEX IF NOT EXISTS recordings_fingerprint ON recordings(fingerprint);
+CREATE INDEX IF NOT EXISTS events_event ON events(event, path);
+CREATE INDEX IF NOT EXISTS channels_ch_name ON channels(ch_name, path);
+"""
+
+def connect_catalog(db_path=None) -> sqlite3.Connection:
+    """
+    Opens (and creates if needed) a catalog database.
+
+    Args:
+        db_path (str): path of the SQLite file, defaults to data/interim/CATALOG_FILE.
+
+    Returns:
+        connection (sqlite3.Connection)
+    """
+    db_path = db_path or set_interimdir(CATALOG_FILE)
+    if db_path is None:
+        logger.error("No data folder found to keep the catalog, please enter a db_path")
+        raise ValueError("No data folder found to keep the catalog, please enter a db_path")
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(CATALOG_SCHEMA)
+    return connection
+
+def read_header_entry(filename) -> dict:
+    """
+    Reads header and annotations of a recording, signal data is not read.
+
+    Args:
+        filename (str): path of an mne readable file.
+
+    Returns:
+        entry (dict): catalog columns of the recording, 'error' is set if it could not be read.
+    """
+    stat = os.stat(filename)
+    entry = {'path': os.path.abspath(filename),
+             'format': os.path.splitext(filename)[-1].lower().lstrip('.'),
+             'mtime_ns': stat.st_mtime_ns,
+             'size': stat.st_size,
+             'sfreq': None, 'n_channels': None, 'duration': None,
+             'ch_names': [], 'event_counts': {}, 'fingerprint': None, 'error': None}
+    try:
+        raw_data = open_raw(filename)
+        entry['sfreq'] = raw_data.info['sfreq']
+        entry['n_channels'] = raw_data.info['nchan']
+        entry['duration'] = raw_data.n_times / raw_data.info['sfreq']
+        entry['ch_names'] = list(raw_data.ch_names)
+        # BAD_ and EDGE annotations are segments, a recording with only those has no events
+        events, event_id = annotation_events(raw_data)
+        entry['event_counts'] = {event_name: int(np.count_nonzero(events[:, -1] == event_val))
+                                 for event_name, event_val in event_id.items()}
+        data_chan_info = get_chanlocs(adjust_chan_kind(raw_data.info))
+        if data_chan_info:
+            entry['fingerprint'] = chanlocs_fingerprint(data_chan_info)
+    except Exception as err:
+        logger.error(f"Could not read header of {filename}: {err}")
+        entry['error'] = f"{type(err).__name__}: {err}"
+    return entry
+
+def find_recordings(root_dir, extensions=CATALOG_EXTENSIONS) -> list:
+    """Paths of all files below root_dir with one of the extensions."""
+    paths = []
+    for dir_path, _, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[-1].lower() in extensions:
+                paths.append(os.path.abspath(os.path.join(dir_path, file_name)))
+    return sorted(paths)
+
+def scan_catalog(root_dir, db_path=None, extensions=CATALOG_EXTENSIONS) -> dict:
+    """
+    Adds the recordings of a directory tree to the catalog, reading only new or modified files.
+
+    Recordings whose mtime and size are unchanged are skipped, recordings that disappeared
+    from root_dir are removed.
+
+    Args:
+        root_dir (str): folder scanned recursively
+        db_path (str): path of the SQLite file, defaults to data/interim/CATALOG_FILE.
+        extensions (tuple): file extensions of recordings
+
+    Returns:
+        scan_info (dict): number of 'added', 'updated', 'unchanged' and 'removed' recordings
+    """
+    scan_info = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0}
+    root_dir = os.path.abspath(root_dir)
+    with connect_catalog(db_path) as connection:
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in
+                 connection.execute("SELECT path, mtime_ns, size FROM recordings WHERE substr(path, 1, ?) = ?", 
+                                            (len(root_dir) + 1, root_dir + os.sep))}
+        paths = find_recordings(root_dir, extensions)
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                scan_info['unchanged'] += 1
+                continue
+            scan_info['updated' if path in known else 'added'] += 1
+            write_catalog_entry(connection, read_header_entry(path))
+
+        removed = set(known) - set(paths)
+        connection.executemany("DELETE FROM recordings WHERE path = ?", [(path,) for path in removed])
+        scan_info['removed'] = len(removed)
+    connection.close()
+    logger.info(f"Catalog scan of {root_dir}: {scan_info}")
+    return scan_info
+
+def write_catalog_entry(connection, entry):
+    """Inserts or replaces a recording and its events and channels in the catalog."""
+    connection.execute("DELETE FROM recordings WHERE path = ?", (entry['path'],))
+    connection.execute("INSERT INTO recordings VALUES (:path, :format, :mtime_ns, :size, :sfreq, :n_channels, :duration, "
+                       ":ch_names, :event_counts, :fingerprint, :error)",
+                       {**entry, 'ch_names': json.dumps(entry['ch_names']), 'event_counts': json.dumps(entry['event_counts'])})
+    connection.executemany("INSERT INTO events VALUES (?, ?, ?)",
+                           [(entry['path'], event, count) for event, count in entry['event_counts'].items()])
+    connection.executemany("INSERT INTO channels VALUES (?, ?)", [(entry['path'], ch_name) for ch_name in entry['ch_names']])
+
+def query_catalog(db_path=None, sfreq=None, min_duration=None, channels=None, event=None, fingerprint=None) -> list:
+    """
+    Selects readable recordings of the catalog matching all given conditions.
+
+    Args:
+        db_path (str): path of the SQLite file, defaults to data/interim/CATALOG_FILE.
+        sfreq (float): sampling rate
+        min_duration (float): minimum duration in seconds
+        channels (list): channel names that should all be present
+        event (str): event that should occur at least once
+        fingerprint (str): montage fingerprint (see chanlocs_fingerprint)
+
+    Returns:
+        recordings (list): dicts of catalog columns, ch_names and event_counts decoded
+    """
+    conditions, params = ["error IS NULL"], []
+    if sfreq is not None:
+        conditions.append("sfreq = ?")
+        params.append(float(sfreq))
+    if min_duration is not None:
+        conditions.append("duration >= ?")
+        params.append(float(min_duration))
+    if fingerprint is not None:
+        conditions.append("fingerprint = ?")
+        params.append(fingerprint)
+    if event is not None:
+        conditions.append("path IN (SELECT path FROM events WHERE event = ? AND count > 0)")
+        params.append(event)
+    for ch_name in (channels or []):
+        conditions.append("path IN (SELECT path FROM channels WHERE ch_name = ?)")
+        params.append(ch_name)
+
+    connection = connect_catalog(db_path)
+    connection.row_factory = sqlite3.Row
+    rows = connection.execute(f"SELECT * FROM recordings WHERE {' AND '.join(conditions)} ORDER BY path", params).fetchall()
+    connection.close()
+    recordings = []
+    for row in rows:
+        recording = dict(row)
+        recording['ch_names'] = json.loads(recording['ch_names'])
+        recording['event_counts'] = json.loads(recording['event_counts'])
+        recordings.append(recording)
+    return recordings
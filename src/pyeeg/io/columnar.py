@@ -0,0 +1,235 @@
+import os
+import json
+import shutil
+import hashlib
+import datetime
+import numpy as np
+
+import mne
+
+from pyeeg.io.getdir import set_interimdir
+from pyeeg.io.loader import WindowedReader, annotation_events, copy_annotations, source_key, write_windows
+from pyeeg.utils.constants import DEFAULT_READER_PARAMETERS, COLUMNAR_CACHE_DIR, COLUMNAR_VERSION
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# A columnar recording is a folder holding
+#   header.json: info, channel locations, annotations, event ids and the source_key of the source file
+#   data.npy:    samples, channel-major (channels, times), C-contiguous, the layout of read_raw_memmap backing files
+#   events.npy:  mne events array (samples, 0, event id) from the annotations
+
+def columnar_path(filename, cache_dir=None) -> str | None:
+    """
+    Folder of the columnar copy of a source file, None if there is no data folder to keep it.
+
+    Args:
+        filename (str): path of the source recording.
+        cache_dir (str): folder of columnar recordings, defaults to data/interim/columnar.
+
+    Returns:
+        path (str)
+    """
+    cache_dir = cache_dir or set_interimdir(COLUMNAR_CACHE_DIR)
+    if cache_dir is None:
+        return None
+    path_hash = hashlib.sha1(os.path.abspath(filename).encode('utf8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{os.path.basename(filename)}-{path_hash}.pyeeg")
+
+def info_to_header(info) -> dict:
+    """
+    Serializable part of an mne info object that is needed to rebuild a raw object.
+
+    Args:
+        info (mne.Info): mne info object
+
+    Returns:
+        header (dict)
+    """
+    return {'sfreq': info['sfreq'],
+            'ch_names': info['ch_names'],
+            'ch_types': info.get_channel_types(unique=False),
+            'ch_locs': [ch['loc'].tolist() for ch in info['chs']],
+            'bads': info['bads'],
+            'highpass': info['highpass'],
+            'lowpass': info['lowpass'],
+            'meas_date': info['meas_date'].isoformat() if info['meas_date'] is not None else None}
+
+def header_to_info(header):
+    """
+    Rebuilds an mne info object written by info_to_header.
+
+    Args:
+        header (dict)
+
+    Returns:
+        info (mne.Info)
+    """
+    info = mne.create_info(header['ch_names'], header['sfreq'], header['ch_types'])
+    for ch, loc in zip(info['chs'], header['ch_locs']):
+        ch['loc'][:] = loc
+    with info._unlock():
+        info['bads'] = header['bads']
+        info['highpass'] = header['highpass']
+        info['lowpass'] = header['lowpass']
+    if header['meas_date'] is not None:
+        info.set_meas_date(datetime.datetime.fromisoformat(header['meas_date']))
+    return info
+
+def write_columnar(raw_data, path, source=None, dtype='float64'):
+    """
+    Writes a raw object as a columnar recording, data is streamed window by window.
+
+    Args:
+        raw_data (mne.raw): mne raw data object, does not need to be preloaded
+        path (str): folder of the columnar recording, replaced if it exists
+        source (str): source_key of the original file, used for invalidation
+        dtype (str): 'float64' or 'float32' precision of data.npy
+
+    Returns:
+        Nothing
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    reader = WindowedReader(raw_data, reader_parameters={**DEFAULT_READER_PARAMETERS, 'max_bytes': None, 'dtype': dtype})
+    write_windows(reader, os.path.join(tmp_path, 'data.npy'))
+
+    events, event_id = annotation_events(raw_data)
+    np.save(os.path.join(tmp_path, 'events.npy'), events)
+
+    annotations = raw_data.annotations
+    header = {'version': COLUMNAR_VERSION,
+              'dtype': np.dtype(dtype).name,
+              'shape': [len(reader.picks), reader.n_times],
+              'first_samp': int(raw_data.first_samp),
+              'source': source,
+              'info': info_to_header(raw_data.info),
+              'annotations': {'onset': annotations.onset.tolist(),
+                              'duration': annotations.duration.tolist(),
+                              'description': annotations.description.tolist(),
+                              'orig_time': annotations.orig_time.isoformat() if annotations.orig_time is not None else None},
+              'event_id': event_id}
+    with open(os.path.join(tmp_path, 'header.json'), 'w', encoding='utf8') as f:
+        json.dump(header, f)
+
+    # the old copy is renamed aside first, readers see either the old or the new folder, never a partial one
+    old_path = f"{path}.{os.getpid()}.old"
+    try:
+        os.replace(path, old_path)
+    except FileNotFoundError:
+        old_path = None
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # another process put its copy in place meanwhile, it was converted from the same source
+        logger.debug(f"{path} was written by another process")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    if old_path is not None:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+def read_columnar_header(path) -> dict | None:
+    """Header of a columnar recording, None if it is missing, unreadable or of another version."""
+    try:
+        with open(os.path.join(path, 'header.json'), 'r', encoding='utf8') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get('version') != COLUMNAR_VERSION:
+        return None
+    return header
+
+def read_columnar(path, return_events=False):
+    """
+    Reads a columnar recording, data.npy is mapped copy-on-write into the raw object.
+
+    Args:
+        path (str): folder of the columnar recording
+        return_events (bool): also return events and event_id
+
+    Returns:
+        raw_data (mne.io.RawArray): raw object backed by the mapped data block
+        events (np.ndarray) shape(events, 3): only if return_events
+        event_id (dict): only if return_events
+    """
+    header = read_columnar_header(path)
+    if header is None:
+        logger.error(f"{path} is not a columnar recording of version {COLUMNAR_VERSION}")
+        raise ValueError(f"{path} is not a columnar recording of version {COLUMNAR_VERSION}")
+
+    data = np.load(os.path.join(path, 'data.npy'), mmap_mode='c')
+    # mne needs native float64 to use the mapped block without a copy
+    raw_data = mne.io.RawArray(data, header_to_info(header['info']), first_samp=header['first_samp'], 
+                        copy=None if data.dtype == np.float64 and data.dtype.isnative else 'auto', verbose='error')
+    annotations = header['annotations']
+    if len(annotations['onset']):
+        orig_time = annotations['orig_time']
+        copy_annotations(mne.Annotations(annotations['onset'], annotations['duration'], annotations['description'],
+                                         orig_time=datetime.datetime.fromisoformat(orig_time) if orig_time else None), raw_data)
+    if return_events:
+        return raw_data, np.load(os.path.join(path, 'events.npy')), header['event_id']
+    return raw_data
+
+def is_columnar_valid(path, filename) -> bool:
+    """True if the columnar recording at path exists and was converted from the current filename."""
+    header = read_columnar_header(path)
+    return header is not None and header['source'] == source_key(filename)
+
+def convert_to_columnar(filename, cache_dir=None, dtype='float64', force=False) -> str:
+    """
+    Converts a recording to the columnar format unless an up to date copy exists.
+
+    Args:
+        filename (str): path of an EDF, EEGLAB .set, BrainVision .vhdr or any mne readable file.
+        cache_dir (str): folder of columnar recordings, defaults to data/interim/columnar.
+        dtype (str): 'float64' or 'float32' precision of data.npy
+        force (bool): convert even if an up to date copy exists
+
+    Returns:
+        path (str): folder of the columnar recording
+    """
+    path = columnar_path(filename, cache_dir)
+    if path is None:
+        logger.error("No data folder found to keep columnar recordings, please enter a cache_dir")
+        raise ValueError("No data folder found to keep columnar recordings, please enter a cache_dir")
+    if force or not is_columnar_valid(path, filename):
+        logger.info(f"Converting {filename} to {path}")
+        source = source_key(filename)
+        with WindowedReader(filename) as reader:
+            write_columnar(reader.raw_data, path, source=source, dtype=dtype)
+    return path
+
+def convert_recordings(paths, cache_dir=None, dtype='float64', force=False) -> dict:
+    """
+    Converts many recordings to the columnar format, recordings that fail are logged and skipped.
+
+    Args:
+        paths (list): paths of the source recordings
+        cache_dir (str): folder of columnar recordings, defaults to data/interim/columnar.
+        dtype (str): 'float64' or 'float32' precision of data.npy
+        force (bool): convert even if an up to date copy exists
+
+    Returns:
+        columnar_paths (dict): source path -> columnar folder, None for failed recordings
+    """
+    columnar_paths = {}
+    for filename in paths:
+        try:
+            columnar_paths[filename] = convert_to_columnar(filename, cache_dir=cache_dir, dtype=dtype, force=force)
+        except Exception as err:
+            logger.error(f"Could not convert {filename}: {err}")
+            columnar_paths[filename] = None
+    return columnar_paths
+
+def read_raw_columnar(filename, cache_dir=None, return_events=False):
+    """
+    Reads a recording through its columnar copy, converting it first if it is missing or stale.
+
+    Args:
+        filename (str): path of the source recording
+        cache_dir (str): folder of columnar recordings, defaults to data/interim/columnar.
+        return_events (bool): also return events and event_id
+
+    Returns:
+        see read_columnar
+    """
+    return read_columnar(convert_to_columnar(filename, cache_dir=cache_dir), return_events=return_events)
@@ -1,7 +1,7 @@
-from mne.io import read_raw_edf
+import mne
 
 def read_edf(filename):
-    return read_raw_edf(
+    return mne.io.read_raw_edf(
             filename,
             eog=None,
             misc=None,
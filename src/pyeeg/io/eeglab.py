@@ -1,7 +1,7 @@
-from mne.io.eeglab import read_raw_eeglab
+import mne
 
 def read_eeglab(filename):
-    return read_raw_eeglab(
+    return mne.io.read_raw_eeglab(
         filename,
         eog=(),
         preload=False,
@@ -1,7 +1,311 @@
-from mne.io import read_raw
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
+import mne
 
-def read_raw_data(filename):
-    return read_raw(filename,
-                    preload=True,
-                    verbose=None)
\ No newline at end of file
+from pyeeg.io.edf import read_edf
+from pyeeg.io.eeglab import read_eeglab
+from pyeeg.io.getdir import set_interimdir
+from pyeeg.utils.constants import DEFAULT_READER_PARAMETERS, ORIG_FORMAT_BYTES, DEFAULT_MEMMAP_DTYPE, MEMMAP_CACHE_DIR, EVENT_ANNOTATION_REGEXP
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def read_raw_data(filename, preload=True):
+    """
+    Reads a recording.
+
+    Args:
+        filename (str): path of an mne readable file.
+        preload (bool | str): True loads data into memory, False reads it on demand and 
+            'memmap' maps a decoded copy kept under data/interim (see read_raw_memmap).
+
+    Returns:
+        raw_data (mne.raw): mne raw data object
+    """
+    if preload == 'memmap':
+        return read_raw_memmap(filename)
+    return mne.io.read_raw(filename,
+                           preload=preload,
+                           verbose=None)
+
+def open_raw(filename):
+    """
+    Opens a recording without preloading its data.
+
+    Args:
+        filename (str): path of an EDF, EEGLAB .set, BrainVision .vhdr or any mne readable file.
+
+    Returns:
+        raw_data (mne.raw): mne raw data object
+    """
+    extension = os.path.splitext(filename)[-1].lower()
+    if extension == '.edf':
+        return read_edf(filename)
+    elif extension == '.set':
+        return read_eeglab(filename)
+    else:
+        return mne.io.read_raw(filename, preload=False, verbose=None)
+
+
+def load_recording(filename, preload=False) -> dict:
+    """
+    Opens a recording and reports how long it took, errors are returned instead of raised.
+
+    Args:
+        filename (str): path of an mne readable file.
+        preload (bool | str): False opens with open_raw, True or 'memmap' reads with read_raw_data.
+
+    Returns:
+        result (dict): 'path', 'raw_data' (None on error), 'error' (None on success) and 'seconds'
+    """
+    start_time = time.perf_counter()
+    try:
+        raw_data = read_raw_data(filename, preload=preload) if preload else open_raw(filename)
+        error = None
+    except Exception as err:
+        logger.error(f"Could not load {filename}: {err}")
+        raw_data, error = None, f"{type(err).__name__}: {err}"
+    return {'path': filename, 'raw_data': raw_data, 'error': error, 'seconds': time.perf_counter() - start_time}
+
+def load_many(paths, max_workers=None, preload=False, use_processes=False):
+    """
+    Loads many recordings concurrently and yields them as they finish.
+
+    Threads suit I/O bound opening, processes suit preloading of formats whose decoding
+    holds the GIL; raw objects are then pickled back to the calling process.
+
+    Args:
+        paths (list): paths of mne readable files.
+        max_workers (int): size of the pool, None lets concurrent.futures decide.
+        preload (bool | str): see load_recording.
+        use_processes (bool): use a process pool instead of a thread pool.
+
+    Returns:
+        generator of result (dict): see load_recording, in completion order
+    """
+    pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool(max_workers=max_workers) as executor:
+        futures = [executor.submit(load_recording, filename, preload) for filename in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+def copy_annotations(raw_data, new_raw):
+    """
+    Sets the annotations of raw_data on new_raw, e.g. a RawArray built from its data, keeping their times.
+
+    Annotations without orig_time are relative to the first sample, set_annotations would
+    shift them by the first sample of new_raw otherwise.
+
+    Args:
+        raw_data (mne.raw | mne.Annotations): raw object or annotations read from one (e.g. mne.read_annotations)
+        new_raw (mne.raw): raw object the annotations are set on
+    """
+    annotations = getattr(raw_data, 'annotations', raw_data).copy()
+    if annotations.orig_time is None:
+        annotations.onset -= new_raw.first_time
+    new_raw.set_annotations(annotations)
+
+def annotation_events(raw_data) -> tuple[np.ndarray, dict]:
+    """
+    Events of the annotations of a raw object, like mne.events_from_annotations.
+
+    Recordings without annotations, or whose annotations are all BAD_ or EDGE segments,
+    get no events instead of the error mne raises for them.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+
+    Returns:
+        events (np.ndarray) shape(events, 3): mne events
+        event_id (dict): event name -> event id
+    """
+    import re
+
+    pattern = re.compile(EVENT_ANNOTATION_REGEXP)
+    if not any(pattern.match(description) for description in raw_data.annotations.description):
+        return np.empty((0, 3), dtype=int), {}
+    return mne.events_from_annotations(raw_data, regexp=EVENT_ANNOTATION_REGEXP, verbose='error')
+
+def source_key(filename) -> str:
+    """
+    Key of a source file that changes whenever the file is replaced or modified.
+
+    Args:
+        filename (str): path of the source file.
+
+    Returns:
+        key (str): hex digest of the absolute path, size and modification time.
+    """
+    stat = os.stat(filename)
+    return hashlib.sha1(f"{os.path.abspath(filename)}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf8')).hexdigest()
+
+def read_raw_memmap(filename, dtype=DEFAULT_MEMMAP_DTYPE, cache_dir=None):
+    """
+    Reads a recording through a memory-mapped backing file that is decoded only once.
+
+    The first call decodes the recording window by window into a .npy file (plus its info,
+    annotations and first sample) named after source_key, later calls map that file back
+    copy-on-write. In-place operations (e.g. filter) then only change the memory of the 
+    calling process, and processes reading the same recording share the page cache.
+    mne keeps raw data in float64, so only float64 backing files are zero-copy, float32 
+    files halve disk usage but are converted when reopened.
+
+    Args:
+        filename (str): path of an mne readable file.
+        dtype (str): 'float64' or 'float32' precision of the backing file.
+        cache_dir (str): folder of the backing files, defaults to data/interim/memmap.
+
+    Returns:
+        raw_data (mne.io.RawArray): raw object backed by the mapped array.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        logger.error(f"Backing file should be float32 or float64, instead: {dtype}")
+        raise ValueError(f"Backing file should be float32 or float64, instead: {dtype}")
+    cache_dir = cache_dir or set_interimdir(MEMMAP_CACHE_DIR)
+    if cache_dir is None:
+        logger.warning(f"No data folder found to keep backing files, {filename} is preloaded instead")
+        return read_raw_data(filename, preload=True)
+
+    fbase = os.path.join(cache_dir, f"{source_key(filename)}_{dtype.name}")
+    if not os.path.isfile(fbase + '.npy'):
+        _write_memmap(filename, fbase, dtype)
+
+    with open(fbase + '.json', 'r', encoding='utf8') as f:
+        header = json.load(f)
+    info = mne.io.read_info(fbase + '-info.fif', verbose='error')
+    data = np.load(fbase + '.npy', mmap_mode='c')
+    raw_data = mne.io.RawArray(data, info, first_samp=header['first_samp'], copy=None if dtype == np.float64 else 'auto', verbose='error')
+    if os.path.isfile(fbase + '-annot.fif'):
+        copy_annotations(mne.read_annotations(fbase + '-annot.fif'), raw_data)
+    raw_data._filenames = [filename]
+    return raw_data
+
+def _write_memmap(filename, fbase, dtype):
+    """Decodes filename into the backing files of read_raw_memmap, the .npy file is written last."""
+    os.makedirs(os.path.dirname(fbase), exist_ok=True)
+    reader = WindowedReader(filename, reader_parameters={**DEFAULT_READER_PARAMETERS, 'max_bytes': None, 'dtype': dtype.name})
+    logger.info(f"Decoding {filename} into {fbase}.npy")
+    tmp_npy = f"{fbase}.{os.getpid()}.tmp.npy"
+    with reader:
+        write_windows(reader, tmp_npy)
+        mne.io.write_info(fbase + '-info.fif', reader.raw_data.info, overwrite=True)
+        if len(reader.raw_data.annotations):
+            reader.raw_data.annotations.save(fbase + '-annot.fif', overwrite=True)
+        with open(fbase + '.json', 'w', encoding='utf8') as f:
+            json.dump({'source': os.path.abspath(filename), 'first_samp': int(reader.raw_data.first_samp)}, f)
+    os.replace(tmp_npy, fbase + '.npy')
+
+def write_windows(reader, fname):
+    """
+    Copies every window of a reader into a new .npy file, the on-disk layout of read_raw_memmap and columnar recordings.
+
+    Args:
+        reader (WindowedReader): reader of the recording, windows are written in its dtype
+        fname (str): path of the .npy file, shape(channels, times), C-contiguous
+
+    Returns:
+        Nothing
+    """
+    data = np.lib.format.open_memmap(fname, mode='w+', dtype=reader.dtype, shape=(len(reader.picks), reader.n_times))
+    for start, window in reader:
+        data[:, start:start + window.shape[-1]] = window
+    data.flush()
+    del data
+
+
+class WindowedReader:
+    """
+    Reads a recording in fixed-size, optionally overlapping windows of samples.
+
+    The file is opened without preloading and every window is read from disk on demand,
+    so memory is bounded by a single window. Windows larger than reader_parameters['max_bytes']
+    are refused.
+
+    Args:
+        filename (str | mne.raw): path of the recording or an already opened raw object.
+        picks (str | list): channels to read, None reads all channels.
+        reader_parameters (dict): 'window_duration' (s), 'overlap' (s), 'max_bytes' and 'dtype'.
+
+    Example:
+        with WindowedReader(fname, picks='eeg') as reader:
+            for start, window in reader:
+                ...
+    """
+
+    def __init__(self, filename, picks=None, reader_parameters=DEFAULT_READER_PARAMETERS):
+        self.raw_data = open_raw(filename) if isinstance(filename, str) else filename
+        self.sfreq = self.raw_data.info['sfreq']
+        self.picks = self.raw_data.copy().pick(picks).ch_names if picks is not None else list(self.raw_data.ch_names)
+        self.dtype = np.dtype(reader_parameters['dtype'])
+        self.window_size = int(round(reader_parameters['window_duration'] * self.sfreq))
+        self.step = self.window_size - int(round(reader_parameters['overlap'] * self.sfreq))
+        if self.window_size < 1 or self.step < 1:
+            logger.error(f"Window duration should be positive and longer than the overlap: {reader_parameters}")
+            raise ValueError(f"Window duration should be positive and longer than the overlap: {reader_parameters}")
+
+        self.max_bytes = reader_parameters['max_bytes']
+        self.window_bytes = len(self.picks) * self.window_size * self.dtype.itemsize
+        if self.max_bytes is not None and self.window_bytes > self.max_bytes:
+            logger.error(f"A window of {self.window_bytes} bytes exceeds the memory cap of {self.max_bytes} bytes")
+            raise MemoryError(f"A window of {self.window_bytes} bytes exceeds the memory cap of {self.max_bytes} bytes, "
+                              f"use fewer channels or a shorter window")
+        self._source_sample_bytes = ORIG_FORMAT_BYTES.get(getattr(self.raw_data, 'orig_format', None), self.dtype.itemsize)
+        self.stats = {'windows_read': 0, 'samples_read': 0, 'bytes_read': 0, 'source_bytes_read': 0}
+
+    @property
+    def n_times(self) -> int:
+        return int(self.raw_data.n_times)
+
+    @property
+    def n_windows(self) -> int:
+        """Number of windows, the last one may be shorter than window_size."""
+        if self.n_times <= self.window_size:
+            return 1
+        return int(np.ceil((self.n_times - self.window_size) / self.step)) + 1
+
+    def read_window(self, start, stop) -> np.ndarray:
+        """
+        Reads samples start:stop of the picked channels.
+
+        Args:
+            start (int): first sample
+            stop (int): sample after the last one
+
+        Returns:
+            data (np.ndarray) shape(channels, samples)
+        """
+        stop = min(stop, self.n_times)
+        if (stop - start) * len(self.picks) * self.dtype.itemsize > (self.max_bytes or np.inf):
+            logger.error(f"Reading samples {start}:{stop} exceeds the memory cap of {self.max_bytes} bytes")
+            raise MemoryError(f"Reading samples {start}:{stop} exceeds the memory cap of {self.max_bytes} bytes")
+        data = self.raw_data.get_data(picks=self.picks, start=start, stop=stop).astype(self.dtype, copy=False)
+        self.stats['windows_read'] += 1
+        self.stats['samples_read'] += data.shape[-1]
+        self.stats['bytes_read'] += data.nbytes
+        self.stats['source_bytes_read'] += data.size * self._source_sample_bytes
+        return data
+
+    def __iter__(self):
+        """Yields (start sample, data of shape (channels, samples)) for every window."""
+        for windowi in range(self.n_windows):
+            start = windowi * self.step
+            yield start, self.read_window(start, start + self.window_size)
+
+    def __len__(self):
+        return self.n_windows
+
+    def close(self):
+        self.raw_data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,4 +1,12 @@
+import os
+import json
+import numpy as np
+
 from pyeeg.io.getdir import set_exportdir
+from pyeeg.utils.constants import EPOCH_STORE_VERSION
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 def write_metadata(metadata, fname):
     """
@@ -11,4 +19,175 @@ def write_metadata(metadata, fname):
     Returns:
         Nothing
     """
-    metadata.to_csv(set_exportdir(fname +'.csv'))    
\ No newline at end of file
+    metadata.to_csv(set_exportdir(fname +'.csv'))
+
+# An epoch store is a folder holding
+#   store.json: dtype and shape of a single record (e.g. (channels, times) or (channels, freqs)),
+#               committed record count, subject and event names and next epoch number of every subject
+#   data.bin:   records appended back to back, readable as a (records, *record_shape) memmap
+#   index.bin:  EPOCH_INDEX_DTYPE rows appended back to back, one per record, subject and event
+#               are positions in the names of store.json, offset is the record number in data.bin
+# store.json is replaced last, so records and index rows of an interrupted append are dropped 
+# by the next append and never read.
+EPOCH_INDEX_DTYPE = np.dtype([('subject', '<i4'), ('event', '<i4'), ('epoch', '<i8'), ('offset', '<i8')])
+
+def _read_store_header(store_dir) -> dict | None:
+    fname = os.path.join(store_dir, 'store.json')
+    if not os.path.isfile(fname):
+        return None
+    with open(fname, 'r', encoding='utf8') as f:
+        header = json.load(f)
+    if header['version'] != EPOCH_STORE_VERSION:
+        logger.error(f"Epoch store {store_dir} has version {header['version']}, expected {EPOCH_STORE_VERSION}")
+        raise ValueError(f"Epoch store {store_dir} has version {header['version']}, expected {EPOCH_STORE_VERSION}")
+    return header
+
+def _write_store_header(store_dir, header):
+    fname = os.path.join(store_dir, 'store.json')
+    with open(fname + '.tmp', 'w', encoding='utf8') as f:
+        json.dump(header, f)
+    os.replace(fname + '.tmp', fname)
+
+def append_epochs(store_dir, data, subject, events, epoch_numbers=None) -> int:
+    """
+    Appends a batch of epoch arrays (epochs, psd or tfr) to an epoch store, creating it if needed.
+
+    Args:
+        store_dir (str): folder of the epoch store
+        data (np.ndarray) shape(epochs, ...): one record per epoch, all batches share the record shape
+        subject (str): subject the batch belongs to
+        events (array-like) shape(epochs,): event name or id of each epoch
+        epoch_numbers (array-like) shape(epochs,): epoch number of each record,
+            defaults to continuing the numbering of the subject
+
+    Returns:
+        offset (int): record number of the first appended epoch
+    """
+    data = np.asarray(data)
+    if len(events) != len(data) or (epoch_numbers is not None and len(epoch_numbers) != len(data)):
+        logger.error(f"Events and epoch numbers should have one value per epoch: {len(data)} epochs")
+        raise ValueError(f"Events and epoch numbers should have one value per epoch: {len(data)} epochs")
+
+    header = _read_store_header(store_dir)
+    if header is None:
+        os.makedirs(store_dir, exist_ok=True)
+        header = {'version': EPOCH_STORE_VERSION, 
+                  'dtype': data.dtype.str, 
+                  'record_shape': list(data.shape[1:]),
+                  'records': 0,
+                  'subjects': [],
+                  'events': [],
+                  'next_epoch': {}}
+    elif list(data.shape[1:]) != header['record_shape']:
+        logger.error(f"Records of shape {data.shape[1:]} do not fit the store shape {header['record_shape']}")
+        raise ValueError(f"Records of shape {data.shape[1:]} do not fit the store shape {header['record_shape']}")
+
+    subject = str(subject)
+    offset = header['records']
+    if epoch_numbers is None:
+        first_epoch = header['next_epoch'].get(subject, 0)
+        epoch_numbers = range(first_epoch, first_epoch + len(data))
+    epoch_numbers = [int(epoch) for epoch in epoch_numbers]
+
+    dtype = np.dtype(header['dtype'])
+    with open(os.path.join(store_dir, 'data.bin'), 'ab') as f:
+        f.truncate(offset * dtype.itemsize * int(np.prod(header['record_shape'])))
+        f.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+    index = np.empty(len(data), dtype=EPOCH_INDEX_DTYPE)
+    index['subject'] = _name_code(header['subjects'], subject)
+    index['event'] = [_name_code(header['events'], str(event)) for event in events]
+    index['epoch'] = epoch_numbers
+    index['offset'] = np.arange(offset, offset + len(data))
+    with open(os.path.join(store_dir, 'index.bin'), 'ab') as f:
+        f.truncate(offset * EPOCH_INDEX_DTYPE.itemsize)
+        f.write(index.tobytes())
+
+    header['records'] = offset + len(data)
+    if epoch_numbers:
+        header['next_epoch'][subject] = max(header['next_epoch'].get(subject, 0), max(epoch_numbers) + 1)
+    _write_store_header(store_dir, header)
+    return offset
+
+def _name_code(names, name) -> int:
+    """Position of name in names, appended if it is new."""
+    if name not in names:
+        names.append(name)
+    return names.index(name)
+
+def append_mne_epochs(store_dir, epochs, subject) -> int:
+    """
+    Appends the data of an mne Epochs object to an epoch store, events are stored by name.
+
+    Args:
+        store_dir (str): folder of the epoch store
+        epochs (mne.Epochs): epochs object
+        subject (str): subject the epochs belong to
+
+    Returns:
+        offset (int): record number of the first appended epoch
+    """
+    event_names = {event_id: event_name for event_name, event_id in epochs.event_id.items()}
+    events = [event_names.get(event_id, event_id) for event_id in epochs.events[:, -1]]
+    return append_epochs(store_dir, epochs.get_data(), subject, events, epoch_numbers=epochs.selection)
+
+def _read_index(store_dir, header) -> np.ndarray:
+    """Committed rows of index.bin as a read only memmap, rows of an interrupted append are left out."""
+    if header['records'] == 0:
+        return np.empty(0, dtype=EPOCH_INDEX_DTYPE)
+    return np.memmap(os.path.join(store_dir, 'index.bin'), dtype=EPOCH_INDEX_DTYPE, mode='r', shape=(header['records'],))
+
+def _index_rows(index, header) -> list:
+    return [{'subject': header['subjects'][subject], 'event': header['events'][event], 'epoch': int(epoch), 'offset': int(offset)}
+            for subject, event, epoch, offset in index.tolist()]
+
+def read_epoch_index(store_dir) -> list:
+    """
+    Reads the index of an epoch store.
+
+    Args:
+        store_dir (str): folder of the epoch store
+
+    Returns:
+        index (list): dicts with 'subject', 'event', 'epoch' and 'offset' of every record
+    """
+    header = _read_store_header(store_dir)
+    if header is None:
+        return []
+    return _index_rows(_read_index(store_dir, header), header)
+
+def read_epochs(store_dir, subjects=None, events=None, epoch_numbers=None) -> tuple[np.ndarray, list]:
+    """
+    Reads a subset of an epoch store, only the selected records are read from the memory map.
+
+    Records are selected with vectorized masks over the index, names are compared once
+    against the names of the store rather than row by row.
+
+    Args:
+        store_dir (str): folder of the epoch store
+        subjects (list): subjects to keep, None keeps all
+        events (list): events to keep, None keeps all
+        epoch_numbers (list): epoch numbers to keep, None keeps all
+
+    Returns:
+        data (np.ndarray) shape(selected records, *record_shape)
+        index (list): index rows of the selected records
+    """
+    header = _read_store_header(store_dir)
+    if header is None:
+        logger.error(f"There is no epoch store in {store_dir}")
+        raise FileNotFoundError(f"There is no epoch store in {store_dir}")
+
+    index = _read_index(store_dir, header)
+    mask = np.ones(len(index), dtype=bool)
+    for field, values, names in (('subject', subjects, header['subjects']), ('event', events, header['events'])):
+        if values is not None:
+            values = {str(value) for value in values}
+            mask &= np.isin(index[field], [code for code, name in enumerate(names) if name in values])
+    if epoch_numbers is not None:
+        mask &= np.isin(index['epoch'], np.asarray(list(epoch_numbers), dtype=np.int64))
+    selected = index[mask]
+    if not len(index):
+        return np.empty([0] + header['record_shape'], dtype=header['dtype']), []
+    data = np.memmap(os.path.join(store_dir, 'data.bin'), dtype=header['dtype'], mode='r',
+                     shape=tuple([header['records']] + header['record_shape']))
+    return np.array(data[selected['offset']]), _index_rows(selected, header)
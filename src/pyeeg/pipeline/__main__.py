@@ -0,0 +1,17 @@
+import argparse
+
+from pyeeg.pipeline.engine import run_pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pyeeg.pipeline', description="Runs a pipeline spec on a cohort of recordings.")
+    parser.add_argument('spec', help="path of a .json or .yaml pipeline spec")
+    parser.add_argument('paths', nargs='*', help="recordings to process, defaults to the spec 'inputs'")
+    parser.add_argument('-j', '--n-jobs', type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+    results = run_pipeline(args.spec, paths=args.paths or None, n_jobs=args.n_jobs)
+    return int(any(result['error'] for result in results))
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
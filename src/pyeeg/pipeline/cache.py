@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+import functools
+
+import numpy as np
+
+import mne
+
+from pyeeg.utils.constants import STAGE_CACHE_DIR, STAGE_CACHE_VERSION, DEFAULT_STAGE_CACHE_BYTES
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# file suffix of every cached output type, the key of the entry comes before it
+CACHE_SUFFIXES = {'raw': '_raw.fif', 'epochs': '-epo.fif', 'arrays': '.npz'}
+
+@functools.lru_cache(maxsize=None)
+def library_version() -> str:
+    """Versions that change stage outputs: package, mne and the layout of the stage cache."""
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        package_version = version('mne-helper')
+    except PackageNotFoundError:
+        package_version = 'unknown'
+    return f"{package_version}|{mne.__version__}|{STAGE_CACHE_VERSION}"
+
+def stage_key(stage_type, params, input_keys) -> str:
+    """
+    Key of a stage output, changes whenever the stage, its parameters, its inputs or the library change.
+
+    Input keys chain the keys of all upstream stages, so changing a parameter changes the
+    key of that stage and of the stages after it only.
+
+    Args:
+        stage_type (str): type of the stage, see STAGE_FUNCTIONS
+        params (dict): parameters of the stage, json serializable
+        input_keys (list): keys of the inputs, source_key of the recording for the first stage
+
+    Returns:
+        key (str): hex digest
+    """
+    description = json.dumps({'type': stage_type, 'params': params, 'inputs': list(input_keys), 'version': library_version()},
+                             sort_keys=True, default=repr)
+    return hashlib.sha1(description.encode('utf8')).hexdigest()
+
+
+class StageCache:
+    """
+    On-disk store of stage outputs keyed by stage_key, evicting least recently used entries above a size cap.
+
+    Raw data is stored as _raw.fif, epochs as -epo.fif and dicts of arrays (psd, tfr) as .npz.
+    Entries are written to a temporary file and renamed, so processes can share a cache folder.
+    Reading an entry refreshes its modification time, which orders the eviction.
+
+    Args:
+        cache_dir (str): folder of the entries, defaults to data/interim/STAGE_CACHE_DIR
+        max_bytes (int): size cap of the folder, None disables eviction
+
+    Attributes:
+        stats (dict): 'hits', 'misses', 'writes' and 'evictions' of this object
+
+    Example:
+        cache = StageCache()
+        key = stage_key('filter', {'l_freq': 0.1, 'h_freq': 40}, [source_key(fname)])
+        raw_data = cache.get(key)
+        if raw_data is None:
+            raw_data = read_raw_data(fname).filter(0.1, 40)
+            cache.put(key, raw_data)
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_STAGE_CACHE_BYTES):
+        from pyeeg.io.getdir import set_interimdir
+
+        self.cache_dir = cache_dir or set_interimdir(STAGE_CACHE_DIR)
+        if self.cache_dir is None:
+            logger.error("No data folder found to keep the stage cache, please enter a cache_dir")
+            raise ValueError("No data folder found to keep the stage cache, please enter a cache_dir")
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key) -> str | None:
+        for suffix in CACHE_SUFFIXES.values():
+            path = os.path.join(self.cache_dir, key + suffix)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def __contains__(self, key) -> bool:
+        return self._path(key) is not None
+
+    def get(self, key):
+        """Cached output of key, None on a miss."""
+        path = self._path(key)
+        try:
+            if path is None:
+                raise FileNotFoundError(key)
+            value = _read_entry(path)
+            os.utime(path)
+        except FileNotFoundError:
+            # a miss, or an entry evicted by another process in the meantime
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        logger.debug(f"Stage cache hit {key}")
+        return value
+
+    def put(self, key, value) -> bool:
+        """Stores value under key and evicts old entries, returns False for types that are not cached."""
+        if isinstance(value, mne.io.BaseRaw):
+            suffix = CACHE_SUFFIXES['raw']
+        elif isinstance(value, mne.BaseEpochs):
+            suffix = CACHE_SUFFIXES['epochs']
+        elif isinstance(value, dict):
+            suffix = CACHE_SUFFIXES['arrays']
+        else:
+            logger.debug(f"Stage outputs of type {type(value)} are not cached")
+            return False
+
+        # mne and numpy check the file endings, the process id keeps temporary files apart
+        tmp_path = os.path.join(self.cache_dir, f"{key}.{os.getpid()}.tmp{suffix}")
+        if suffix == CACHE_SUFFIXES['arrays']:
+            np.savez(tmp_path, **{name: np.asarray(val) for name, val in value.items() if val is not None})
+        else:
+            value.save(tmp_path, overwrite=True, verbose='error')
+        os.replace(tmp_path, os.path.join(self.cache_dir, key + suffix))
+        self.stats['writes'] += 1
+        self.evict(keep=key)
+        return True
+
+    def size(self) -> int:
+        """Bytes used by the cache folder."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file())
+
+    def evict(self, keep=None) -> int:
+        """
+        Removes least recently used entries until the folder fits max_bytes.
+
+        Args:
+            keep (str): key that is never evicted, e.g. the entry that was just written
+
+        Returns:
+            n_evicted (int): number of removed entries
+        """
+        if self.max_bytes is None:
+            return 0
+        entries = {}
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and '.tmp' not in entry.name:
+                stat = entry.stat()
+                key_entry = entries.setdefault(entry.name[:40], {'size': 0, 'used': 0, 'paths': []})
+                key_entry['size'] += stat.st_size
+                key_entry['used'] = max(key_entry['used'], stat.st_mtime_ns)
+                key_entry['paths'].append(entry.path)
+        total_size = sum(key_entry['size'] for key_entry in entries.values())
+
+        n_evicted = 0
+        for key, key_entry in sorted(entries.items(), key=lambda item: item[1]['used']):
+            if total_size <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in key_entry['paths']:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total_size -= key_entry['size']
+            n_evicted += 1
+        if total_size > self.max_bytes:
+            logger.warning(f"Stage cache holds {total_size} bytes, more than its cap of {self.max_bytes} bytes")
+        self.stats['evictions'] += n_evicted
+        return n_evicted
+
+    def clear(self):
+        """Removes all entries."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                os.remove(entry.path)
+
+def _read_entry(path):
+    if path.endswith(CACHE_SUFFIXES['raw']):
+        return mne.io.read_raw_fif(path, preload=True, verbose='error')
+    if path.endswith(CACHE_SUFFIXES['epochs']):
+        return mne.read_epochs(path, preload=True, verbose='error')
+    with np.load(path) as arrays:
+        # string arrays were lists (e.g. ch_names) before saving
+        return {name: arrays[name].tolist() if arrays[name].dtype.kind == 'U' else arrays[name] for name in arrays.files}
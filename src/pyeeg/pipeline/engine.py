@@ -0,0 +1,259 @@
+import os
+import glob
+import json
+import time
+import graphlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pyeeg.pipeline.stages import STAGE_FUNCTIONS, UNCACHED_STAGE_TYPES
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# A pipeline spec (JSON, or YAML if PyYAML is installed) looks like
+#   {"name": "oddball_psd",
+#    "inputs": ["data/raw/*.vhdr"],
+#    "n_jobs": 4,
+#    "stages": [{"name": "load", "type": "load"},
+#               {"name": "montage", "type": "montage"},
+#               {"name": "filter", "type": "filter", "params": {"l_freq": 0.1, "h_freq": 40}},
+#               {"name": "epochs", "type": "segment", "params": {"events": ["Stimulus/*"], "tmin": -0.2, "tmax": 0.8}},
+#               {"name": "psd", "type": "psd", "params": {"fmax": 40}},
+#               {"name": "export", "type": "export", "inputs": ["psd", "epochs"]}]}
+# A stage takes the outputs of the stages named in its 'inputs', by default the output of the
+# stage listed before it. Stages run in dependency order, every subject in its own process.
+
+def load_pipeline_spec(spec) -> dict:
+    """
+    Reads and validates a pipeline spec.
+
+    Args:
+        spec (str | dict): path of a .json, .yaml or .yml file, or the spec itself
+
+    Returns:
+        spec (dict): validated spec, 'inputs' of every stage filled in
+    """
+    if isinstance(spec, str):
+        with open(spec, 'r', encoding='utf8') as f:
+            if os.path.splitext(spec)[-1].lower() in ('.yaml', '.yml'):
+                try:
+                    import yaml
+                except ImportError:
+                    logger.error("Reading YAML pipeline specs needs PyYAML, please install it or use JSON")
+                    raise
+                spec = yaml.safe_load(f)
+            else:
+                spec = json.load(f)
+    return validate_spec(spec)
+
+def validate_spec(spec) -> dict:
+    """
+    Checks stage names, types and inputs of a spec and fills in the default inputs.
+
+    Args:
+        spec (dict): pipeline spec
+
+    Returns:
+        spec (dict): copy of the spec, every stage has 'inputs' and 'params'
+    """
+    stages = spec.get('stages') or []
+    if not stages:
+        logger.error("Pipeline spec has no stages")
+        raise ValueError("Pipeline spec has no stages")
+    stage_names = [stage.get('name', stage.get('type')) for stage in stages]
+    if len(set(stage_names)) != len(stage_names):
+        logger.error(f"Stage names should be unique: {stage_names}")
+        raise ValueError(f"Stage names should be unique: {stage_names}")
+
+    validated = []
+    for indx, stage in enumerate(stages):
+        if stage.get('type') not in STAGE_FUNCTIONS:
+            logger.error(f"Unknown stage type {stage.get('type')}, available types: {list(STAGE_FUNCTIONS)}")
+            raise ValueError(f"Unknown stage type {stage.get('type')}, available types: {list(STAGE_FUNCTIONS)}")
+        inputs = stage.get('inputs', stage_names[indx - 1:indx])
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        unknown = set(inputs) - set(stage_names)
+        if unknown:
+            logger.error(f"Stage {stage_names[indx]} takes inputs of unknown stages {sorted(unknown)}")
+            raise ValueError(f"Stage {stage_names[indx]} takes inputs of unknown stages {sorted(unknown)}")
+        validated.append({**stage, 'name': stage_names[indx], 'inputs': inputs, 'params': dict(stage.get('params') or {})})
+    spec = {**spec, 'stages': validated}
+    stage_order(spec)
+    return spec
+
+def stage_order(spec) -> list:
+    """Stage names in an order that runs every stage after its inputs, raises ValueError on cycles."""
+    sorter = graphlib.TopologicalSorter({stage['name']: stage['inputs'] for stage in spec['stages']})
+    try:
+        return list(sorter.static_order())
+    except graphlib.CycleError as err:
+        logger.error(f"Pipeline stages depend on each other in a cycle: {err.args[1]}")
+        raise ValueError(f"Pipeline stages depend on each other in a cycle: {err.args[1]}")
+
+def find_inputs(patterns) -> list:
+    """Sorted paths matching the glob patterns of a spec, duplicates removed."""
+    patterns = [patterns] if isinstance(patterns, str) else patterns
+    return sorted({os.path.abspath(path) for pattern in patterns for path in glob.glob(pattern, recursive=True)})
+
+def run_stage(stage, inputs, subject):
+    """Runs a single stage on the outputs of its inputs, see STAGE_FUNCTIONS."""
+    return STAGE_FUNCTIONS[stage['type']](inputs, stage['params'], {**subject, 'stage': stage['name'], 'input_names': stage['inputs']})
+
+def run_subject(spec, path, cache=None) -> dict:
+    """
+    Runs all stages of a spec on one recording, errors are returned instead of raised.
+
+    Stages are resolved backwards from the stages no other stage uses: an output found in
+    the stage cache is read instead of computed, and its inputs are not resolved at all, so
+    changing a late parameter only recomputes the stages from there on. Outputs are released
+    once every stage using them is resolved. Stages get a copy of an output that later stages
+    still need, so in-place operations (e.g. filter) do not leak.
+
+    Args:
+        spec (dict): validated pipeline spec
+        path (str): path of the recording
+        cache (StageCache): store of stage outputs, None computes every stage
+
+    Returns:
+        result (dict): 'subject', 'path', 'timings' (stage -> seconds), 'exports' (stage -> paths),
+            'cached' (stages read from the cache), 'cache_stats' (hits and misses of the recording),
+            'fingerprints' (montage fingerprint cache file -> layouts searched for the recording),
+            'error' (None on success) and 'failed_stage'
+    """
+    from pyeeg.io.loader import source_key
+    from pyeeg.pipeline.cache import stage_key
+
+    spec = validate_spec(spec)
+    stages = {stage['name']: stage for stage in spec['stages']}
+    # stages add the montage layouts they searched to 'fingerprints', see montage_stage
+    subject = {'name': os.path.splitext(os.path.basename(path))[0], 'path': path, 'fingerprints': {}}
+    remaining_uses = {name: sum(name in stage['inputs'] for stage in spec['stages']) for name in stages}
+    result = {'subject': subject['name'], 'path': path, 'timings': {}, 'exports': {}, 'cached': [],
+              'cache_stats': {}, 'fingerprints': subject['fingerprints'], 'error': None, 'failed_stage': None}
+    start_stats = dict(cache.stats) if cache is not None else {}
+
+    keys = {}
+    if cache is not None:
+        for stage_name in stage_order(spec):
+            stage = stages[stage_name]
+            input_keys = [keys[input_name] for input_name in stage['inputs']] or [source_key(path)]
+            keys[stage_name] = stage_key(stage['type'], stage['params'], input_keys)
+
+    outputs = {}
+    def resolve(stage_name):
+        if stage_name in outputs:
+            return outputs[stage_name]
+        stage = stages[stage_name]
+        cacheable = cache is not None and stage['type'] not in UNCACHED_STAGE_TYPES
+        start_time = time.perf_counter()
+        output = cache.get(keys[stage_name]) if cacheable else None
+        if output is not None:
+            result['cached'].append(stage_name)
+        else:
+            for input_name in stage['inputs']:
+                resolve(input_name)
+            # inputs that later stages still need are copied
+            inputs = [outputs[input_name].copy() if remaining_uses[input_name] > 1 and hasattr(outputs[input_name], 'copy')
+                      else outputs[input_name] for input_name in stage['inputs']]
+            start_time = time.perf_counter()
+            try:
+                output = run_stage(stage, inputs, subject)
+            except Exception:
+                result['failed_stage'] = result['failed_stage'] or stage_name
+                raise
+            if cacheable:
+                try:
+                    cache.put(keys[stage_name], output)
+                except OSError as err:
+                    logger.warning(f"Output of stage {stage_name} was not cached: {err}")
+        result['timings'][stage_name] = time.perf_counter() - start_time
+        if stage['type'] == 'export':
+            result['exports'][stage_name] = output
+        outputs[stage_name] = output
+        for input_name in stage['inputs']:
+            remaining_uses[input_name] -= 1
+            if remaining_uses[input_name] == 0:
+                outputs.pop(input_name, None)
+        return output
+
+    try:
+        for stage_name in [stage_name for stage_name in stage_order(spec) if remaining_uses[stage_name] == 0]:
+            resolve(stage_name)
+            outputs.pop(stage_name, None)
+    except Exception as err:
+        logger.error(f"Stage {result['failed_stage']} failed for {path}: {err}")
+        result['error'] = f"{type(err).__name__}: {err}"
+    if cache is not None:
+        result['cache_stats'] = {name: count - start_stats[name] for name, count in cache.stats.items()}
+    return result
+
+def run_pipeline(spec, paths=None, n_jobs=None, cache=None) -> list:
+    """
+    Runs a pipeline spec on every recording of a cohort, unattended.
+
+    Args:
+        spec (str | dict): pipeline spec or path of a spec file, see load_pipeline_spec
+        paths (list): recordings to process, defaults to the files matching the spec 'inputs'
+        n_jobs (int): number of worker processes, 1 runs in the current process,
+            None uses the spec 'n_jobs' or all cores
+        cache (StageCache | dict | bool): stage cache, or keywords of StageCache, True uses
+            the default cache, None uses the spec 'cache', False computes every stage
+
+    Returns:
+        results (list): result of every recording (see run_subject), in the order of paths
+    """
+    from pyeeg.pipeline.cache import StageCache
+
+    spec = load_pipeline_spec(spec)
+    paths = list(paths) if paths is not None else find_inputs(spec.get('inputs', []))
+    n_jobs = n_jobs or spec.get('n_jobs')
+    cache = spec.get('cache', False) if cache is None else cache
+    if cache is True or isinstance(cache, dict):
+        cache = StageCache(**(cache if isinstance(cache, dict) else {}))
+    cache = cache or None
+    logger.info(f"Running pipeline {spec.get('name', '')} on {len(paths)} recordings")
+
+    start_time = time.perf_counter()
+    if n_jobs == 1:
+        results = []
+        for path in paths:
+            results.append(run_subject(spec, path, cache))
+            save_fingerprints(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(run_subject, spec, path, cache): path for path in paths}
+            results_by_path = {}
+            for future in as_completed(futures):
+                results_by_path[futures[future]] = future.result()
+                save_fingerprints(results_by_path[futures[future]])
+        results = [results_by_path[path] for path in paths]
+
+    summary = summarize_timings(results)
+    failed = [result['path'] for result in results if result['error']]
+    logger.info(f"Pipeline finished in {time.perf_counter() - start_time:.1f} s, {len(paths) - len(failed)}/{len(paths)} "
+                f"recordings succeeded, seconds per stage: {summary}")
+    if cache is not None:
+        hits = sum(result['cache_stats'].get('hits', 0) for result in results)
+        misses = sum(result['cache_stats'].get('misses', 0) for result in results)
+        logger.info(f"Stage cache: {hits} hits, {misses} misses, {cache.size()} bytes in {cache.cache_dir}")
+    if failed:
+        logger.warning(f"Pipeline failed for {len(failed)} recordings: {failed}")
+    return results
+
+def save_fingerprints(result):
+    """Writes the montage layouts searched for a recording to their fingerprint caches, only the parent process writes."""
+    from pyeeg.preprocess.montage_fingerprint import update_fingerprint_cache
+
+    for cache_file, new_layouts in result['fingerprints'].items():
+        try:
+            update_fingerprint_cache(new_layouts, cache_file)
+        except OSError as err:
+            logger.warning(f"Montage fingerprints of {result['path']} were not saved to {cache_file}: {err}")
+
+def summarize_timings(results) -> dict:
+    """Total seconds spent in every stage over all results."""
+    summary = {}
+    for result in results:
+        for stage_name, seconds in result['timings'].items():
+            summary[stage_name] = round(summary.get(stage_name, 0.0) + seconds, 3)
+    return summary
@@ -0,0 +1,244 @@
+import os
+import fnmatch
+import numpy as np
+
+import mne
+
+from pyeeg.io.loader import read_raw_data, open_raw
+from pyeeg.utils.constants import DEFAULT_WAVELET_PARAMETERS
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# stage type -> function(inputs, params, subject) returning the output of the stage
+# inputs holds the outputs of the stages listed in the stage 'inputs', in that order, subject
+# holds 'name' and 'path' of the subject plus 'stage' and 'input_names' of the running stage
+STAGE_FUNCTIONS = {}
+# stage types whose outputs are never put in the stage cache: reading a recording is
+# cheaper than a copy of it, and exports are side effects
+UNCACHED_STAGE_TYPES = set()
+
+def register_stage(stage_type, cache=True):
+    """Decorator adding a stage function to STAGE_FUNCTIONS under stage_type, cache=False keeps its outputs out of the stage cache."""
+    def register(stage_function):
+        STAGE_FUNCTIONS[stage_type] = stage_function
+        if not cache:
+            UNCACHED_STAGE_TYPES.add(stage_type)
+        return stage_function
+    return register
+
+def _single_input(inputs, stage_type):
+    if len(inputs) != 1:
+        logger.error(f"A {stage_type} stage takes a single input, instead: {len(inputs)}")
+        raise ValueError(f"A {stage_type} stage takes a single input, instead: {len(inputs)}")
+    return inputs[0]
+
+@register_stage('load', cache=False)
+def load_stage(inputs, params, subject):
+    """
+    Reads the recording of the subject.
+
+    Params:
+        preload (bool | str): False opens the file lazily, True or 'memmap' see read_raw_data.
+    """
+    preload = params.get('preload', False)
+    return read_raw_data(subject['path'], preload=preload) if preload else open_raw(subject['path'])
+
+@register_stage('montage')
+def montage_stage(inputs, params, subject):
+    """
+    Renames channels and sets the standard montage with the best position score, without asking.
+
+    Params:
+        position_method (str): channel matching method, see position_pipeline.
+        max_distance (float): largest electrode distance accepted as a match, see position_pipeline.
+        cache_file (str): montage fingerprint cache, defaults to data/interim/FINGERPRINT_CACHE_FILE.
+            Layouts searched by the stage are returned with the subject result and saved by run_pipeline.
+    """
+    from pyeeg.io.getdir import set_interimdir
+    from pyeeg.preprocess.find_montage import adjust_chan_kind, get_chanlocs
+    from pyeeg.preprocess.montage_fingerprint import detect_montage, load_fingerprint_cache
+    from pyeeg.utils.constants import FINGERPRINT_CACHE_FILE, DEFAULT_MATCH_DISTANCE
+
+    raw_data = _single_input(inputs, 'montage')
+    adjust_chan_kind(raw_data.info)
+    data_chan_info = get_chanlocs(raw_data.info)
+    if not data_chan_info:
+        logger.warning(f"{subject['name']} has no EEG channel positions, montage is not set")
+        return raw_data
+    # workers of a process pool only read the cache, new layouts go back to the parent which writes them
+    cache_file = params.get('cache_file') or set_interimdir(FINGERPRINT_CACHE_FILE)
+    fingerprint_cache = load_fingerprint_cache(cache_file)
+    known_layouts = set(fingerprint_cache)
+    _, result = detect_montage(data_chan_info, fingerprint_cache,
+                               position_method=params.get('position_method', 'position'),
+                               max_distance=params.get('max_distance', DEFAULT_MATCH_DISTANCE))
+    new_layouts = {key: val for key, val in fingerprint_cache.items() if key not in known_layouts}
+    if cache_file and new_layouts and 'fingerprints' in subject:
+        subject['fingerprints'].setdefault(cache_file, {}).update(new_layouts)
+    if result['montage'] is None:
+        logger.warning(f"No standard montage fits the channel positions of {subject['name']}, montage is not set")
+        return raw_data
+
+    new_names = [ch_name for ch_name in result['chan_names'].values() if ch_name]
+    rename = {ch_name: new_name for ch_name, new_name in result['chan_names'].items()
+              if new_name and new_name != ch_name and new_names.count(new_name) == 1 and new_name not in raw_data.ch_names}
+    raw_data.rename_channels(rename)
+    raw_data.set_montage(result['montage'], on_missing='ignore')
+    logger.info(f"{subject['name']}: {result['montage']} montage, {result['scoreboard'][0][2]} channels matched")
+    return raw_data
+
+@register_stage('filter')
+def filter_stage(inputs, params, subject):
+    """
+    Band-pass filters continuous data block by block with filter_raw_chunked, or in memory with mne.
+
+    The block by block filter equals mne's default zero-phase FIR filter without loading the
+    whole recording, other filters (e.g. method 'iir') need the data in memory.
+
+    Params:
+        method (str): 'chunked' (default) filters block by block, any other value is passed to mne.io.Raw.filter.
+        l_freq (float), h_freq (float) and any other keyword of filter_raw_chunked, or of mne.io.Raw.filter.
+    """
+    raw_data = _single_input(inputs, 'filter')
+    params = {'l_freq': None, 'h_freq': None, 'method': 'chunked', **params}
+    if params['method'] == 'chunked':
+        from pyeeg.preprocess.filtering import filter_raw_chunked
+
+        return filter_raw_chunked(raw_data, **{key: val for key, val in params.items() if key not in ('method', 'verbose')})
+    raw_data.load_data()
+    return raw_data.filter(**params)
+
+@register_stage('resample')
+def resample_stage(inputs, params, subject):
+    """
+    Resamples continuous data block by block with polyphase filtering, before segmentation and spectra.
+
+    Params:
+        sfreq (float): target sampling rate.
+        picks, block_size and window, see resample_raw_chunked.
+    """
+    from pyeeg.preprocess.resampling import resample_raw_chunked
+
+    raw_data = _single_input(inputs, 'resample')
+    if params.get('sfreq') is None:
+        logger.error(f"A resample stage needs the target sfreq, instead: {params}")
+        raise ValueError(f"A resample stage needs the target sfreq, instead: {params}")
+    return resample_raw_chunked(raw_data, **params)
+
+@register_stage('segment')
+def segment_stage(inputs, params, subject):
+    """
+    Segments continuous data around events selected by name or pattern, or into fixed-length epochs.
+
+    Params:
+        events (list): event names or fnmatch patterns (e.g. 'Stimulus/*'), None segments continuously.
+        tmin (float), tmax (float), baseline (list): epoch window and baseline around events.
+        epoch_duration (float), overlap (float): epoch length and overlap without events.
+        reject (dict): peak-to-peak rejection values per channel type.
+    """
+    from pyeeg.preprocess.segmentation import get_event_index, segment_data_continuous
+    from pyeeg.utils.constants import DEFAULT_SEGMENTATION_WINDOW, DEFAULT_REJECT_VALUES
+
+    raw_data = _single_input(inputs, 'segment')
+    reject = params.get('reject', DEFAULT_REJECT_VALUES)
+    if params.get('events') is None:
+        return segment_data_continuous(raw_data,
+                                       epoch_duration=params.get('epoch_duration', 1.0),
+                                       overlap=params.get('overlap', 0.0),
+                                       reject=reject)
+
+    event_index = get_event_index(raw_data)
+    selected_events = {event_name: event_val for event_name, event_val in event_index.event_id.items()
+                       if any(fnmatch.fnmatchcase(event_name, pattern) for pattern in params['events'])}
+    if not selected_events:
+        logger.error(f"No event of {subject['name']} matches {params['events']}, events: {list(event_index.event_id)}")
+        raise ValueError(f"No event of {subject['name']} matches {params['events']}")
+    if reject:
+        # mne.Epochs raises for channel types the recording lacks, find_bad_windows skips them
+        ch_types = set(raw_data.get_channel_types())
+        reject = {ch_type: value for ch_type, value in reject.items() if ch_type in ch_types} or None
+    baseline = params.get('baseline')
+    return mne.Epochs(raw_data,
+                      event_index.events,
+                      event_id=selected_events,
+                      tmin=params.get('tmin', DEFAULT_SEGMENTATION_WINDOW[0]),
+                      tmax=params.get('tmax', DEFAULT_SEGMENTATION_WINDOW[1]),
+                      baseline=tuple(baseline) if baseline is not None else None,
+                      reject=reject,
+                      preload=True)
+
+@register_stage('psd')
+def psd_stage(inputs, params, subject):
+    """
+    Power spectral density of epochs (mne compute_psd) or of continuous data (welch_psd_raw).
+
+    Params:
+        keywords of mne.Epochs.compute_psd for epochs, of welch_psd_raw for continuous data.
+
+    Returns:
+        psd (dict): 'data' shape(epochs, channels, freqs) or (channels, freqs), 'freqs' and 'ch_names'
+    """
+    data = _single_input(inputs, 'psd')
+    if isinstance(data, mne.io.BaseRaw):
+        from mne._fiff.pick import _picks_to_idx
+        from pyeeg.signal.spectrum import welch_psd_raw
+
+        psd, freqs = welch_psd_raw(data, **params)
+        picks = _picks_to_idx(data.info, params.get('picks', 'eeg'), exclude='bads')
+        return {'data': psd, 'freqs': freqs, 'ch_names': [data.ch_names[pick] for pick in picks]}
+    spectrum = data.compute_psd(**params)
+    return {'data': spectrum.get_data(), 'freqs': spectrum.freqs, 'ch_names': spectrum.ch_names}
+
+@register_stage('tfr')
+def tfr_stage(inputs, params, subject):
+    """
+    Wavelet power of epochs with cwt_on_epochs.
+
+    Params:
+        keys of DEFAULT_WAVELET_PARAMETERS, missing ones take the default value.
+
+    Returns:
+        tfr (dict): 'data' shape(epochs, channels, freqs, times), 'freqs', 'times' and 'ch_names'
+    """
+    from pyeeg.signal.time_frequency import cwt_on_epochs
+
+    epochs = _single_input(inputs, 'tfr')
+    tfr, freqs = cwt_on_epochs(epochs.get_data(), {**DEFAULT_WAVELET_PARAMETERS, **params},
+                               sampling_freq=epochs.info['sfreq'])
+    return {'data': tfr, 'freqs': freqs, 'times': epochs.times, 'ch_names': epochs.ch_names}
+
+@register_stage('export', cache=False)
+def export_stage(inputs, params, subject):
+    """
+    Writes the inputs of the stage, arrays to .npz, raw data to .fif and epochs to -epo.fif.
+
+    Params:
+        export_dir (str): output folder, defaults to the export folder of the settings.
+
+    Returns:
+        paths (list): written files, one per input
+    """
+    from pyeeg.config.config import get_settings
+
+    export_dir = params.get('export_dir') or get_settings().export_dir
+    if export_dir is None:
+        logger.error("No export folder found, please enter an export_dir")
+        raise ValueError("No export folder found, please enter an export_dir")
+    os.makedirs(export_dir, exist_ok=True)
+    paths = []
+    for input_name, data in zip(subject['input_names'], inputs):
+        fbase = os.path.join(export_dir, f"{subject['name']}_{input_name}")
+        if isinstance(data, mne.io.BaseRaw):
+            paths.append(fbase + '_raw.fif')
+            data.save(paths[-1], overwrite=True)
+        elif isinstance(data, mne.BaseEpochs):
+            paths.append(fbase + '-epo.fif')
+            data.save(paths[-1], overwrite=True)
+        elif isinstance(data, dict):
+            paths.append(fbase + '.npz')
+            np.savez(paths[-1], **{key: np.asarray(val) for key, val in data.items() if val is not None})
+        else:
+            logger.error(f"Cannot export output of {input_name}, type {type(data)}")
+            raise TypeError(f"Cannot export output of {input_name}, type {type(data)}")
+    return paths
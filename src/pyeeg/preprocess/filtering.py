@@ -0,0 +1,239 @@
+import functools
+
+import numpy as np
+
+import mne
+
+from pyeeg.io.loader import copy_annotations
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_FILTER_BLOCK_SIZE, FIR_KERNEL_CACHE_SIZE
+
+logger = get_logger(__name__)
+
+def fir_kernel_key(sfreq, l_freq, h_freq, l_trans_bandwidth='auto', h_trans_bandwidth='auto', filter_length='auto',
+                   fir_window='hamming', fir_design='firwin') -> tuple:
+    """
+    Hashable key of a zero-phase FIR kernel.
+
+    Returns:
+        key (tuple): (sfreq, (l_freq, h_freq), (l_trans_bandwidth, h_trans_bandwidth), filter_length, fir_window, fir_design)
+    """
+    def as_float(value):
+        return float(value) if value is not None and not isinstance(value, str) else value
+
+    return (float(sfreq),
+            (as_float(l_freq), as_float(h_freq)),
+            (as_float(l_trans_bandwidth), as_float(h_trans_bandwidth)),
+            filter_length,
+            fir_window,
+            fir_design)
+
+def get_fir_kernel(sfreq, l_freq, h_freq, **design_params) -> np.ndarray:
+    """
+    Returns the zero-phase FIR kernel mne designs for the band, reusing kernels designed before.
+
+    Kernels are kept in a bounded LRU cache keyed by sampling rate, band, transition bandwidths
+    and length (see fir_kernel_key), so every recording of a cohort shares one design.
+
+    Args:
+        sfreq (float): sampling rate of the data
+        l_freq (float): high-pass edge, None for a low-pass filter
+        h_freq (float): low-pass edge, None for a high-pass filter
+        design_params: l_trans_bandwidth, h_trans_bandwidth, filter_length, fir_window and
+            fir_design, see mne.filter.create_filter
+
+    Returns:
+        kernel (np.ndarray) shape(taps,): odd length, read only
+    """
+    return _cached_fir_kernel(fir_kernel_key(sfreq, l_freq, h_freq, **design_params))
+
+@functools.lru_cache(maxsize=FIR_KERNEL_CACHE_SIZE)
+def _cached_fir_kernel(key) -> np.ndarray:
+    sfreq, (l_freq, h_freq), (l_trans_bandwidth, h_trans_bandwidth), filter_length, fir_window, fir_design = key
+    kernel = mne.filter.create_filter(None, sfreq, l_freq, h_freq,
+                                      filter_length=filter_length,
+                                      l_trans_bandwidth=l_trans_bandwidth,
+                                      h_trans_bandwidth=h_trans_bandwidth,
+                                      method='fir',
+                                      phase='zero',
+                                      fir_window=fir_window,
+                                      fir_design=fir_design,
+                                      verbose='error')
+    kernel.setflags(write=False)
+    return kernel
+
+def edge_padding(head, tail, n_times, n_pad) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Samples before and after a signal, reflected about its end points like mne's 'reflect_limited' padding.
+
+    Args:
+        head (np.ndarray) shape(channels, samples): first min(n_pad + 1, n_times) samples of the signal
+        tail (np.ndarray) shape(channels, samples): last min(n_pad + 1, n_times) samples of the signal
+        n_times (int): length of the signal
+        n_pad (int): padded samples on each side
+
+    Returns:
+        left (np.ndarray) shape(channels, n_pad): samples -n_pad ... -1
+        right (np.ndarray) shape(channels, n_pad): samples n_times ... n_times + n_pad - 1
+    """
+    # sample -i mirrors sample i (and n_times - 1 + i mirrors n_times - 1 - i), beyond the signal length it is 0
+    distance = np.arange(1, n_pad + 1)
+    valid = distance < n_times
+    left = np.zeros((head.shape[0], n_pad), dtype=head.dtype)
+    right = np.zeros((tail.shape[0], n_pad), dtype=tail.dtype)
+    left[:, n_pad - distance[valid]] = 2 * head[:, :1] - head[:, distance[valid]]
+    right[:, distance[valid] - 1] = 2 * tail[:, -1:] - tail[:, -1 - distance[valid]]
+    return left, right
+
+def iter_fir_filtered(read, n_times, kernel, rows=None, block_size=DEFAULT_FILTER_BLOCK_SIZE, workers=None):
+    """
+    Zero-phase FIR filters a signal read block by block, with overlap-save FFT convolution.
+
+    Every sample is read once and in order, at most half a kernel ahead of the block that is
+    yielded, so blocks can be written back to the source in place. The result equals mne's
+    filter with 'reflect_limited' padding.
+
+    Args:
+        read (callable): read(start, stop) returns samples start ... stop - 1, shape(channels, samples)
+        n_times (int): length of the signal
+        kernel (np.ndarray) shape(taps,): odd length kernel, see get_fir_kernel
+        rows (array-like): channels (rows) to filter, the others are passed through, None filters all
+        block_size (int): samples per output block, raised to twice the kernel length if shorter
+        workers (int): number of threads used by scipy.fft over the channels, -1 for all cores
+
+    Yields:
+        start (int): first sample of the block
+        block (np.ndarray) shape(channels, samples)
+    """
+    import scipy.fft
+
+    if len(kernel) % 2 == 0:
+        logger.error(f"Zero-phase filtering needs an odd kernel length, instead: {len(kernel)}")
+        raise ValueError(f"Zero-phase filtering needs an odd kernel length, instead: {len(kernel)}")
+    if n_times < 1:
+        return
+    n_pad = len(kernel) // 2
+    block_size = max(int(block_size), 2 * len(kernel))
+    n_fft = scipy.fft.next_fast_len(block_size + 2 * n_pad, real=True)
+    kernel_fft = scipy.fft.rfft(kernel, n_fft)
+
+    left, right = edge_padding(read(0, min(n_pad + 1, n_times)), read(max(n_times - n_pad - 1, 0), n_times), n_times, n_pad)
+    rows = slice(None) if rows is None else np.asarray(rows, dtype=int)
+    # buffer holds the samples from start - n_pad on, read_stop is the first sample not read yet
+    buffer, read_stop = left, 0
+    for start in range(0, n_times, block_size):
+        stop = min(start + block_size, n_times)
+        if read_stop < min(stop + n_pad, n_times):
+            chunks = [buffer, read(read_stop, min(stop + n_pad, n_times))]
+            read_stop = min(stop + n_pad, n_times)
+            if read_stop == n_times:
+                chunks.append(right)
+            buffer = np.concatenate(chunks, axis=-1)
+
+        segment = buffer[:, :stop - start + 2 * n_pad]
+        block = segment[:, n_pad:n_pad + stop - start].copy()
+        segment_fft = scipy.fft.rfft(segment[rows], n_fft, axis=-1, workers=workers)
+        # circular convolution, the first 2 * n_pad samples wrap around and are discarded
+        block[rows] = scipy.fft.irfft(segment_fft * kernel_fft, n_fft, axis=-1, workers=workers)[:, 2 * n_pad:2 * n_pad + stop - start]
+        buffer = buffer[:, stop - start:]
+        yield start, block
+
+def iter_filter_raw(raw_data,
+                    l_freq,
+                    h_freq,
+                    picks=None,
+                    block_size=DEFAULT_FILTER_BLOCK_SIZE,
+                    n_jobs=None,
+                    skip_by_annotation=('edge', 'bad_acq_skip'),
+                    **design_params):
+    """
+    Streams zero-phase FIR filtered blocks of raw data that does not need to be preloaded.
+
+    Like mne.io.Raw.filter, data between annotations in skip_by_annotation is filtered
+    as separate signals and the annotated samples are passed through unchanged.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        l_freq (float), h_freq (float): band edges, see mne.io.Raw.filter
+        picks (str | list): channels to filter, None filters all data channels (bads included)
+        block_size (int): samples per block
+        n_jobs (int): number of threads over the channels, -1 for all cores
+        skip_by_annotation (tuple): annotation descriptions splitting the data
+        design_params: kernel design, see get_fir_kernel
+
+    Yields:
+        start (int): first sample of the block, relative to the first sample of raw_data
+        block (np.ndarray) shape(channels, samples): all channels, unpicked channels unchanged
+    """
+    from mne._fiff.pick import _picks_to_idx
+    from mne.annotations import _annotations_starts_stops
+
+    kernel = get_fir_kernel(raw_data.info['sfreq'], l_freq, h_freq, **design_params)
+    rows = _picks_to_idx(raw_data.info, picks, 'data_or_ica', exclude=())
+    onsets, ends = _annotations_starts_stops(raw_data, skip_by_annotation, invert=True)
+
+    def read(start, stop):
+        # a copy, blocks may be written back into preloaded data
+        return np.array(raw_data.get_data(start=start, stop=stop), dtype=np.float64)
+
+    position = 0
+    for onset, end in zip(list(onsets) + [raw_data.n_times], list(ends) + [raw_data.n_times]):
+        for start in range(position, onset, block_size):
+            yield start, read(start, min(start + block_size, onset))
+        for start, block in iter_fir_filtered(lambda start, stop: read(onset + start, onset + stop), end - onset,
+                                              kernel, rows, block_size, workers=n_jobs):
+            yield onset + start, block
+        position = max(position, end)
+
+def filter_raw_chunked(raw_data,
+                       l_freq,
+                       h_freq,
+                       picks=None,
+                       block_size=DEFAULT_FILTER_BLOCK_SIZE,
+                       n_jobs=None,
+                       skip_by_annotation=('edge', 'bad_acq_skip'),
+                       **design_params):
+    """
+    Zero-phase FIR filters raw data block by block, matching mne.io.Raw.filter with its default FIR design.
+
+    Preloaded data is filtered in place. Data that is not preloaded (e.g. open_raw) is read
+    block by block and written to an anonymous memory-mapped file, so memory stays bounded
+    by a block of all channels plus the kernel, whatever the length of the recording.
+
+    Args:
+        raw_data (str | mne.raw): path of the recording or mne raw data object
+        l_freq (float), h_freq (float): band edges, see mne.io.Raw.filter
+        picks (str | list): channels to filter, None filters all data channels (bads included)
+        block_size (int): samples per block, raised to twice the kernel length if shorter
+        n_jobs (int): number of threads over the channels, -1 for all cores
+        skip_by_annotation (tuple): annotation descriptions splitting the data, see mne.io.Raw.filter
+        design_params: l_trans_bandwidth, h_trans_bandwidth, filter_length, fir_window and fir_design
+
+    Returns:
+        raw_data (mne.raw): the filtered raw object, raw_data itself if it was preloaded
+    """
+    import tempfile
+    from mne.filter import _filt_check_picks, _filt_update_info
+
+    if isinstance(raw_data, str):
+        from pyeeg.io.loader import open_raw
+
+        raw_data = open_raw(raw_data)
+    if raw_data.preload:
+        out, filtered = raw_data._data, raw_data
+    else:
+        # the temporary file is unlinked at once, the mapping keeps it until the array is released
+        out = np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode='w+', shape=(raw_data.info['nchan'], raw_data.n_times))
+        filtered = None
+
+    for start, block in iter_filter_raw(raw_data, l_freq, h_freq, picks, block_size, n_jobs, skip_by_annotation, **design_params):
+        out[:, start:start + block.shape[-1]] = block
+
+    if filtered is None:
+        filtered = mne.io.RawArray(out, raw_data.info.copy(), first_samp=raw_data.first_samp, copy=None, verbose='error')
+        copy_annotations(raw_data, filtered)
+        filtered._filenames = list(raw_data.filenames)
+    update_info, _ = _filt_check_picks(filtered.info, picks, l_freq, h_freq)
+    _filt_update_info(filtered.info, update_info, l_freq, h_freq)
+    logger.info(f"Filtered {raw_data.n_times} samples in blocks of {block_size} ({l_freq}-{h_freq} Hz)")
+    return filtered
@@ -1,12 +1,16 @@
 import numpy as np
 import math
+import logging
+from concurrent.futures import ProcessPoolExecutor
 
 from mne._fiff._digitization import DigPoint
-from mne.channels import make_standard_montage
 from mne._fiff.constants import FIFF
 
-from pyeeg.utils.constants import NON_STANDARD_CHANNEL_TYPES, MNE_DEFAULT_MONTAGES, INVALID_POS_SCORE
-from pyeeg.utils.logger import logger
+from pyeeg.preprocess.montage_store import get_montage_positions
+from pyeeg.utils.constants import NON_STANDARD_CHANNEL_TYPES, MNE_DEFAULT_MONTAGES, INVALID_POS_SCORE, DEFAULT_MATCH_DISTANCE
+from pyeeg.utils.logger import get_logger, AggregatedLog
+
+logger = get_logger(__name__)
 
 def check_position_match(montage_pos, data_pos) -> bool:      
     """
@@ -20,7 +24,9 @@ def check_position_match(montage_pos, data_pos) -> bool:
         position_match (bool)
     """             
     if any(np.isnan(data_pos)):
-            logger.info(f'Channel position coordinates include a NAN value {data_pos}')    
+            # called for every channel/dig point pair, so only formatted when debugging
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f'Channel position coordinates include a NAN value {data_pos}')    
             return False
     else:
         position_match = True
@@ -45,7 +51,8 @@ def check_pos_distance(montage_pos, data_pos) -> float:
         (float): Cartesian distance between two coordinates of shape (1, 3)
     """     
     if any(np.isnan(data_pos)):
-        logger.info(f'Channel position coordinates include a NAN value {data_pos}')    
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Channel position coordinates include a NAN value {data_pos}')    
         return np.nan
     elif isinstance(data_pos, np.ndarray or list) and isinstance(montage_pos, np.ndarray or list):        
         return np.linalg.norm(data_pos - montage_pos)
@@ -54,6 +61,79 @@ def check_pos_distance(montage_pos, data_pos) -> float:
         return np.nan
     
 
+def chanlocs_to_array(data_chan_info) -> tuple[list, np.ndarray]:
+    """
+    Stacks channel positions of a channel-position mapping into a single array.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.
+
+    Returns:
+        chan_names (list): Channel names in the order of the position rows.
+        chan_positions (np.ndarray) shape (#chan, 3): Electrode positions.
+    """
+    chan_names = list(data_chan_info.keys())
+    chan_positions = np.empty((len(chan_names), 3))
+    for indx, ch_name in enumerate(chan_names):
+        chan_positions[indx, :] = data_chan_info[ch_name][0:3]
+    return chan_names, chan_positions
+
+def position_distance_matrix(data_pos, montage_pos) -> np.ndarray:
+    """
+    Get distances between all data and montage electrode positions in one call.
+
+    Vectorized counterpart of check_pos_distance: rows with a NAN coordinate
+    are masked out of the computation and filled with NAN.
+
+    Args:
+        data_pos (array-like) shape (#data_chan, 3): Electrode positions of data.
+        montage_pos (array-like) shape (#montage_chan, 3): Electrode positions of montage.
+
+    Returns:
+        position_matrix (np.ndarray) shape (#data_chan, #montage_chan): Cartesian distances.
+    """
+    data_pos = np.asarray(data_pos, dtype=float).reshape(-1, 3)
+    montage_pos = np.asarray(montage_pos, dtype=float).reshape(-1, 3)
+    position_matrix = np.full((len(data_pos), len(montage_pos)), np.nan)
+    data_valid = ~np.isnan(data_pos).any(axis=1)
+    montage_valid = ~np.isnan(montage_pos).any(axis=1)
+    if not data_valid.all():
+        logger.info(f"{np.count_nonzero(~data_valid)} data channels have NAN position coordinates")
+    if not (data_valid.any() and montage_valid.any()):
+        return position_matrix
+
+    pos_diff = data_pos[data_valid, np.newaxis, :] - montage_pos[np.newaxis, montage_valid, :]
+    position_matrix[np.ix_(data_valid, montage_valid)] = np.sqrt(np.einsum('ijk,ijk->ij', pos_diff, pos_diff))
+    return position_matrix
+
+def nearest_montage_chans(data_pos, montage_pos) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the nearest montage electrode for every data electrode using a KD-tree.
+
+    Args:
+        data_pos (array-like) shape (#data_chan, 3): Electrode positions of data.
+        montage_pos (array-like) shape (#montage_chan, 3): Electrode positions of montage.
+
+    Returns:
+        distances (np.ndarray) shape (#data_chan,): Distance to the nearest montage electrode, NAN for masked channels.
+        indices (np.ndarray) shape (#data_chan,): Index of the nearest montage electrode, -1 for masked channels.
+    """
+    from scipy.spatial import cKDTree
+
+    data_pos = np.asarray(data_pos, dtype=float).reshape(-1, 3)
+    montage_pos = np.asarray(montage_pos, dtype=float).reshape(-1, 3)
+    distances = np.full(len(data_pos), np.nan)
+    indices = np.full(len(data_pos), -1, dtype=int)
+    data_valid = ~np.isnan(data_pos).any(axis=1)
+    montage_index = np.flatnonzero(~np.isnan(montage_pos).any(axis=1))
+    if not (data_valid.any() and len(montage_index)):
+        return distances, indices
+
+    tree = cKDTree(montage_pos[montage_index])
+    distances[data_valid], nearest = tree.query(data_pos[data_valid], k=1)
+    indices[data_valid] = montage_index[nearest]
+    return distances, indices
+
 def get_chanlocs(data_info) -> dict | None:    
     """
     Extract EEG channel names and locations only if they are EEG channel types.
@@ -68,11 +148,12 @@ def get_chanlocs(data_info) -> dict | None:
         logger.error(f"data.info does not have ''chs'' key")
         return None
     data_chan_info = {}    
-    for dchan in data_info['chs']:            
-        if dchan['kind'] == FIFF.FIFFV_EEG_CH:
-            data_chan_info[dchan['ch_name']] = dchan['loc'][0:3]
-            if any(np.isnan(dchan['loc'][0:3])):
-                 logger.info(f"Channel position values are NAN at {dchan['ch_name']} electrode")
+    with AggregatedLog(logger) as nan_log:
+        for dchan in data_info['chs']:            
+            if dchan['kind'] == FIFF.FIFFV_EEG_CH:
+                data_chan_info[dchan['ch_name']] = dchan['loc'][0:3]
+                if any(np.isnan(dchan['loc'][0:3])):
+                    nan_log.add("channels have NAN position values", dchan['ch_name'])
     return data_chan_info 
 
 def adjust_chan_kind(data_info):
@@ -161,25 +242,29 @@ def create_position_dict(data_chan_info) -> dict:
     return loc_position_dict
 
 
-def position_pipeline(data_chan_info, position_method="position") -> dict:
+def position_pipeline(data_chan_info, position_method="position", n_jobs=None, max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
     """
     Runs a electrode matching algorithm based on channel position or names.
 
     Args:
         data_chan_info (dict): Dictionary of channel name and position mapping.    
-        position_method (str): Channel matching method ('channel_name' or 'position')
+        position_method (str): Channel matching method ('channel_name', 'position' or 'assignment')
+        n_jobs (int): Number of worker processes for the 'assignment' method, None uses all cores.
+        max_distance (float): Largest electrode distance accepted as a match by the 'assignment' method.
 
     Returns:
        loc_position_dict (dict): Dictionary storing each montage's overlap with data.
     """       
     loc_position_dict = create_position_dict(data_chan_info) 
+    if position_method == "assignment":
+        return assignment_pipeline(data_chan_info, loc_position_dict, n_jobs=n_jobs, max_distance=max_distance)
     for montage_name in MNE_DEFAULT_MONTAGES:
         if position_method == "position":
             loc_position_dict = position_matching_position(data_chan_info, montage_name, loc_position_dict)
         elif position_method == "channel_name":
             loc_position_dict = name_matching_position(data_chan_info, montage_name, loc_position_dict)
         else:
-            logger.critical(f"Wrong position method {position_method}, please enter a valid method ''position'' or ''channel_name''")
+            logger.critical(f"Wrong position method {position_method}, please enter a valid method ''position'', ''channel_name'' or ''assignment''")
             raise ValueError("Wrong position method")
     return loc_position_dict
     
@@ -194,12 +279,12 @@ def name_matching_position(data_chan_info, montage_name, loc_position_dict) -> d
     Returns:
        loc_position_dict (dict): Dictionary storing each montage's overlap with data.
     """     
-    montage = make_standard_montage(montage_name)    
-    mchpos = montage._get_ch_pos()    
+    mchnames, mchpositions = get_montage_positions(montage_name)
+    mchpos = dict(zip(mchnames, mchpositions))
     for ch_name, pos_val in data_chan_info.items():          
         empty_pos = np.empty((3))
         empty_pos.fill(np.nan)            
-        if ch_name in montage.ch_names:           
+        if ch_name in mchpos:           
             ch_reg = ch_name
             ch_pos = mchpos[ch_name]            
             position_score = check_pos_distance(mchpos[ch_name], pos_val)
@@ -228,27 +313,23 @@ def position_matching_position(data_chan_info, montage_name, loc_position_dict)
     Returns:
        loc_position_dict (dict): Dictionary storing each montage's overlap with data.
     """       
-    montage = make_standard_montage(montage_name)    
-    mchpos = montage._get_ch_pos()        
-    mchnames = list(mchpos.keys())
-    dchannames = list(data_chan_info.keys())
-    position_matrix = np.ones(shape=(len(data_chan_info), len(mchnames)))
+    mchnames, mchpositions = get_montage_positions(montage_name)
+    dchannames, dchanpos = chanlocs_to_array(data_chan_info)
+    position_matrix = position_distance_matrix(dchanpos, mchpositions)
     total_sim_score = np.ones(shape=(len(data_chan_info), 1))
-    
-    for datai in range(0, len(data_chan_info)):
-        for montagei in range(0, len(mchnames)):
-            position_matrix[datai, montagei] = check_pos_distance(data_chan_info[dchannames[datai]], mchpos[mchnames[montagei]])         
 
     rows, cols = position_matrix.shape
-    for rowi in range(0, rows):
-        match_chan_indx = find_min_matrix(position_matrix, rowi)
-        if match_chan_indx == None:
-            loc_position_dict[montage_name]['valid'] = False
-        else:
-            loc_position_dict[montage_name]['chan_names'][dchannames[rowi]] = mchnames[match_chan_indx]
-            loc_position_dict[montage_name]['chan_positions'][dchannames[rowi]] = mchpos[mchnames[match_chan_indx]] 
-            loc_position_dict[montage_name]['ch_pos_score'][dchannames[rowi]] = position_matrix[rowi, match_chan_indx]     
-            total_sim_score[rowi] = position_matrix[rowi, match_chan_indx]
+    with AggregatedLog(logger) as match_log:
+        for rowi in range(0, rows):
+            match_chan_indx = find_min_matrix(position_matrix, rowi)
+            if match_chan_indx == None:
+                match_log.add(f"data channels without a unique {montage_name} channel", dchannames[rowi])
+                loc_position_dict[montage_name]['valid'] = False
+            else:
+                loc_position_dict[montage_name]['chan_names'][dchannames[rowi]] = mchnames[match_chan_indx]
+                loc_position_dict[montage_name]['chan_positions'][dchannames[rowi]] = mchpositions[match_chan_indx]
+                loc_position_dict[montage_name]['ch_pos_score'][dchannames[rowi]] = position_matrix[rowi, match_chan_indx]     
+                total_sim_score[rowi] = position_matrix[rowi, match_chan_indx]
 
     if loc_position_dict[montage_name]['valid']:
         loc_position_dict[montage_name]['position_score'] = round(np.mean(total_sim_score) * 100, 5)
@@ -258,23 +339,117 @@ def position_matching_position(data_chan_info, montage_name, loc_position_dict)
     # print(f"\n{montage_name}:\n{loc_position_dict[montage_name]['position_score']}, {loc_position_dict[montage_name]['match_info']}")
     return loc_position_dict
 
+def assignment_pipeline(data_chan_info, loc_position_dict, n_jobs=None, max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
+    """
+    Scores all standard montages with assignment matching, concurrently in a process pool.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.    
+        loc_position_dict (dict): Dictionary storing each montage's overlap with data.
+        n_jobs (int): Number of worker processes, 1 runs in the current process and None uses all cores.
+        max_distance (float): Largest electrode distance accepted as a match.
+
+    Returns:
+       loc_position_dict (dict): Dictionary storing each montage's overlap with data.
+    """
+    montage_args = [(data_chan_info, *get_montage_positions(montage_name), loc_position_dict[montage_name], max_distance) 
+                    for montage_name in MNE_DEFAULT_MONTAGES]
+    if n_jobs == 1:
+        montage_entries = [assign_montage_chans(*args) for args in montage_args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            montage_entries = list(executor.map(assign_montage_chans, *zip(*montage_args)))
+
+    for montage_name, montage_entry in zip(MNE_DEFAULT_MONTAGES, montage_entries):
+        loc_position_dict[montage_name] = montage_entry
+    return loc_position_dict
+
+def assignment_matching_position(data_chan_info, montage_name, loc_position_dict, max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
+    """
+    Runs a electrode matching algorithm based on a global assignment of channel positions.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.    
+        montage_name (str): Name of the montage used for matching.
+        max_distance (float): Largest electrode distance accepted as a match.
+
+    Returns:
+       loc_position_dict (dict): Dictionary storing each montage's overlap with data.
+    """
+    mchnames, mchpositions = get_montage_positions(montage_name)
+    loc_position_dict[montage_name] = assign_montage_chans(data_chan_info, mchnames, mchpositions, 
+                                                           loc_position_dict[montage_name], max_distance)
+    return loc_position_dict
+
+def assign_montage_chans(data_chan_info, mchnames, mchpositions, montage_entry, max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
+    """
+    Matches data channels to montage channels by minimizing the summed electrode distance.
+
+    Unlike find_min_matrix, ties do not invalidate the montage. Data channels without 
+    a montage channel closer than max_distance keep their name and get NAN positions.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.    
+        mchnames (list): Montage channel names.
+        mchpositions (np.ndarray) shape (#montage_chan, 3): Montage electrode positions.
+        montage_entry (dict): Overlap of a single montage with data, see create_position_dict.
+        max_distance (float): Largest electrode distance accepted as a match.
+
+    Returns:
+       montage_entry (dict): Overlap of the montage with data.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    dchannames, dchanpos = chanlocs_to_array(data_chan_info)
+    position_matrix = position_distance_matrix(dchanpos, mchpositions)
+    allowed = ~np.isnan(position_matrix) & (position_matrix <= max_distance)
+    # cost of a forbidden pair exceeds any sum of allowed pairs, so the number of matches is maximized first
+    forbidden_cost = max_distance * (min(position_matrix.shape) + 1)
+    rows, cols = linear_sum_assignment(np.where(allowed, position_matrix, forbidden_cost))
+    matched = allowed[rows, cols]
+    rows, cols = rows[matched], cols[matched]
+
+    for ch_name in dchannames:
+        montage_entry['chan_names'][ch_name] = ch_name
+        montage_entry['chan_positions'][ch_name] = np.full(3, np.nan)
+        montage_entry['ch_pos_score'][ch_name] = np.nan
+    for rowi, coli in zip(rows, cols):
+        montage_entry['chan_names'][dchannames[rowi]] = mchnames[coli]
+        montage_entry['chan_positions'][dchannames[rowi]] = mchpositions[coli]
+        montage_entry['ch_pos_score'][dchannames[rowi]] = position_matrix[rowi, coli]
+
+    montage_entry['valid'] = len(rows) > 0
+    if montage_entry['valid']:
+        montage_entry['position_score'] = round(np.mean(position_matrix[rows, cols]) * 100, 5)
+    else:
+        montage_entry['position_score'] = INVALID_POS_SCORE
+    montage_entry['match_count'] = len(rows)
+    montage_entry['match_info'] = f"{len(rows)}/{len(dchannames)}"
+    return montage_entry
+
 def get_scoreboard(loc_position_dict) -> list | bool:
     """
-    Runs a electrode matching algorithm based on channel names.
+    Orders montages by the number of matched data channels, then by their position distance.
+
+    A montage matching a few channels closely does not beat one matching all channels
+    a bit further away, invalid montages count as matching no channel.
 
     Args:
         loc_position_dict (dict): Dictionary storing each montage's overlap with data.       
 
     Returns:
-       ordered_key (list): list of montage names sorted (ascending) based on position distances.
+       ordered_key (list): list of montage names sorted by match count (descending) and position distance (ascending).
     """       
     score_vector = np.array([])
+    count_vector = np.array([])
     key_vector = np.array([])
     for key, val in loc_position_dict.items():
         score_vector = np.append(score_vector, val["position_score"])
+        count_vector = np.append(count_vector, val.get("match_count", 0) if val["position_score"] != INVALID_POS_SCORE else 0)
         key_vector = np.append(key_vector, key)
 
-    order_index = np.argsort(score_vector)
+    # the last key sorts first
+    order_index = np.lexsort((score_vector, -count_vector))
     ordered_key = []
     for index in order_index:
         ordered_key.append(key_vector[index])
@@ -343,13 +518,13 @@ def find_min_matrix(matrix, start_row=0) -> int | None:
     min_col = np.argmin(matrix[start_row, :])
     same_min_cols = np.where(matrix[start_row, :]==matrix[start_row, min_col])[0]
     if len(same_min_cols) > 1:
-        logger.info("More than one montage channels have the same position for this data channel")
+        logger.debug("More than one montage channels have the same position for this data channel")
         return None
     else:
         min_row = np.argmin(matrix[:, min_col])
         same_min_rows = np.where(matrix[:, min_col]==matrix[min_row, min_col])[0]
         if len(same_min_rows) > 1:
-            logger.info("More than one data channels have the same position for this montage channel")
+            logger.debug("More than one data channels have the same position for this montage channel")
             return None
         else:                                    
             if start_row == min_row:
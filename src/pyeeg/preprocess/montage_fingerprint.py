@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from pyeeg.io.getdir import set_interimdir
+from pyeeg.io.loader import open_raw
+from pyeeg.preprocess.find_montage import adjust_chan_kind, get_chanlocs, position_pipeline, get_scoreboard
+from pyeeg.utils.constants import FINGERPRINT_CACHE_FILE, FINGERPRINT_DECIMALS, DEFAULT_MATCH_DISTANCE, MONTAGE_STORE_VERSION
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def chanlocs_fingerprint(data_chan_info, decimals=FINGERPRINT_DECIMALS) -> str:
+    """
+    Hashes channel names and rounded positions, recordings from the same cap share a fingerprint.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping (see get_chanlocs).
+        decimals (int): Number of decimals positions are rounded to before hashing.
+
+    Returns:
+        fingerprint (str): hex digest of the channel layout.
+    """
+    fingerprint = hashlib.sha1()
+    for ch_name, ch_pos in data_chan_info.items():
+        fingerprint.update(ch_name.encode('utf8') + b'\0')
+        # + 0.0 turns -0.0 into 0.0 so that rounding noise around zero does not change the hash
+        fingerprint.update((np.round(np.asarray(ch_pos[0:3], dtype='<f8'), decimals) + 0.0).tobytes())
+    return fingerprint.hexdigest()
+
+def load_fingerprint_cache(fname) -> dict:
+    """
+    Reads the fingerprint cache, empty if the file does not exist or cannot be parsed.
+
+    Args:
+        fname (str): path of the .json cache file.
+
+    Returns:
+        fingerprint_cache (dict): fingerprint -> montage detection result.
+    """
+    if fname is None or not os.path.isfile(fname):
+        return {}
+    try:
+        with open(fname, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Could not read montage fingerprint cache {fname}: {err}")
+        return {}
+
+def save_fingerprint_cache(fingerprint_cache, fname):
+    """
+    Writes the fingerprint cache to a .json file.
+
+    Args:
+        fingerprint_cache (dict): fingerprint -> montage detection result.
+        fname (str): path of the .json cache file.
+
+    Returns:
+        Nothing
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    # the process id keeps temporary files of parallel runs apart
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_fname, 'w', encoding='utf8') as f:
+            json.dump(fingerprint_cache, f, indent=1)
+        os.replace(tmp_fname, fname)
+    except OSError as err:
+        # the layouts are searched again by the next run
+        logger.warning(f"Could not write montage fingerprint cache {fname}: {err}")
+        if os.path.isfile(tmp_fname):
+            os.remove(tmp_fname)
+
+def update_fingerprint_cache(new_layouts, fname):
+    """
+    Adds montage detection results to the fingerprint cache file, keeping the layouts already in it.
+
+    Args:
+        new_layouts (dict): fingerprint -> montage detection result, see detect_montage.
+        fname (str): path of the .json cache file.
+
+    Returns:
+        Nothing
+    """
+    if not new_layouts:
+        return
+    fingerprint_cache = load_fingerprint_cache(fname)
+    fingerprint_cache.update(new_layouts)
+    save_fingerprint_cache(fingerprint_cache, fname)
+
+def score_montages(data_chan_info, position_method="position", max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
+    """
+    Runs the full montage search and keeps only what is needed to apply its result.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.
+        position_method (str): Channel matching method, see position_pipeline.
+        max_distance (float): Largest electrode distance accepted as a match, see position_pipeline.
+
+    Returns:
+        result (dict): 'montage' (best montage name or None), 'chan_names' (data -> montage channel names)
+            and 'scoreboard' (list of [montage name, position score, match info] sorted by score).
+    """
+    loc_position_dict = position_pipeline(data_chan_info, position_method=position_method, max_distance=max_distance)
+    ordered_key = get_scoreboard(loc_position_dict)
+    if ordered_key is False:
+        return {'montage': None, 'chan_names': {}, 'scoreboard': []}
+
+    scoreboard = [[str(montage_name),
+                   float(loc_position_dict[montage_name]['position_score']),
+                   loc_position_dict[montage_name].get('match_info', '')] for montage_name in ordered_key]
+    best_montage = str(ordered_key[0])
+    return {'montage': best_montage,
+            'chan_names': dict(loc_position_dict[best_montage]['chan_names']),
+            'scoreboard': scoreboard}
+
+def detect_montage(data_chan_info, fingerprint_cache, position_method="position", max_distance=DEFAULT_MATCH_DISTANCE) -> tuple[str, dict]:
+    """
+    Returns the montage detection result of a channel layout, running the search only for unseen layouts.
+
+    Results are cached per layout, matching method, max_distance and montage store version,
+    so a change of any of them searches again.
+
+    Args:
+        data_chan_info (dict): Dictionary of channel name and position mapping.
+        fingerprint_cache (dict): fingerprint -> montage detection result, updated in place.
+        position_method (str): Channel matching method, see position_pipeline.
+        max_distance (float): Largest electrode distance accepted as a match, see position_pipeline.
+
+    Returns:
+        fingerprint (str): fingerprint of the channel layout.
+        result (dict): see score_montages.
+    """
+    fingerprint = chanlocs_fingerprint(data_chan_info)
+    cache_key = f"{position_method}:{float(max_distance)}:{MONTAGE_STORE_VERSION}:{fingerprint}"
+    if cache_key not in fingerprint_cache:
+        logger.info(f"New channel layout {fingerprint}, running montage search")
+        fingerprint_cache[cache_key] = score_montages(data_chan_info, position_method=position_method, max_distance=max_distance)
+    return fingerprint, fingerprint_cache[cache_key]
+
+def detect_montages(paths, position_method="position", cache_file=None, max_distance=DEFAULT_MATCH_DISTANCE) -> dict:
+    """
+    Detects the best standard montage for many recordings, once per distinct cap layout.
+
+    Only headers are read. Results are kept in a persistent cache keyed by the layout fingerprint
+    so that later runs over recordings of a known cap do not search again.
+
+    Args:
+        paths (list): Paths of recordings readable by open_raw.
+        position_method (str): Channel matching method, see position_pipeline.
+        cache_file (str): path of the .json cache, defaults to data/interim/FINGERPRINT_CACHE_FILE.
+        max_distance (float): Largest electrode distance accepted as a match, see position_pipeline.
+
+    Returns:
+        montages (dict): path -> dict with 'fingerprint', 'montage', 'chan_names' and 'scoreboard'.
+            None for recordings that could not be read.
+    """
+    cache_file = cache_file or set_interimdir(FINGERPRINT_CACHE_FILE)
+    fingerprint_cache = load_fingerprint_cache(cache_file)
+    known_layouts = set(fingerprint_cache)
+
+    montages = {}
+    for path in paths:
+        try:
+            raw_data = open_raw(path)
+        except Exception as err:
+            logger.error(f"Could not read header of {path}: {err}")
+            montages[path] = None
+            continue
+        data_chan_info = get_chanlocs(adjust_chan_kind(raw_data.info))
+        if data_chan_info is None:
+            montages[path] = None
+            continue
+        fingerprint, result = detect_montage(data_chan_info, fingerprint_cache, position_method=position_method, max_distance=max_distance)
+        montages[path] = {'fingerprint': fingerprint, **result}
+
+    if cache_file:
+        # merged into the file as it is now, layouts saved by concurrent runs meanwhile are kept
+        update_fingerprint_cache({key: val for key, val in fingerprint_cache.items() if key not in known_layouts}, cache_file)
+    return montages
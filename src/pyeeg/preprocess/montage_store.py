@@ -0,0 +1,132 @@
+import os
+import numpy as np
+
+import mne
+
+from pyeeg.io.getdir import set_interimdir
+from pyeeg.utils.constants import MNE_DEFAULT_MONTAGES, MONTAGE_STORE_FILE, MONTAGE_STORE_VERSION
+from pyeeg.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# montage_name -> (chan_names, chan_positions), filled on first use
+_MONTAGE_STORE = None
+
+def build_montage_store(montage_names=MNE_DEFAULT_MONTAGES) -> dict:
+    """
+    Converts standard montages into channel name lists and position arrays.
+
+    Args:
+        montage_names (list): Names of the mne standard montages.
+
+    Returns:
+        montage_store (dict): montage name -> (chan_names (list), chan_positions (np.ndarray) shape (#chan, 3))
+    """
+    montage_store = {}
+    for montage_name in montage_names:
+        mchpos = mne.channels.make_standard_montage(montage_name)._get_ch_pos()
+        montage_store[montage_name] = (list(mchpos.keys()), np.array(list(mchpos.values()), dtype=float).reshape(-1, 3))
+    return montage_store
+
+def save_montage_store(montage_store, fname):
+    """
+    Writes montage store to a single .npz file tagged with the store and mne versions.
+
+    Args:
+        montage_store (dict): montage name -> (chan_names, chan_positions)
+        fname (str): path of the .npz file.
+
+    Returns:
+        Nothing
+    """
+    arrays = {'store_version': np.array(MONTAGE_STORE_VERSION),
+              'mne_version': np.array(mne.__version__),
+              'montage_names': np.array(list(montage_store.keys()))}
+    for indx, (chan_names, chan_positions) in enumerate(montage_store.values()):
+        arrays[f"names_{indx}"] = np.array(chan_names)
+        arrays[f"positions_{indx}"] = chan_positions
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    # the process id keeps temporary files of parallel workers apart, numpy needs the .npz ending
+    tmp_fname = f"{fname}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmp_fname, **arrays)
+        os.replace(tmp_fname, fname)
+    except OSError as err:
+        # another worker may write the same store, the in-memory store is used either way
+        logger.warning(f"Could not write montage store {fname}: {err}")
+        if os.path.isfile(tmp_fname):
+            os.remove(tmp_fname)
+
+def load_montage_store(fname) -> dict | None:
+    """
+    Reads a montage store written by save_montage_store.
+
+    Args:
+        fname (str): path of the .npz file.
+
+    Returns:
+        montage_store (dict): None if the file is missing, unreadable or written by another version.
+    """
+    if not os.path.isfile(fname):
+        return None
+    try:
+        with np.load(fname, allow_pickle=False) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+    except (OSError, ValueError) as err:
+        logger.warning(f"Could not read montage store {fname}: {err}")
+        return None
+
+    if int(arrays['store_version']) != MONTAGE_STORE_VERSION or str(arrays['mne_version']) != mne.__version__:
+        logger.info(f"Montage store {fname} is outdated, it will be rebuilt")
+        return None
+    montage_store = {}
+    for indx, montage_name in enumerate(arrays['montage_names']):
+        montage_store[str(montage_name)] = (arrays[f"names_{indx}"].tolist(), arrays[f"positions_{indx}"])
+    return montage_store
+
+def get_montage_store(fname=None) -> dict:
+    """
+    Returns positions of all standard montages, building and caching them on disk on first use.
+
+    Args:
+        fname (str): path of the cache file, defaults to data/interim/MONTAGE_STORE_FILE.
+
+    Returns:
+        montage_store (dict): montage name -> (chan_names, chan_positions)
+    """
+    global _MONTAGE_STORE
+    if _MONTAGE_STORE is not None:
+        return _MONTAGE_STORE
+
+    fname = fname or set_interimdir(MONTAGE_STORE_FILE)
+    montage_store = load_montage_store(fname) if fname else None
+    if montage_store is None or set(montage_store) != set(MNE_DEFAULT_MONTAGES):
+        montage_store = build_montage_store()
+        if fname:
+            save_montage_store(montage_store, fname)
+            logger.info(f"Montage store written to {fname}")
+        else:
+            logger.warning("No data folder found, montage store is kept in memory only")
+    _MONTAGE_STORE = montage_store
+    return _MONTAGE_STORE
+
+def get_montage_positions(montage_name) -> tuple[list, np.ndarray]:
+    """
+    Gets channel names and positions of a standard montage.
+
+    Args:
+        montage_name (str): Name of the montage.
+
+    Returns:
+        chan_names (list): Montage channel names.
+        chan_positions (np.ndarray) shape (#chan, 3): Montage electrode positions.
+    """
+    montage_store = get_montage_store()
+    if montage_name not in montage_store:
+        montage_store[montage_name] = build_montage_store([montage_name])[montage_name]
+    return montage_store[montage_name]
+
+def clear_montage_store():
+    """Drops the in-memory montage store so the next call reads the cache file again."""
+    global _MONTAGE_STORE
+    _MONTAGE_STORE = None
@@ -0,0 +1,196 @@
+import numpy as np
+
+import mne
+
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_REJECT_VALUES, DEFAULT_REJECT_BLOCK_WINDOWS
+
+logger = get_logger(__name__)
+
+def window_ptp(data, starts, n_times) -> np.ndarray:
+    """
+    Peak-to-peak amplitude of many windows of continuous data at once.
+
+    Samples are split into blocks of the greatest common divisor of the window length and
+    the window offsets, the max/min of every block is taken once and windows combine the
+    blocks they cover (two blocks per window at 50% overlap). Windows that are not aligned
+    to a block of more than one sample use a sliding max/min filter instead.
+
+    Args:
+        data (np.ndarray) shape(channels, samples): continuous data
+        starts (array-like) shape(windows,): first sample of every window, ascending
+        n_times (int): samples per window
+
+    Returns:
+        ptp (np.ndarray) shape(channels, windows)
+    """
+    starts = np.asarray(starts, dtype=int)
+    if len(starts) == 0:
+        return np.empty((data.shape[0], 0), dtype=data.dtype)
+    first_sample = starts[0]
+    block_size = int(np.gcd.reduce(np.append(starts - first_sample, n_times)))
+    if block_size == 1:
+        from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+        # the filter output at sample i covers i - n_times // 2 ... i - n_times // 2 + n_times - 1
+        centers = starts + n_times // 2
+        return (maximum_filter1d(data, n_times, axis=-1)[:, centers] -
+                minimum_filter1d(data, n_times, axis=-1)[:, centers])
+
+    blocks = data[:, first_sample:starts[-1] + n_times].reshape(data.shape[0], -1, block_size)
+    block_starts = (starts - first_sample) // block_size
+    window_blocks = n_times // block_size
+    window_max = np.lib.stride_tricks.sliding_window_view(blocks.max(axis=-1), window_blocks, axis=-1)[:, block_starts]
+    window_min = np.lib.stride_tricks.sliding_window_view(blocks.min(axis=-1), window_blocks, axis=-1)[:, block_starts]
+    return window_max.max(axis=-1) - window_min.min(axis=-1)
+
+def ptp_reject_windows(data, starts, n_times, reject, reject_rows, ch_names) -> tuple[np.ndarray, list]:
+    """
+    Checks the peak-to-peak amplitude of many windows against the reject values of their channel types.
+
+    Args:
+        data (np.ndarray) shape(channels, samples): continuous data
+        starts (array-like) shape(windows,): first sample of every window, ascending
+        n_times (int): samples per window
+        reject (dict): peak-to-peak rejection values per channel type
+        reject_rows (dict): channel type -> rows of data checked against reject[channel type]
+        ch_names (list): channel names of the rows of data
+
+    Returns:
+        keep (np.ndarray) shape(windows,): False for windows exceeding a reject value
+        reasons (list): per window a tuple of the channel names exceeding their reject value, empty if kept
+    """
+    keep = np.ones(len(starts), dtype=bool)
+    exceeded = []
+    for ch_type, ch_rows in reject_rows.items():
+        ch_rows = np.asarray(ch_rows, dtype=int)
+        if len(ch_rows) == 0:
+            continue
+        # consecutive rows are sliced, fancy indexing would copy the whole span
+        ch_data = data[ch_rows[0]:ch_rows[-1] + 1] if np.all(np.diff(ch_rows) == 1) else data[ch_rows]
+        over = window_ptp(ch_data, starts, n_times) > reject[ch_type]
+        keep &= ~over.any(axis=0)
+        exceeded.append((ch_rows, over))
+
+    reasons = [()] * len(starts)
+    for windowi in np.flatnonzero(~keep):
+        reasons[windowi] = tuple(ch_names[row] for ch_rows, over in exceeded for row in ch_rows[over[:, windowi]])
+    return keep, reasons
+
+def annotation_reject_windows(raw_data, starts, n_times) -> tuple[np.ndarray, list]:
+    """
+    Finds windows overlapping annotations starting with 'bad'.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        starts (array-like) shape(windows,): first sample of every window, relative to the first sample of raw_data
+        n_times (int): samples per window
+
+    Returns:
+        keep (np.ndarray) shape(windows,): False for windows overlapping a bad annotation
+        reasons (list): per window a tuple with the description of the first overlapping bad annotation, empty if kept
+    """
+    from mne.annotations import _annotations_starts_stops
+
+    starts = np.asarray(starts, dtype=int)
+    descriptions = [description for description in raw_data.annotations.description if description.upper().startswith('BAD')]
+    bad_onsets, bad_ends = _annotations_starts_stops(raw_data, 'bad')
+    overlaps = ((bad_onsets[np.newaxis, :] < starts[:, np.newaxis] + n_times) &
+                (bad_ends[np.newaxis, :] > starts[:, np.newaxis]))
+    keep = ~overlaps.any(axis=1)
+    reasons = [()] * len(starts)
+    for windowi in np.flatnonzero(~keep):
+        reasons[windowi] = (descriptions[np.argmax(overlaps[windowi])],)
+    return keep, reasons
+
+def find_bad_windows(raw_data,
+                     starts,
+                     n_times,
+                     reject=DEFAULT_REJECT_VALUES,
+                     reject_by_annotation=True,
+                     block_windows=DEFAULT_REJECT_BLOCK_WINDOWS) -> tuple[np.ndarray, tuple]:
+    """
+    Rejects windows of continuous data the way mne.Epochs does, for all windows at once.
+
+    Only the rejection channels are read, block_windows windows at a time, from raw_data which
+    does not need to be preloaded. Windows overlapping bad annotations are not checked further,
+    bad channels are ignored.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        starts (array-like) shape(windows,): first sample of every window, relative to the first sample of raw_data
+        n_times (int): samples per window
+        reject (dict): peak-to-peak rejection values per channel type, None to skip the amplitude check
+        reject_by_annotation (bool): reject windows overlapping annotations starting with 'bad'
+        block_windows (int): windows read from raw_data at once
+
+    Returns:
+        keep (np.ndarray) shape(windows,): True for the surviving windows
+        drop_log (tuple): per window a tuple of drop reasons (annotation description or
+            channel names), empty if kept, same as mne.Epochs.drop_log
+    """
+    from mne._fiff.pick import _picks_to_idx
+
+    starts = np.asarray(starts, dtype=int)
+    if reject_by_annotation:
+        keep, drop_log = annotation_reject_windows(raw_data, starts, n_times)
+    else:
+        keep, drop_log = np.ones(len(starts), dtype=bool), [()] * len(starts)
+
+    reject_picks = {ch_type: _picks_to_idx(raw_data.info, ch_type, exclude='bads', allow_empty=True)
+                    for ch_type in (reject or {})}
+    read_picks = np.array([], dtype=int)
+    for ch_picks in reject_picks.values():
+        read_picks = np.union1d(read_picks, ch_picks)
+    if len(read_picks):
+        # rows of the blocks read from raw_data that belong to every channel type
+        reject_rows = {ch_type: np.searchsorted(read_picks, ch_picks) for ch_type, ch_picks in reject_picks.items()}
+        ch_names = [raw_data.ch_names[pick] for pick in read_picks]
+        for first_window in range(0, len(starts), block_windows):
+            windows = np.arange(first_window, min(first_window + block_windows, len(starts)))
+            windows = windows[keep[windows]]
+            if len(windows) == 0:
+                continue
+            block_start = starts[windows[0]]
+            block_data = raw_data.get_data(picks=read_picks, start=block_start, stop=starts[windows[-1]] + n_times)
+            block_keep, reasons = ptp_reject_windows(block_data, starts[windows] - block_start, n_times,
+                                                     reject, reject_rows, ch_names)
+            keep[windows] = block_keep
+            for windowi, reason in zip(windows, reasons):
+                if reason:
+                    drop_log[windowi] = reason
+
+    logger.info(f"Rejected {np.count_nonzero(~keep)}/{len(starts)} windows")
+    return keep, tuple(drop_log)
+
+def epochs_from_windows(raw_data, events, n_times, keep, drop_log, event_id=None):
+    """
+    Builds a preloaded epochs object of the surviving windows only, carrying the full drop log.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        events (np.ndarray) shape(windows, 3): mne events of all windows
+        n_times (int): samples per window, epochs start at the event sample
+        keep (np.ndarray) shape(windows,): True for the surviving windows
+        drop_log (tuple): drop reasons of all windows, see find_bad_windows
+        event_id (dict | list): event ids of the epochs, see mne.Epochs
+
+    Returns:
+        epochs (mne.epoch.Epochs): epochs object whose drop_log and selection cover all windows
+    """
+    # mne needs at least one event, an empty epochs object is left after dropping it
+    epochs = mne.Epochs(raw_data,
+                        events[keep] if np.any(keep) else events[:1],
+                        event_id=event_id,
+                        tmin=0,
+                        tmax=(n_times - 1) / raw_data.info['sfreq'],
+                        baseline=None,
+                        preload=True,
+                        reject_by_annotation=False,
+                        reject=None)
+    if not np.any(keep):
+        logger.warning(f"All {len(keep)} windows were rejected")
+        epochs.drop([0])
+    epochs.drop_log = drop_log
+    epochs.selection = np.flatnonzero(keep)
+    return epochs
@@ -0,0 +1,200 @@
+import functools
+from fractions import Fraction
+
+import numpy as np
+
+import mne
+
+from pyeeg.io.loader import copy_annotations
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_RESAMPLE_BLOCK_SIZE, DEFAULT_RESAMPLE_WINDOW, RESAMPLE_KERNEL_CACHE_SIZE
+
+logger = get_logger(__name__)
+
+def polyphase_factors(sfreq, new_sfreq) -> tuple[int, int]:
+    """
+    Smallest integers up, down with new_sfreq / sfreq = up / down.
+
+    Args:
+        sfreq (float): sampling rate of the data
+        new_sfreq (float): target sampling rate
+
+    Returns:
+        up (int), down (int)
+    """
+    if sfreq <= 0 or new_sfreq <= 0:
+        logger.error(f"Sampling rates should be positive, instead: {sfreq}, {new_sfreq}")
+        raise ValueError(f"Sampling rates should be positive, instead: {sfreq}, {new_sfreq}")
+    ratio = Fraction(new_sfreq).limit_denominator(10**6) / Fraction(sfreq).limit_denominator(10**6)
+    return ratio.numerator, ratio.denominator
+
+@functools.lru_cache(maxsize=RESAMPLE_KERNEL_CACHE_SIZE)
+def get_polyphase_kernel(up, down, window=DEFAULT_RESAMPLE_WINDOW) -> np.ndarray:
+    """
+    Anti-aliasing low-pass kernel of a rational resampling, the same as scipy.signal.resample_poly designs.
+
+    Args:
+        up (int), down (int): resampling factors, see polyphase_factors
+        window (str | tuple): window of scipy.signal.firwin
+
+    Returns:
+        kernel (np.ndarray) shape(20 * max(up, down) + 1,): scaled by up, read only
+    """
+    from scipy.signal import firwin
+
+    max_rate = max(up, down)
+    kernel = firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=window) * up
+    kernel.setflags(write=False)
+    return kernel
+
+def resampled_length(n_times, up, down) -> int:
+    """Samples after resampling, rounded like mne.io.Raw.resample."""
+    return max(int(round(n_times * up / down)), 1)
+
+def iter_resampled(read, n_times, up, down, rows=None, block_size=DEFAULT_RESAMPLE_BLOCK_SIZE, window=DEFAULT_RESAMPLE_WINDOW):
+    """
+    Polyphase resamples a signal read block by block, the result equals scipy.signal.resample_poly with padtype='reflect'.
+
+    Output sample k is the kernel centered on input sample k * down / up, so a block of
+    outputs needs the inputs it covers plus half a kernel / up on each side. Inputs are read
+    once and in order, the signal is mirrored at its ends. Rows that are not resampled
+    (e.g. stim channels) take the nearest input sample instead of being filtered.
+
+    Args:
+        read (callable): read(start, stop) returns samples start ... stop - 1, shape(channels, samples)
+        n_times (int): length of the signal
+        up (int), down (int): resampling factors, see polyphase_factors
+        rows (array-like): channels (rows) to resample with the kernel, None resamples all
+        block_size (int): output samples per block
+        window (str | tuple): window of the kernel, see get_polyphase_kernel
+
+    Yields:
+        start (int): first output sample of the block
+        block (np.ndarray) shape(channels, samples)
+    """
+    from scipy.signal import upfirdn
+
+    kernel = get_polyphase_kernel(up, down, window)
+    half_len = len(kernel) // 2
+    n_out = resampled_length(n_times, up, down)
+    # inputs reach half_len / up samples beyond the ends, mirrored about the first and last sample
+    n_pad = half_len // up + 2
+    if n_times <= n_pad:
+        logger.error(f"Signal of {n_times} samples is shorter than the resampling kernel reach ({n_pad} samples)")
+        raise ValueError(f"Signal of {n_times} samples is shorter than the resampling kernel reach ({n_pad} samples)")
+    head, tail = read(0, n_pad + 1), read(n_times - n_pad - 1, n_times)
+    left = head[:, n_pad:0:-1]
+    right = tail[:, -2::-1]
+    rows = np.arange(head.shape[0]) if rows is None else np.asarray(rows, dtype=int)
+    other_rows = np.setdiff1d(np.arange(head.shape[0]), rows)
+
+    # buffer holds the mirrored and read samples from buffer_start on, read_stop is the first sample not read yet
+    buffer, buffer_start, read_stop = left, -n_pad, 0
+    for start in range(0, n_out, block_size):
+        stop = min(start + block_size, n_out)
+        first_input = -((half_len - start * down) // up) # ceil((start * down - half_len) / up)
+        last_input = ((stop - 1) * down + half_len) // up
+        if read_stop < min(last_input + 1, n_times):
+            chunks = [buffer, read(read_stop, min(last_input + 1, n_times))]
+            read_stop = min(last_input + 1, n_times)
+            if read_stop == n_times:
+                chunks.append(right)
+            buffer = np.concatenate(chunks, axis=-1)
+        segment = buffer[:, first_input - buffer_start:last_input + 1 - buffer_start]
+
+        # zeros in front of the kernel align output start with a multiple of down
+        offset = (-(half_len - first_input * up)) % down
+        first_output = (half_len + offset - first_input * up) // down + start
+        block = np.empty((head.shape[0], stop - start), dtype=buffer.dtype)
+        block[rows] = upfirdn(np.concatenate([np.zeros(offset), kernel]), segment[rows], up, down, axis=-1)[:, first_output:first_output + stop - start]
+        if len(other_rows):
+            nearest = np.minimum(np.floor(np.arange(start, stop) * down / up + 0.5).astype(int), n_times - 1)
+            block[other_rows] = segment[other_rows][:, nearest - first_input]
+        buffer, buffer_start = buffer[:, first_input - buffer_start:], first_input
+        yield start, block
+
+def resample_events(events, sfreq, new_sfreq, last_samp=None) -> np.ndarray:
+    """
+    Event samples at a new sampling rate, the same as mne.io.Raw.resample(events=...).
+
+    Args:
+        events (np.ndarray) shape(events, 3): mne events, samples include first_samp
+        sfreq (float): sampling rate of the events
+        new_sfreq (float): target sampling rate
+        last_samp (int): last sample of the resampled data, later events are moved onto it
+
+    Returns:
+        events (np.ndarray) shape(events, 3): resampled copy
+    """
+    events = np.array(events, dtype=np.int64).reshape(-1, 3)
+    events[:, 0] = np.round(events[:, 0] * (new_sfreq / sfreq)).astype(np.int64)
+    if last_samp is not None:
+        events[:, 0] = np.minimum(events[:, 0], last_samp)
+    return events
+
+def resample_raw_chunked(raw_data,
+                         sfreq,
+                         picks=None,
+                         events=None,
+                         block_size=DEFAULT_RESAMPLE_BLOCK_SIZE,
+                         window=DEFAULT_RESAMPLE_WINDOW):
+    """
+    Resamples raw data to sfreq with rational polyphase filtering, block by block.
+
+    Raw data that is not preloaded (e.g. open_raw) is read block by block and written to an
+    anonymous memory-mapped file, so memory stays bounded by a block whatever the recording
+    length. For integer ratios (e.g. 1000 Hz to 250 Hz) the data equals
+    mne.io.Raw.resample(sfreq, method='polyphase'), first sample, info and annotations are updated
+    the same way. Event indices of the recording (get_event_index) follow the new rate.
+
+    Args:
+        raw_data (str | mne.raw): path of the recording or mne raw data object
+        sfreq (float): target sampling rate
+        picks (str | list): channels filtered while resampling, None picks all but stim channels,
+            the others take the nearest sample
+        events (np.ndarray) shape(events, 3): mne events to resample along, see resample_events
+        block_size (int): output samples per block
+        window (str | tuple): window of the anti-aliasing kernel, see get_polyphase_kernel
+
+    Returns:
+        resampled (mne.io.RawArray): new raw object
+        events (np.ndarray) shape(events, 3): resampled events, only returned if events are given
+    """
+    import tempfile
+    from mne._fiff.pick import _picks_to_idx
+
+    if isinstance(raw_data, str):
+        from pyeeg.io.loader import open_raw
+
+        raw_data = open_raw(raw_data)
+    old_sfreq = raw_data.info['sfreq']
+    up, down = polyphase_factors(old_sfreq, sfreq)
+    n_out = resampled_length(raw_data.n_times, up, down)
+    shape = (raw_data.info['nchan'], n_out)
+    if raw_data.preload:
+        out = np.empty(shape)
+    else:
+        # the temporary file is unlinked at once, the mapping keeps it until the array is released
+        out = np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode='w+', shape=shape)
+
+    if picks is None:
+        # like mne, every channel but stim channels is filtered
+        rows = np.setdiff1d(np.arange(raw_data.info['nchan']), mne.pick_types(raw_data.info, meg=False, stim=True, exclude=[]))
+    else:
+        rows = _picks_to_idx(raw_data.info, picks, exclude=())
+    def read(start, stop):
+        return raw_data.get_data(start=start, stop=stop)
+    for start, block in iter_resampled(read, raw_data.n_times, up, down, rows, block_size, window):
+        out[:, start:start + block.shape[-1]] = block
+
+    info = raw_data.info.copy()
+    with info._unlock():
+        info['lowpass'] = min(info['lowpass'] if info['lowpass'] is not None else np.inf, sfreq / 2.0)
+        info['sfreq'] = float(sfreq)
+    resampled = mne.io.RawArray(out, info, first_samp=int(round(raw_data.first_samp * up / down)), copy=None, verbose='error')
+    copy_annotations(raw_data, resampled)
+    resampled._filenames = list(raw_data.filenames)
+    logger.info(f"Resampled {raw_data.n_times} samples from {old_sfreq} Hz to {sfreq} Hz (up {up}, down {down})")
+    if events is None:
+        return resampled
+    return resampled, resample_events(events, old_sfreq, sfreq, resampled.last_samp)
@@ -1,8 +1,14 @@
+import os
+import hashlib
 import mne
 import numpy as np
 
-from pyeeg.utils.logger import logger
-from pyeeg.utils.constants import DEFAULT_SEGMENTATION_WINDOW, DEFAULT_REJECT_VALUES
+from pyeeg.io.loader import source_key
+from pyeeg.preprocess.rejection import find_bad_windows, annotation_reject_windows, ptp_reject_windows, epochs_from_windows
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_SEGMENTATION_WINDOW, DEFAULT_REJECT_VALUES, DEFAULT_EPOCH_BATCH_SIZE, EVENT_INDEX_SUFFIX, EVENT_INDEX_VERSION
+
+logger = get_logger(__name__)
 
 def create_epoch_dict(time_window=DEFAULT_SEGMENTATION_WINDOW) -> dict:
     """
@@ -20,31 +26,36 @@ def create_epoch_dict(time_window=DEFAULT_SEGMENTATION_WINDOW) -> dict:
     epoch_dict['event_id'] = []
     epoch_dict['selected_events'] = []
     epoch_dict['time_window'] = time_window
+    epoch_dict['event_index'] = None
     return epoch_dict
 
 def get_meta_data(raw_data, epoch_dict) -> dict:
     """
     Returns metadata and events of raw_data
 
+    The event index of raw_data is built (or loaded) once and kept in epoch_dict, 
+    so changing the time window only recomputes the metadata.
+
     Args:
         raw_data (mne.raw): mne raw data object
         epoch_dict (dict): dictionary with metadata keys
 
     Returns:
-        epoch_dict (dict): fills metadata, events, and event_id
+        epoch_dict (dict): fills metadata, events, event_id and event_index
     """
     if epoch_dict['time_window'][0] >= epoch_dict['time_window'][1]:
         logger.error(f"Invalid time window make sure first element is smaller than the second element {epoch_dict['time_window']}")
         return None
     else:
-        all_events, all_event_id = mne.events_from_annotations(raw_data)
+        if epoch_dict.get('event_index') is None:
+            epoch_dict['event_index'] = get_event_index(raw_data)
+        elif epoch_dict['event_index'].sfreq != raw_data.info['sfreq']:
+            # raw_data was resampled since the index was built
+            epoch_dict['event_index'] = epoch_dict['event_index'].resample(raw_data.info['sfreq'], raw_data.last_samp)
 
-        metadata, events, event_id = mne.epochs.make_metadata(
-            events=all_events,
-            event_id=all_event_id,
+        metadata, events, event_id = epoch_dict['event_index'].metadata(
             tmin=epoch_dict['time_window'][0],
             tmax=epoch_dict['time_window'][1],
-            sfreq=raw_data.info['sfreq'],
         )
         print(f"\nEvent info extracted from {epoch_dict['time_window'][0]} to {epoch_dict['time_window'][1]} seconds.")
         epoch_dict['metadata'] = metadata
@@ -70,9 +81,15 @@ def show_event_list(epoch_dict):
         raise TypeError("events list must be np.ndarray type")
     
     if len(epoch_dict['event_id']) > 0:
+        if epoch_dict.get('event_index') is not None:
+            counts = epoch_dict['event_index'].counts
+        else:
+            event_vals, event_counts = np.unique(epoch_dict['events'][:, -1], return_counts=True)
+            val_counts = dict(zip(event_vals, event_counts))
+            counts = {evntkey: val_counts.get(evntval, 0) for evntkey, evntval in epoch_dict['event_id'].items()}
         print("Event\tCount")
-        for i, (evntkey, evntval) in enumerate(epoch_dict['event_id'].items()):
-            print(f"({i+1}) {evntkey}\t{np.count_nonzero(epoch_dict['events'][:, -1] == evntval)}")        
+        for i, evntkey in enumerate(epoch_dict['event_id']):
+            print(f"({i+1}) {evntkey}\t{counts[evntkey]}")        
     elif len(epoch_dict['event_id']) < 1 and len(epoch_dict['events']) > 0:
         logger.error("Events don't have corresponding IDs in the data, cannot show event list.")
         return None
@@ -162,7 +179,7 @@ def plot_segmented_data(epochs, epoch_dict):
         logger.error("'epochs' is not a mne.epochs.Epochs instance.")
         raise TypeError("'epochs' is not a mne.epochs.Epochs instance.")
 
-def segment_data_continuous(raw_data, id=1, epoch_duration=1.0, overlap=0.0, reject=DEFAULT_REJECT_VALUES):
+def segment_data_continuous(raw_data, id=1, epoch_duration=1.0, overlap=0.0, reject=DEFAULT_REJECT_VALUES, batch_size=None):
     """
     Creates epochs from continuous data
 
@@ -171,21 +188,304 @@ def segment_data_continuous(raw_data, id=1, epoch_duration=1.0, overlap=0.0, rej
         epoch_duration (float): duration of each epoch in seconds
         overlap (float): The overlap between epochs, in seconds. Must be
         ``0 <= overlap < duration``. Default is 0, i.e., no overlap.
+        batch_size (int): None builds a preloaded epochs object, otherwise epochs are 
+            streamed in batches of batch_size (see iter_epochs_continuous).
 
     Returns:
-        epochs (mne.epoch.Epochs): epochs object
+        epochs (mne.epoch.Epochs): epochs object, or a generator of batches if batch_size is given
     """       
+    if batch_size is not None:
+        return iter_epochs_continuous(raw_data, id=id, epoch_duration=epoch_duration, overlap=overlap, 
+                                      reject=reject, batch_size=batch_size)
     events = mne.make_fixed_length_events(raw_data, id=id, duration=epoch_duration, overlap=overlap)
-    delta = 1.0 / raw_data.info["sfreq"]    
-    
-    return mne.Epochs(
-        raw_data,
-        events,
-        event_id=[id],
-        tmin=0,
-        tmax=epoch_duration - delta,
-        baseline=None,
-        preload=True,
-        reject_by_annotation=True,
-        reject=reject
-    )    
+    n_times = epoch_samples(raw_data, epoch_duration)
+    # all windows are checked at once, only the surviving ones are read into the epochs
+    keep, drop_log = find_bad_windows(raw_data, events[:, 0] - raw_data.first_samp, n_times, 
+                                      reject=reject, reject_by_annotation=True)
+    return epochs_from_windows(raw_data, events, n_times, keep, drop_log, event_id=[id])
+
+def epoch_samples(raw_data, epoch_duration) -> int:
+    """Samples of a continuous epoch, same as tmin=0, tmax=epoch_duration - 1/sfreq in mne.Epochs."""
+    sfreq = raw_data.info['sfreq']
+    return int(round((epoch_duration - 1.0 / sfreq) * sfreq)) + 1
+
+def iter_epochs_continuous(raw_data, 
+                           id=1, 
+                           epoch_duration=1.0, 
+                           overlap=0.0, 
+                           reject=DEFAULT_REJECT_VALUES, 
+                           reject_by_annotation=True, 
+                           picks=None, 
+                           batch_size=DEFAULT_EPOCH_BATCH_SIZE):
+    """
+    Streams fixed-length epochs of continuous data in batches, memory does not grow with recording length.
+
+    Epochs are the ones segment_data_continuous would keep: events come from 
+    mne.make_fixed_length_events, epochs overlapping 'bad' annotations or exceeding the 
+    peak-to-peak reject values (bad channels ignored) are dropped. Every batch reads a single
+    span of samples from raw_data, which does not need to be preloaded, and overlapping epochs
+    are views of that span until the surviving ones are copied out.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        id (int): event id of the epochs
+        epoch_duration (float): duration of each epoch in seconds
+        overlap (float): overlap between epochs in seconds, 0 <= overlap < epoch_duration
+        reject (dict): peak-to-peak rejection values per channel type, None to keep all epochs
+        reject_by_annotation (bool): drop epochs overlapping annotations starting with 'bad'
+        picks (str | list): channels of the epochs, None keeps all channels like mne.Epochs
+        batch_size (int): number of events read at once
+
+    Returns:
+        generator of
+            data (np.ndarray) shape(kept epochs, channels, times): epochs of the batch
+            events (np.ndarray) shape(kept epochs, 3): mne event rows of the kept epochs
+    """
+    from mne._fiff.pick import _picks_to_idx
+
+    if batch_size < 1:
+        logger.error(f"Batch size should be a positive number of epochs, instead: {batch_size}")
+        raise ValueError(f"Batch size should be a positive number of epochs, instead: {batch_size}")
+    events = mne.make_fixed_length_events(raw_data, id=id, duration=epoch_duration, overlap=overlap)
+    n_times = epoch_samples(raw_data, epoch_duration)
+
+    epoch_picks = _picks_to_idx(raw_data.info, picks, 'all', exclude=())
+    reject_picks = {ch_type: _picks_to_idx(raw_data.info, ch_type, exclude='bads', allow_empty=True)
+                    for ch_type in (reject or {})}
+    read_picks = np.unique(epoch_picks)
+    for ch_picks in reject_picks.values():
+        read_picks = np.union1d(read_picks, ch_picks)
+    # rows of the span read from raw_data that belong to epoch and rejection channels
+    epoch_rows = np.searchsorted(read_picks, epoch_picks)
+    reject_rows = {ch_type: np.searchsorted(read_picks, ch_picks) for ch_type, ch_picks in reject_picks.items()}
+    ch_names = [raw_data.ch_names[pick] for pick in read_picks]
+
+    epoch_count = 0
+    for first_event in range(0, len(events), batch_size):
+        batch_events = events[first_event:first_event + batch_size]
+        starts = batch_events[:, 0] - raw_data.first_samp
+        if reject_by_annotation:
+            keep, _ = annotation_reject_windows(raw_data, starts, n_times)
+        else:
+            keep = np.ones(len(starts), dtype=bool)
+        if not keep.any():
+            continue
+        span_start = starts[keep][0]
+        span = raw_data.get_data(picks=read_picks, start=span_start, stop=starts[keep][-1] + n_times)
+        if reject:
+            ptp_keep, _ = ptp_reject_windows(span, starts[keep] - span_start, n_times, reject, reject_rows, ch_names)
+            keep[keep] = ptp_keep
+        if not keep.any():
+            continue
+        epoch_count += np.count_nonzero(keep)
+        # (channels, span samples, times) view over the span, only the kept epochs are copied out
+        segments = np.lib.stride_tricks.sliding_window_view(span, n_times, axis=-1)
+        yield segments[epoch_rows[np.newaxis, :], (starts[keep] - span_start)[:, np.newaxis]], batch_events[keep]
+
+    logger.info(f"Streamed {epoch_count}/{len(events)} epochs of {epoch_duration} seconds")
+
+
+class EventIndex:
+    """
+    Events of a recording indexed by type for counts, time window and preceding event queries.
+
+    Events are kept sorted by sample, the samples of every event type in their own sorted
+    array, so queries are binary searches instead of scans of all events.
+
+    Args:
+        events (np.ndarray) shape(events, 3): mne events (sample, previous id, id)
+        event_id (dict): event name -> event id
+        sfreq (float): sampling rate
+
+    Example:
+        event_index = get_event_index(raw_data)
+        event_index.counts['stimulus']
+        event_index.events_between(start_sample, stop_sample, ['response'])
+    """
+
+    def __init__(self, events, event_id, sfreq):
+        events = np.asarray(events, dtype=np.int64).reshape(-1, 3)
+        self.events = events[np.argsort(events[:, 0], kind='stable')]
+        self.event_id = dict(event_id)
+        self.sfreq = float(sfreq)
+        # rows grouped by id, sorted by sample within an id
+        order = np.lexsort((self.events[:, 0], self.events[:, 2]))
+        by_id = self.events[order]
+        ids = np.array(list(self.event_id.values()), dtype=np.int64)
+        bounds = np.searchsorted(by_id[:, 2], np.stack([ids, ids + 1]))
+        self.samples = {event_name: by_id[first:last, 0] for event_name, first, last in zip(self.event_id, *bounds)}
+        # rows of every event type in self.events, in the order of self.samples
+        self._rows = {event_name: order[first:last] for event_name, first, last in zip(self.event_id, *bounds)}
+        self.counts = {event_name: len(samples) for event_name, samples in self.samples.items()}
+
+    @classmethod
+    def from_raw(cls, raw_data):
+        """Builds the index from the annotations of raw_data."""
+        events, event_id = mne.events_from_annotations(raw_data)
+        return cls(events, event_id, raw_data.info['sfreq'])
+
+    def __len__(self):
+        return len(self.events)
+
+    def events_between(self, start, stop, event_names=None) -> np.ndarray:
+        """
+        Events with start <= sample < stop.
+
+        Args:
+            start (int): first sample, including raw_data.first_samp like the events
+            stop (int): sample after the last one
+            event_names (list): event types to return, None returns all
+
+        Returns:
+            events (np.ndarray) shape(events, 3): sorted by sample
+        """
+        if event_names is None:
+            first, last = np.searchsorted(self.events[:, 0], [start, stop])
+            return self.events[first:last]
+        # a binary search per type, the rows found are merged back into sample order
+        rows = []
+        for event_name in dict.fromkeys(event_names):
+            first, last = np.searchsorted(self.samples[event_name], [start, stop])
+            rows.append(self._rows[event_name][first:last])
+        return self.events[np.sort(np.concatenate(rows))] if rows else self.events[:0]
+
+    def preceding(self, samples, event_name) -> np.ndarray:
+        """
+        Sample of the last event of a type before each target sample.
+
+        Args:
+            samples (array-like) shape(targets,): target samples
+            event_name (str): event type
+
+        Returns:
+            preceding_samples (np.ndarray) shape(targets,): -1 where no event precedes the target
+        """
+        event_samples = self.samples[event_name]
+        indices = np.searchsorted(event_samples, np.asarray(samples), side='left') - 1
+        return np.where(indices >= 0, event_samples[np.maximum(indices, 0)], -1)
+
+    def resample(self, sfreq, last_samp=None):
+        """
+        Index of the same events at a new sampling rate, samples are mapped like mne.io.Raw.resample(events=...).
+
+        Args:
+            sfreq (float): new sampling rate
+            last_samp (int): last sample of the resampled data, later events are moved onto it
+
+        Returns:
+            event_index (EventIndex)
+        """
+        from pyeeg.preprocess.resampling import resample_events
+
+        return EventIndex(resample_events(self.events, self.sfreq, sfreq, last_samp), self.event_id, sfreq)
+
+    def metadata(self, tmin, tmax):
+        """
+        Same metadata, events and event_id as mne.epochs.make_metadata with numeric tmin and tmax.
+
+        Every event is a row, every event type a column holding the time of its first 
+        occurrence within [tmin, tmax] around the row event (NAN if it does not occur).
+
+        Args:
+            tmin (float): start of the window relative to the row event in seconds
+            tmax (float): end of the window relative to the row event in seconds
+
+        Returns:
+            metadata (pandas.DataFrame)
+            events (np.ndarray) shape(events, 3)
+            event_id (dict)
+        """
+        import pandas as pd
+
+        start_sample = int(round(tmin * self.sfreq))
+        stop_sample = int(round(tmax * self.sfreq)) + 1
+        events = self.events[np.isin(self.events[:, 2], list(self.event_id.values()))]
+        row_samples = events[:, 0]
+        id_to_name = {event_val: event_name for event_name, event_val in self.event_id.items()}
+        columns = {'event_name': [id_to_name[event_val] for event_val in events[:, 2]]}
+        for event_name, event_samples in self.samples.items():
+            first = np.searchsorted(event_samples, row_samples + start_sample, side='left')
+            found = first < len(event_samples)
+            found[found] = event_samples[first[found]] <= row_samples[found] + stop_sample
+            event_times = np.full(len(events), np.nan)
+            event_times[found] = (event_samples[first[found]] - row_samples[found]) / self.sfreq
+            columns[event_name] = event_times
+        return pd.DataFrame(columns), events, dict(self.event_id)
+
+    def save(self, fname, key=None):
+        """Writes the index to a .npz file, key identifies the recording it was built from."""
+        tmp_fname = f"{fname}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_fname,
+                 version=np.array(EVENT_INDEX_VERSION),
+                 key=np.array(key or ''),
+                 events=self.events,
+                 event_names=np.array(list(self.event_id.keys()), dtype=str),
+                 event_ids=np.array(list(self.event_id.values()), dtype=np.int64),
+                 sfreq=np.array(self.sfreq))
+        os.replace(tmp_fname, fname)
+
+    @classmethod
+    def load(cls, fname, key=None):
+        """Reads an index written by save, None if it is missing, of another version or of another key."""
+        try:
+            with np.load(fname) as arrays:
+                if int(arrays['version']) != EVENT_INDEX_VERSION or (key is not None and str(arrays['key']) != key):
+                    return None
+                return cls(arrays['events'], dict(zip(arrays['event_names'].tolist(), arrays['event_ids'].tolist())), 
+                           float(arrays['sfreq']))
+        except (OSError, ValueError, KeyError):
+            return None
+
+def event_index_path(filename) -> str:
+    """Path of the event index kept next to a recording."""
+    return os.path.splitext(filename)[0] + EVENT_INDEX_SUFFIX
+
+def annotations_key(raw_data) -> str:
+    """
+    Key of the annotations of a raw object, changes when they are cropped, added or removed.
+
+    Onsets are rounded to microseconds, so a copy of the annotations on resampled data keeps the key.
+    """
+    annotations = raw_data.annotations
+    description = hashlib.sha1()
+    description.update(str(annotations.orig_time).encode('utf8'))
+    description.update((np.round(np.asarray(annotations.onset, dtype='<f8'), 6) + 0.0).tobytes())
+    description.update((np.round(np.asarray(annotations.duration, dtype='<f8'), 6) + 0.0).tobytes())
+    description.update('\0'.join(annotations.description).encode('utf8'))
+    return description.hexdigest()
+
+def get_event_index(raw_data, persist=True) -> EventIndex:
+    """
+    Returns the event index of a recording, loading it from next to the recording when it is up to date.
+
+    The index kept next to the recording is used only if it was built from the same annotations,
+    a cropped or re-annotated raw object gets an index of its own annotations.
+    Resampled data of a recording gets the index of the recording mapped to its sampling rate.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        persist (bool): write a newly built index next to the recording
+
+    Returns:
+        event_index (EventIndex)
+    """
+    filename = raw_data.filenames[0] if raw_data.filenames and raw_data.filenames[0] else None
+    if filename is None or not os.path.isfile(filename):
+        return EventIndex.from_raw(raw_data)
+
+    fname, key = event_index_path(filename), f"{source_key(filename)}:{annotations_key(raw_data)}"
+    event_index = EventIndex.load(fname, key=key)
+    if event_index is not None and event_index.sfreq < raw_data.info['sfreq']:
+        # built from downsampled data, rebuilt at the higher rate
+        event_index = None
+    if event_index is None:
+        event_index = EventIndex.from_raw(raw_data)
+        if persist:
+            try:
+                event_index.save(fname, key=key)
+            except OSError as err:
+                logger.warning(f"Could not write the event index next to {filename}: {err}")
+    if event_index.sfreq != raw_data.info['sfreq']:
+        # resampled data (e.g. resample_raw_chunked) of the recording
+        event_index = event_index.resample(raw_data.info['sfreq'], raw_data.last_samp)
+    return event_index
@@ -1,10 +1,11 @@
-import mne
-import scipy
 import typing
-import scipy.fftpack
+import functools
 import numpy as np
 
-from pyeeg.utils.logger import logger
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_FFT_CHUNK_SIZE, DEFAULT_REJECT_VALUES, DEFAULT_WELCH_PARAMETERS, DEFAULT_FREQ_BANDS, DEFAULT_STFT_PARAMETERS
+
+logger = get_logger(__name__)
 
 def get_psd_data(spect_data, freq_range=[0, np.inf]) -> typing.Tuple[np.ndarray, np.ndarray]:
     """
@@ -30,18 +31,81 @@ def get_psd_data(spect_data, freq_range=[0, np.inf]) -> typing.Tuple[np.ndarray,
         logger.error(f"Frequency argument can have minimum of 1 element and maximum of 2 elements: {freq_range}")
         raise ValueError(f"Frequency argument can have minimum of 1 element and maximum of 2 elements: {freq_range}")
 
-def fft_on_epochs(data, sampling_freq=None):  
+@functools.lru_cache(maxsize=32)
+def _band_weights(freqs_key, bands_key) -> np.ndarray:
+    """Cached (frequencies, bands) matrix integrating power over each band of a frequency grid."""
+    freqs = np.frombuffer(freqs_key, dtype=np.float64)
+    # bin widths, so that band power is the area under the psd
+    freq_res = np.gradient(freqs) if len(freqs) > 1 else np.ones(1)
+    weights = np.zeros((len(freqs), len(bands_key)))
+    for bandi, (_, lowf, highf) in enumerate(bands_key):
+        weights[:, bandi] = np.where((freqs >= lowf) & (freqs < highf), freq_res, 0)
+    weights.flags.writeable = False
+    return weights
+
+def get_band_power(spect_data, bands=DEFAULT_FREQ_BANDS, method='absolute', freqs=None) -> typing.Tuple[np.ndarray, typing.List]:
+    """
+    Retrieves power of several frequency bands from psd data in one pass.
+
+    Band power is the psd integrated over lowf <= f < highf. Relative power divides it by the
+    power over all frequencies of the psd, log power is absolute power in decibels.
+
+    Args:
+        spect_data (mne.time_frequency.spectrum.EpochsSpectrum | np.ndarray): mne psd object or 
+            psd array of shape (..., frequencies)
+        bands (dict): band name -> frequency range [lowf, highf]
+        method (str): 'absolute', 'relative' or 'log'
+        freqs (array-like): frequencies of the psd, needed if spect_data is an array
+
+    Returns:
+        band_power (np.ndarray) shape(epochs, channels, bands)
+        band_names (list): names of the bands in the order of the last axis
+    """
+    if method not in ('absolute', 'relative', 'log'):
+        logger.error(f"Wrong band power method {method}, please enter ''absolute'', ''relative'' or ''log''")
+        raise ValueError(f"Wrong band power method {method}, please enter ''absolute'', ''relative'' or ''log''")
+    for band_name, freq_range in bands.items():
+        if len(freq_range) != 2 or freq_range[0] >= freq_range[1]:
+            logger.error(f"Band {band_name} should be a range of two increasing frequencies: {freq_range}")
+            raise ValueError(f"Band {band_name} should be a range of two increasing frequencies: {freq_range}")
+    if isinstance(spect_data, np.ndarray):
+        if freqs is None or np.shape(spect_data)[-1] != len(freqs):
+            logger.error("Frequencies matching the last axis of the psd array are needed")
+            raise ValueError("Frequencies matching the last axis of the psd array are needed")
+        data = spect_data
+    else:
+        data, freqs = spect_data.get_data(return_freqs=True)
+
+    bands_key = tuple((band_name, float(lowf), float(highf)) for band_name, (lowf, highf) in bands.items())
+    weights = _band_weights(np.ascontiguousarray(freqs, dtype=np.float64).tobytes(), bands_key)
+    band_power = data @ weights
+    if method == 'relative':
+        total_power = data @ _band_weights(np.ascontiguousarray(freqs, dtype=np.float64).tobytes(), 
+                                           (('total', -np.inf, np.inf),))
+        band_power = band_power / total_power
+    elif method == 'log':
+        band_power = 10 * np.log10(band_power)
+    return band_power, list(bands.keys())
+
+def fft_on_epochs(data, sampling_freq=None, chunk_size=DEFAULT_FFT_CHUNK_SIZE, workers=None):  
     """
     Estimates the magnitude of the spectrum of epoched data
 
+    Uses a real FFT along the time axis only, in chunks of epochs so that the complex
+    intermediate never exceeds chunk_size epochs. float32 data stays in single precision.
+
     Args:
         data (np.ndarray) shape (epochs, channels, times)
         sampling_freq (int): srate of data 
+        chunk_size (int): number of epochs transformed at once
+        workers (int): number of threads used by scipy.fft, None for single thread and -1 for all cores
 
     Returns:
         fft_mag (np.ndarray) shape(epochs, channels, frequencies)
-        freqs_positive (np.ndarray) shape(1, frequencies)
+        freqs_positive (np.ndarray) shape(frequencies,)
     """      
+    import scipy.fft
+
     data_shape = list(np.shape(data))
     if sampling_freq is None:
         logger.error("Please enter a valid sampling frequency")
@@ -49,36 +113,168 @@ def fft_on_epochs(data, sampling_freq=None):
     elif len(data_shape) != 3 or (not isinstance(data, np.ndarray)):
         logger.error("Data should be a numpy.ndarray in 3d (epochs, channels, time)")
         raise ValueError("Data should be a numpy.ndarray in 3d (epochs, channels, time)")
+    elif chunk_size < 1:
+        logger.error(f"Chunk size should be a positive number of epochs: {chunk_size}")
+        raise ValueError(f"Chunk size should be a positive number of epochs: {chunk_size}")
     else:
         N = data_shape[-1]
-        fft_result = scipy.fftpack.fftn(data)    
-        freqs = scipy.fftpack.fftfreq(N, d=1/sampling_freq)
-        fft_positive = fft_result[:, :, 0:N//2]
-        freqs_positive = freqs[:, 0:N//2]
-        fft_mag = np.abs(fft_positive) / N
-        # selective *2 because index 0 = DC and index -1 is nyquist in even length
-        # DC and nyquist have average power of the spectrum, *2 is erroneously
-        # increases power
+        real_dtype = np.float32 if data.dtype == np.float32 else np.float64
+        freqs_positive = scipy.fft.rfftfreq(N, d=1/sampling_freq)
+        fft_mag = np.empty(data_shape[:-1] + [len(freqs_positive)], dtype=real_dtype)
+        # DC and (for even N) nyquist bins have no negative frequency twin, only the rest is doubled
+        scaling = np.full(len(freqs_positive), 2.0 / N, dtype=real_dtype)
+        scaling[0] = 1.0 / N
         if N % 2 == 0:
-            fft_mag[:, :, 1:-1] *= 2.0
-        else:
-            fft_mag[:, :, 1:] *= 2.0
+            scaling[-1] = 1.0 / N
+        for epi in range(0, data_shape[0], chunk_size):
+            fft_chunk = scipy.fft.rfft(data[epi:epi + chunk_size].astype(real_dtype, copy=False), axis=-1, workers=workers)
+            np.multiply(np.abs(fft_chunk), scaling, out=fft_mag[epi:epi + chunk_size])
         return fft_mag, freqs_positive
 
-def stft_on_epochs(data):
-    """This may be deleted in future"""
-    data_shape = list(np.shape(data))
+def welch_psd_raw(raw_data, 
+                  picks='eeg', 
+                  reject=DEFAULT_REJECT_VALUES, 
+                  reject_by_annotation=True,
+                  welch_parameters=DEFAULT_WELCH_PARAMETERS) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Estimates the power spectral density of continuous data with a running Welch average.
+
+    Raw data is read block by block (preload is not needed) and the periodograms of the tapered
+    windows are summed, so memory does not grow with recording length. Windows overlapping 
+    'bad' annotations or exceeding the peak-to-peak reject values are skipped like
+    segment_data_continuous would drop them.
+
+    Args:
+        raw_data (mne.raw): mne raw data object
+        picks (str | list): channels the psd is estimated for
+        reject (dict): peak-to-peak rejection values per channel type, None to keep all windows
+        reject_by_annotation (bool): skip windows overlapping annotations starting with 'bad'
+        welch_parameters (dict): 'window_duration' (s), 'overlap' (s), 'window' (scipy window name)
+            and 'block_windows' (windows read from raw_data at once)
+
+    Returns:
+        psd (np.ndarray) shape(channels, frequencies): power spectral density in V**2/Hz
+        frequencies (np.ndarray) shape(frequencies,)
+    """
+    import scipy.fft
+    import scipy.signal
+    from mne.annotations import _annotations_starts_stops
+    from mne._fiff.pick import _picks_to_idx
 
-    if len(data_shape) != 3:
-        logger.error("Data should be in 3d (epochs, channels, time)")
-        raise ValueError("Data should be in 3d (epochs, channels, time)")
-    elif (data_shape[2] % 2) != 0:
-        logger.error(f"Length of time dimension should be even, instead: {data_shape[2]}")
-        raise ValueError(f"Length of time dimension should be even, instead: {data_shape[2]}")
+    sfreq = raw_data.info['sfreq']
+    n_fft = int(round(welch_parameters['window_duration'] * sfreq))
+    step = n_fft - int(round(welch_parameters['overlap'] * sfreq))
+    if n_fft < 1 or step < 1:
+        logger.error(f"Window duration should be positive and longer than the overlap: {welch_parameters}")
+        raise ValueError(f"Window duration should be positive and longer than the overlap: {welch_parameters}")
+    n_windows = (raw_data.n_times - n_fft) // step + 1
+    if n_windows < 1:
+        logger.error(f"Data is shorter than a single window of {welch_parameters['window_duration']} seconds")
+        raise ValueError(f"Data is shorter than a single window of {welch_parameters['window_duration']} seconds")
+
+    psd_picks = _picks_to_idx(raw_data.info, picks, exclude='bads')
+    reject_picks = {ch_type: _picks_to_idx(raw_data.info, ch_type, exclude='bads', allow_empty=True) 
+                    for ch_type in (reject or {})}
+    read_picks = np.unique(psd_picks)
+    for ch_picks in reject_picks.values():
+        read_picks = np.union1d(read_picks, ch_picks)
+    # rows of the block read from raw_data that belong to psd and rejection channels
+    psd_rows = np.searchsorted(read_picks, psd_picks)
+    reject_rows = {ch_type: np.searchsorted(read_picks, ch_picks) for ch_type, ch_picks in reject_picks.items() if len(ch_picks)}
+    if reject_by_annotation:
+        bad_onsets, bad_ends = _annotations_starts_stops(raw_data, 'bad')
     else:
-        fft_shape = tuple([data_shape[0], data_shape[1], int(data_shape[-1]//2)])
-        stft_data = np.zeros(fft_shape)    
-        for epi in range(0, data_shape[0]):
-            stft_data[epi, :, :] = mne.time_frequency.stft(data)    
-        return stft_data
-    
+        bad_onsets, bad_ends = np.array([], int), np.array([], int)
+
+    window = scipy.signal.get_window(welch_parameters['window'], n_fft)
+    frequencies = scipy.fft.rfftfreq(n_fft, d=1/sfreq)
+    # one-sided density: every bin but DC and (for even n_fft) nyquist carries its negative twin
+    scaling = np.full(len(frequencies), 2.0 / (sfreq * np.sum(window ** 2)))
+    scaling[0] /= 2
+    if n_fft % 2 == 0:
+        scaling[-1] /= 2
+
+    psd_sum = np.zeros((len(psd_picks), len(frequencies)))
+    window_count = 0
+    for first_window in range(0, n_windows, welch_parameters['block_windows']):
+        window_starts = np.arange(first_window, min(first_window + welch_parameters['block_windows'], n_windows)) * step
+        keep = ~np.any((bad_onsets[np.newaxis, :] < window_starts[:, np.newaxis] + n_fft) & 
+                       (bad_ends[np.newaxis, :] > window_starts[:, np.newaxis]), axis=1)
+        if not keep.any():
+            continue
+        block_start = window_starts[0]
+        block_data = raw_data.get_data(picks=read_picks, start=block_start, stop=window_starts[-1] + n_fft)
+        # (channels, windows, n_fft) view over the block, no copy
+        segments = np.lib.stride_tricks.sliding_window_view(block_data, n_fft, axis=-1)[:, window_starts - block_start, :]
+        for ch_type, ch_rows in reject_rows.items():
+            keep &= ~np.any(np.ptp(segments[ch_rows], axis=-1) > reject[ch_type], axis=0)
+        if not keep.any():
+            continue
+        psd_segments = segments[psd_rows][:, keep, :]
+        psd_segments = (psd_segments - psd_segments.mean(axis=-1, keepdims=True)) * window
+        psd_sum += np.sum(np.abs(scipy.fft.rfft(psd_segments, axis=-1)) ** 2, axis=1) * scaling
+        window_count += np.count_nonzero(keep)
+
+    logger.info(f"Welch psd averaged over {window_count}/{n_windows} windows")
+    if window_count == 0:
+        logger.warning("All windows were rejected, psd is filled with NAN")
+        return np.full_like(psd_sum, np.nan), frequencies
+    return psd_sum / window_count, frequencies
+
+def stft_on_epochs(data, 
+                   sampling_freq=None, 
+                   stft_parameters=DEFAULT_STFT_PARAMETERS, 
+                   output='power', 
+                   dtype=None,
+                   workers=None) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Short-time Fourier transform of epoched data.
+
+    Frames are strided views over the time axis of all epochs and channels, they are
+    tapered and transformed with one real FFT. Coefficients are scaled by the window sum
+    like scipy.signal.stft, frames start at the first sample and are not padded.
+
+    Args:
+        data (np.ndarray) shape (epochs, channels, times)
+        sampling_freq (int): srate of data 
+        stft_parameters (dict): 'window' (scipy window name), 'window_duration' (s) and 'hop_duration' (s)
+        output (str): 'power' for squared magnitude or 'complex' for coefficients
+        dtype (np.dtype): np.float32 or np.float64 precision of the computation, None keeps float32 data in float32
+        workers (int): number of threads used by scipy.fft
+
+    Returns:
+        stft_data (np.ndarray) shape(epochs, channels, frequencies, frames)
+        frequencies (np.ndarray) shape(frequencies,)
+        times (np.ndarray) shape(frames,): center of each frame in seconds
+    """
+    import scipy.fft
+    import scipy.signal
+
+    data_shape = list(np.shape(data))
+    if sampling_freq is None:
+        logger.error("Please enter a valid sampling frequency")
+        raise ValueError("Please enter a valid sampling frequency: stft_on_epochs(data, sampling_freq=int)")
+    elif len(data_shape) != 3 or (not isinstance(data, np.ndarray)):
+        logger.error("Data should be a numpy.ndarray in 3d (epochs, channels, time)")
+        raise ValueError("Data should be a numpy.ndarray in 3d (epochs, channels, time)")
+    elif output not in ('power', 'complex'):
+        logger.error(f"Wrong stft output {output}, please enter ''power'' or ''complex''")
+        raise ValueError(f"Wrong stft output {output}, please enter ''power'' or ''complex''")
+
+    n_per_seg = int(round(stft_parameters['window_duration'] * sampling_freq))
+    hop = int(round(stft_parameters['hop_duration'] * sampling_freq))
+    if hop < 1 or n_per_seg < 1 or n_per_seg > data_shape[-1]:
+        logger.error(f"Window should fit in {data_shape[-1]} samples and hop should be positive: {stft_parameters}")
+        raise ValueError(f"Window should fit in {data_shape[-1]} samples and hop should be positive: {stft_parameters}")
+
+    if dtype is None:
+        dtype = np.float32 if data.dtype == np.float32 else np.float64
+    window = scipy.signal.get_window(stft_parameters['window'], n_per_seg).astype(dtype)
+    # (epochs, channels, frames, n_per_seg) view, the taper makes the only copy
+    frames = np.lib.stride_tricks.sliding_window_view(data.astype(dtype, copy=False), n_per_seg, axis=-1)[..., ::hop, :]
+    stft_data = scipy.fft.rfft(frames * (window / window.sum()), axis=-1, workers=workers)
+    if output == 'power':
+        stft_data = stft_data.real ** 2 + stft_data.imag ** 2
+    frequencies = scipy.fft.rfftfreq(n_per_seg, d=1/sampling_freq)
+    times = (np.arange(frames.shape[-2]) * hop + n_per_seg / 2) / sampling_freq
+    return np.swapaxes(stft_data, -1, -2), frequencies, times
@@ -1,9 +1,13 @@
+import os
 import typing
-import pywt
+import hashlib
+import functools
 import numpy as np
 
-from pyeeg.utils.logger import logger
-from pyeeg.utils.constants import DEFAULT_WAVELET_PARAMETERS
+from pyeeg.utils.logger import get_logger
+from pyeeg.utils.constants import DEFAULT_WAVELET_PARAMETERS, DEFAULT_CWT_CHUNK_BYTES, DEFAULT_CWT_PRECISION, WAVELET_BANK_CACHE_SIZE, KERNEL_FFT_CACHE_SIZE
+
+logger = get_logger(__name__)
 
 def array_w_steps(array=None, count=None, method='lin') -> typing.List:
     if isinstance(array, list):        
@@ -13,33 +17,278 @@ def array_w_steps(array=None, count=None, method='lin') -> typing.List:
     elif not isinstance(array, float or int):
         logger.critical("Single values for frequency and cycles should be numeric (int or float)")
         raise TypeError("Single values for frequency and cycles should be numeric (int or float)")
+    if method not in ('lin', 'log'):
+        logger.error("Incorrect array-step method for steps")
+        raise ValueError("Incorrect array-step method for steps ") 
+    return _cached_steps(float(array[0]), float(array[1]), count, method).copy()
+
+@functools.lru_cache(maxsize=WAVELET_BANK_CACHE_SIZE)
+def _cached_steps(start, stop, count, method) -> np.ndarray:
     steps = np.ndarray((1, count))
     if method == 'lin':
-        steps[:] = np.round(np.linspace(array[0], array[1], count), 1)
-    elif method == 'log':
-        steps[:] = np.round(np.log10(np.logspace(array[0], array[1], count)), 1)
+        steps[:] = np.round(np.linspace(start, stop, count), 1)
     else:
-        logger.error("Incorrect array-step method for steps")
-        raise ValueError("Incorrect array-step method for steps ") 
+        steps[:] = np.round(np.log10(np.logspace(start, stop, count)), 1)
     return steps
 
-def cwt_on_epochs(epoch_data, wavelet_parameters=DEFAULT_WAVELET_PARAMETERS):
-    
+def get_srate(epoch_data) -> float:
+    """
+    Gets the sampling rate of epoched data.
+
+    Args:
+        epoch_data (mne.Epochs): mne epochs object
+
+    Returns:
+        srate (float)
+    """
     if isinstance(epoch_data._raw_sfreq, float):
-        srate = epoch_data._raw_sfreq
+        return epoch_data._raw_sfreq
     elif len(epoch_data._raw_times) > 1:
-        srate = 1 / np.diff(epoch_data._raw_times).mean()
+        return 1 / np.diff(epoch_data._raw_times).mean()
     else:
         logger.error("Failed to get sampling rate: could not find sampling rate or times")
         raise ValueError("Failed to get sampling rate: could not find sampling rate or times")
-    
-    freqs = array_w_steps(wavelet_parameters['f_range'], wavelet_parameters['f_count'], wavelet_parameters['f_steps']) 
-    scale = pywt.frequency2scale(wavelet_parameters['wavelet'], freqs / srate)
-    
-    tmp_data = epoch_data._get_data().copy()
 
-    # TODO: Flatten or loop over dimensions of epoched EEG DATA before wavelet convolution
-    cwtmatr, freqs = pywt.cwt(tmp_data, scale, wavelet_parameters['wavelet'], sampling_period=1/srate)
+def create_wavelet_bank(srate, wavelet_parameters=DEFAULT_WAVELET_PARAMETERS) -> typing.Dict:
+    """
+    Samples the wavelet kernels of every frequency at the sampling rate of the data.
+
+    Kernels reproduce pywt.cwt: the integrated wavelet is resampled at each scale, 
+    differentiated and scaled by -sqrt(scale), so that convolving with them gives 
+    the same coefficients as pywt.cwt(method='conv').
+
+    Args:
+        srate (float): sampling rate of the data
+        wavelet_parameters (dict): 'wavelet', 'f_range', 'f_count' and 'f_steps'
+
+    Returns:
+        wavelet_bank (dict): 'wavelet', 'srate', 'frequencies', 'scales', 'kernels' (list of 
+            np.ndarray), 'offsets' (sample of each kernel aligned with the output) and 
+            'kernel_ffts' (n_fft -> kernel spectra, filled by get_kernel_ffts)
+    """
+    import pywt
+
+    wavelet = pywt.ContinuousWavelet(wavelet_parameters['wavelet'])
+    freqs = array_w_steps(wavelet_parameters['f_range'], wavelet_parameters['f_count'], wavelet_parameters['f_steps']).ravel()
+    scales = pywt.frequency2scale(wavelet, freqs / srate)
+    int_psi, x = pywt.integrate_wavelet(wavelet, precision=DEFAULT_CWT_PRECISION)
+    int_psi = np.conj(int_psi) if wavelet.complex_cwt else int_psi
+    step = x[1] - x[0]
+
+    kernels = []
+    offsets = np.empty(len(scales), dtype=int)
+    for scalei, scale in enumerate(scales):
+        j = (np.arange(scale * (x[-1] - x[0]) + 1) / (scale * step)).astype(int)
+        int_psi_scale = int_psi[j[j < int_psi.size]][::-1]
+        if int_psi_scale.size < 2:
+            logger.error(f"Wavelet at {freqs[scalei]} Hz is shorter than two samples, lower the frequency range")
+            raise ValueError(f"Wavelet at {freqs[scalei]} Hz is shorter than two samples, lower the frequency range")
+        # diff of the convolution with int_psi_scale == convolution with the diff of the zero padded kernel
+        kernels.append(-np.sqrt(scale) * np.diff(np.concatenate(([0], int_psi_scale, [0]))))
+        offsets[scalei] = 1 + (int_psi_scale.size - 2) // 2
+
+    return {'wavelet': wavelet_parameters['wavelet'],
+            'srate': srate,
+            'frequencies': freqs,
+            'scales': scales,
+            'kernels': kernels,
+            'offsets': offsets,
+            'kernel_ffts': {}}
+
+def wavelet_bank_key(srate, wavelet_parameters) -> typing.Tuple:
+    """
+    Hashable key of a wavelet bank. Cycles are part of the wavelet name ("cmorB-C", B is the bandwidth).
+
+    Args:
+        srate (float): sampling rate of the data
+        wavelet_parameters (dict): 'wavelet', 'f_range', 'f_count' and 'f_steps'
+
+    Returns:
+        key (tuple): (wavelet, f_range, f_count, f_steps, srate)
+    """
+    return (wavelet_parameters['wavelet'], 
+            tuple(float(freq) for freq in wavelet_parameters['f_range']), 
+            int(wavelet_parameters['f_count']), 
+            wavelet_parameters['f_steps'], 
+            float(srate))
+
+def get_wavelet_bank(srate, wavelet_parameters=DEFAULT_WAVELET_PARAMETERS, cache_dir=None) -> typing.Dict:
+    """
+    Returns the wavelet bank of the parameters, reusing banks built before.
+
+    Banks are kept in a bounded LRU cache, together with the kernel spectra computed for them.
+    If cache_dir is given, sampled kernels are also read from and written to .npz files there.
+
+    Args:
+        srate (float): sampling rate of the data
+        wavelet_parameters (dict): 'wavelet', 'f_range', 'f_count' and 'f_steps'
+        cache_dir (str): folder of the on-disk cache, None to keep banks in memory only
+
+    Returns:
+        wavelet_bank (dict): see create_wavelet_bank, shared between callers
+    """
+    return _cached_wavelet_bank(wavelet_bank_key(srate, wavelet_parameters), cache_dir)
+
+@functools.lru_cache(maxsize=WAVELET_BANK_CACHE_SIZE)
+def _cached_wavelet_bank(key, cache_dir) -> typing.Dict:
+    import pywt
+
+    wavelet, f_range, f_count, f_steps, srate = key
+    wavelet_parameters = {'wavelet': wavelet, 'f_range': list(f_range), 'f_count': f_count, 'f_steps': f_steps}
+    if cache_dir is None:
+        return create_wavelet_bank(srate, wavelet_parameters)
+
+    # pywt version and precision change the sampled kernels, so they are part of the file name
+    file_key = repr((key, DEFAULT_CWT_PRECISION, pywt.__version__)).encode('utf8')
+    fname = os.path.join(cache_dir, f"wavelet_bank_{hashlib.sha1(file_key).hexdigest()}.npz")
+    if os.path.isfile(fname):
+        try:
+            with np.load(fname, allow_pickle=False) as npz:
+                kernels = np.split(npz['kernels'], np.cumsum(npz['kernel_lengths'])[:-1])
+                return {'wavelet': wavelet,
+                        'srate': srate,
+                        'frequencies': npz['frequencies'],
+                        'scales': npz['scales'],
+                        'kernels': kernels,
+                        'offsets': npz['offsets'],
+                        'kernel_ffts': {}}
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning(f"Could not read wavelet bank {fname}, it will be rebuilt: {err}")
+
+    wavelet_bank = create_wavelet_bank(srate, wavelet_parameters)
+    # the process id keeps temporary files of parallel workers apart, numpy needs the .npz ending
+    tmp_fname = f"{fname}.{os.getpid()}.tmp.npz"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(tmp_fname, 
+                 frequencies=wavelet_bank['frequencies'], 
+                 scales=wavelet_bank['scales'], 
+                 offsets=wavelet_bank['offsets'],
+                 kernel_lengths=np.array([len(kernel) for kernel in wavelet_bank['kernels']]),
+                 kernels=np.concatenate(wavelet_bank['kernels']))
+        os.replace(tmp_fname, fname)
+    except OSError as err:
+        # the bank in memory is used either way
+        logger.warning(f"Could not write wavelet bank {fname}: {err}")
+        if os.path.isfile(tmp_fname):
+            os.remove(tmp_fname)
+    return wavelet_bank
+
+@functools.lru_cache(maxsize=WAVELET_BANK_CACHE_SIZE * 16)
+def get_wavefun(wavelet, level=10) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Cached pywt.ContinuousWavelet(wavelet).wavefun(level), arrays are read-only."""
+    import pywt
+
+    psi, x = pywt.ContinuousWavelet(wavelet).wavefun(level)
+    psi.flags.writeable = False
+    x.flags.writeable = False
+    return psi, x
+
+def get_kernel_ffts(wavelet_bank, n_times) -> typing.Tuple[np.ndarray, int]:
+    """
+    Returns the spectra of the wavelet kernels zero padded for data of n_times samples.
+
+    Each kernel is rotated so that its output-aligned sample sits at index 0, the circular
+    convolution then directly gives the trimmed coefficients of pywt.cwt. The bank keeps the
+    spectra of the KERNEL_FFT_CACHE_SIZE most recently used n_fft.
+
+    Args:
+        wavelet_bank (dict): see create_wavelet_bank
+        n_times (int): number of time samples of the data
+
+    Returns:
+        kernel_ffts (np.ndarray) shape(frequencies, n_fft)
+        n_fft (int)
+    """
+    import scipy.fft
+
+    n_fft = scipy.fft.next_fast_len(n_times + max(len(kernel) for kernel in wavelet_bank['kernels']))
+    kernel_ffts = wavelet_bank['kernel_ffts'].pop(n_fft, None)
+    if kernel_ffts is None:
+        padded = np.zeros((len(wavelet_bank['kernels']), n_fft), dtype=np.complex128)
+        for kerneli, (kernel, offset) in enumerate(zip(wavelet_bank['kernels'], wavelet_bank['offsets'])):
+            padded[kerneli, :len(kernel)] = kernel
+            padded[kerneli] = np.roll(padded[kerneli], -offset)
+        kernel_ffts = scipy.fft.fft(padded, axis=-1)
+        # dicts keep insertion order, the first entry is the least recently used
+        while len(wavelet_bank['kernel_ffts']) >= KERNEL_FFT_CACHE_SIZE:
+            wavelet_bank['kernel_ffts'].pop(next(iter(wavelet_bank['kernel_ffts'])))
+    wavelet_bank['kernel_ffts'][n_fft] = kernel_ffts
+    return kernel_ffts, n_fft
+
+def cwt_on_epochs(epoch_data, 
+                  wavelet_parameters=DEFAULT_WAVELET_PARAMETERS, 
+                  output='power', 
+                  out=None, 
+                  sampling_freq=None,
+                  max_chunk_bytes=DEFAULT_CWT_CHUNK_BYTES,
+                  workers=None,
+                  wavelet_cache_dir=None) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Continuous wavelet transform of epoched data by batched convolution in the frequency domain.
+
+    Epochs and channels are flattened into rows that are transformed in chunks, each chunk
+    is written straight into the output so only the output has to hold all time-frequency
+    values. Passing a np.memmap (or a .npy file name) as out keeps that on disk.
+
+    Args:
+        epoch_data (mne.Epochs | np.ndarray): epochs object or data of shape (epochs, channels, times)
+        wavelet_parameters (dict): 'wavelet', 'f_range', 'f_count' and 'f_steps'
+        output (str): 'power' for squared magnitude or 'complex' for coefficients
+        out (np.ndarray | str): preallocated array of shape (epochs, channels, freqs, times) or
+            path of a .npy file to create as memory-mapped output
+        sampling_freq (float): srate of data, needed if epoch_data is an array
+        max_chunk_bytes (int): upper bound of the complex intermediate of a chunk
+        workers (int): number of threads used by scipy.fft
+        wavelet_cache_dir (str): folder of the on-disk wavelet bank cache, see get_wavelet_bank
+
+    Returns:
+        tfr (np.ndarray) shape(epochs, channels, freqs, times)
+        freqs (np.ndarray) shape(freqs,)
+    """
+    import scipy.fft
+
+    if output not in ('power', 'complex'):
+        logger.error(f"Wrong cwt output {output}, please enter ''power'' or ''complex''")
+        raise ValueError(f"Wrong cwt output {output}, please enter ''power'' or ''complex''")
+    if isinstance(epoch_data, np.ndarray):
+        if sampling_freq is None:
+            logger.error("Please enter a valid sampling frequency for array data")
+            raise ValueError("Please enter a valid sampling frequency: cwt_on_epochs(data, sampling_freq=float)")
+        data, srate = epoch_data, sampling_freq
+    else:
+        data, srate = epoch_data.get_data(), get_srate(epoch_data)
+    if data.ndim != 3:
+        logger.error("Data should be in 3d (epochs, channels, time)")
+        raise ValueError("Data should be in 3d (epochs, channels, time)")
+
+    wavelet_bank = get_wavelet_bank(srate, wavelet_parameters, cache_dir=wavelet_cache_dir)
+    freqs = wavelet_bank['frequencies']
+    n_epochs, n_chans, n_times = data.shape
+    out_shape = (n_epochs, n_chans, len(freqs), n_times)
+    out_dtype = np.float64 if output == 'power' else np.complex128
+    if out is None:
+        out = np.empty(out_shape, dtype=out_dtype)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=out_dtype, shape=out_shape)
+    elif out.shape != out_shape or not out.flags.c_contiguous:
+        logger.error(f"Output array should be C-contiguous with shape {out_shape}, instead: {out.shape}")
+        raise ValueError(f"Output array should be C-contiguous with shape {out_shape}, instead: {out.shape}")
+
+    kernel_ffts, n_fft = get_kernel_ffts(wavelet_bank, n_times)
+    rows = data.reshape(n_epochs * n_chans, n_times)
+    out_rows = out.reshape(n_epochs * n_chans, len(freqs), n_times)
+    chunk_rows = max(1, int(max_chunk_bytes // (len(freqs) * n_fft * 16)))
+    for rowi in range(0, len(rows), chunk_rows):
+        data_fft = scipy.fft.fft(rows[rowi:rowi + chunk_rows], n=n_fft, axis=-1, workers=workers)
+        coefs = scipy.fft.ifft(data_fft[:, np.newaxis, :] * kernel_ffts, axis=-1, workers=workers)[..., :n_times]
+        if output == 'power':
+            out_rows[rowi:rowi + chunk_rows] = coefs.real ** 2 + coefs.imag ** 2
+        else:
+            out_rows[rowi:rowi + chunk_rows] = coefs
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out, freqs
 
 def create_wavelet_w_cycles(freq_range=None, 
                             cycle_range=None,
@@ -64,7 +313,7 @@ def create_wavelet_w_cycles(freq_range=None,
     if return_wavefun:
         for wavei in wavelets:    
                 # wavefun arg scales srate [-8, 8]s / 2**10
-                [psi, x] = pywt.ContinuousWavelet(wavei).wavefun(10) 
+                [psi, x] = get_wavefun(wavei, 10) 
                 wave_dict['wavelets'][wavei] = psi
         wave_dict['times'] = x
     
@@ -1,3 +1,4 @@
+import os
 
-
-
+# pyeeg.utils.logger resolves its log folder from LOG_DIR when the first record is written
+os.environ.setdefault("LOG_DIR", "logs")
@@ -0,0 +1,41 @@
+import os
+import numpy as np
+import mne
+
+from pyeeg.io.catalog import scan_catalog, query_catalog
+
+
+def test_catalog_scan_and_query(tmp_path):
+    """Scans index headers and events, rescans only touch changed files."""
+    rec_dir = tmp_path / 'recordings'
+    os.makedirs(rec_dir / 'sub02')
+    for fname, sfreq, ch_names, onsets in [('sub01_raw.fif', 100.0, ['Fz', 'Cz'], [0.5, 1.0]),
+                                           (os.path.join('sub02', 'sub02_raw.fif'), 250.0, ['Cz', 'Pz'], [])]:
+        raw_data = mne.io.RawArray(np.zeros((2, int(2 * sfreq))), mne.create_info(ch_names, sfreq, 'eeg'), verbose='error')
+        raw_data.set_annotations(mne.Annotations(onsets, [0.0] * len(onsets), ['stim'] * len(onsets)))
+        raw_data.save(str(rec_dir / fname), verbose='error')
+    db_path = str(tmp_path / 'catalog.sqlite')
+
+    assert scan_catalog(str(rec_dir), db_path=db_path)['added'] == 2
+    assert scan_catalog(str(rec_dir), db_path=db_path)['unchanged'] == 2
+    [recording] = query_catalog(db_path, event='stim')
+    assert recording['path'].endswith('sub01_raw.fif') and recording['event_counts'] == {'stim': 2}
+    assert recording['duration'] == 2.0 and recording['ch_names'] == ['Fz', 'Cz']
+    assert len(query_catalog(db_path, channels=['Cz'])) == 2
+    assert [r['sfreq'] for r in query_catalog(db_path, channels=['Cz', 'Pz'])] == [250.0]
+
+    os.remove(rec_dir / 'sub01_raw.fif')
+    assert scan_catalog(str(rec_dir), db_path=db_path)['removed'] == 1
+    assert query_catalog(db_path, event='stim') == []
+
+
+def test_catalog_bad_segments_only(tmp_path):
+    """A recording whose only annotations are bad segments is readable and has no events."""
+    raw_data = mne.io.RawArray(np.zeros((2, 200)), mne.create_info(['Fz', 'Cz'], 100.0, 'eeg'), verbose='error')
+    raw_data.set_annotations(mne.Annotations([0.5], [0.2], ['BAD_motion']))
+    raw_data.save(str(tmp_path / 'sub01_raw.fif'), verbose='error')
+    db_path = str(tmp_path / 'catalog.sqlite')
+
+    scan_catalog(str(tmp_path), db_path=db_path)
+    [recording] = query_catalog(db_path)
+    assert recording['error'] is None and recording['event_counts'] == {}
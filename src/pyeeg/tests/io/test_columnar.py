@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import mne
+
+from pyeeg.io.columnar import convert_recordings, read_columnar, read_raw_columnar, columnar_path
+
+
+def test_columnar_roundtrip_and_invalidation(tmp_path):
+    """Columnar copies keep data, locations and annotations and are rebuilt when the source changes."""
+    data = np.random.default_rng(0).normal(size=(3, 400)) * 1e-6
+    raw_data = mne.io.RawArray(data.copy(), mne.create_info(['Fz', 'Cz', 'Pz'], 100.0, 'eeg'), verbose='error')
+    raw_data.set_montage(mne.channels.make_dig_montage({'Fz': [0, 0.07, 0.06], 'Cz': [0, 0, 0.09], 'Pz': [0, -0.07, 0.06]}))
+    raw_data.set_annotations(mne.Annotations([0.5, 2.0], [0.0, 0.0], ['stim/1', 'stim/2']))
+    fname = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(fname, verbose='error')
+    cache_dir = str(tmp_path / 'columnar')
+
+    assert convert_recordings([fname], cache_dir=cache_dir)[fname] == columnar_path(fname, cache_dir)
+    columnar, events, event_id = read_raw_columnar(fname, cache_dir=cache_dir, return_events=True)
+    assert isinstance(columnar._data, np.memmap)
+    np.testing.assert_allclose(columnar.get_data(), data)
+    np.testing.assert_allclose(columnar.info['chs'][1]['loc'], raw_data.info['chs'][1]['loc'])
+    assert list(columnar.annotations.description) == ['stim/1', 'stim/2']
+    np.testing.assert_array_equal(events[:, 0], [50, 200])
+    assert set(event_id) == {'stim/1', 'stim/2'}
+
+    raw_data.apply_function(lambda x: x * 2)
+    raw_data.save(fname, overwrite=True, verbose='error')
+    os.utime(fname, ns=(0, 1))
+    np.testing.assert_allclose(read_raw_columnar(fname, cache_dir=cache_dir).get_data(), 2 * data)
+
+
+def test_columnar_annotations(tmp_path):
+    """Annotations without orig_time keep their time, recordings with only bad segments convert without events."""
+    raw_data = mne.io.RawArray(np.zeros((2, 2000)), mne.create_info(['C3', 'C4'], 100.0, 'eeg'), first_samp=500, verbose='error')
+    raw_data.set_meas_date(None)
+    raw_data.set_annotations(mne.Annotations([8.0], [0.5], ['stim']))
+    fname = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(fname, verbose='error')
+    source = mne.io.read_raw_fif(fname, verbose='error')
+
+    columnar, events, _ = read_raw_columnar(fname, cache_dir=str(tmp_path / 'columnar'), return_events=True)
+    np.testing.assert_allclose(columnar.annotations.onset, source.annotations.onset)
+    np.testing.assert_array_equal(mne.events_from_annotations(columnar, verbose='error')[0], events)
+    np.testing.assert_array_equal(events, mne.events_from_annotations(source, verbose='error')[0])
+
+    # recordings whose annotations are all bad segments have no events
+    raw_data.set_annotations(mne.Annotations([1.0], [0.5], ['BAD_motion']))
+    raw_data.save(fname, overwrite=True, verbose='error')
+    path = convert_recordings([fname], cache_dir=str(tmp_path / 'columnar'), force=True)[fname]
+    assert path is not None
+    columnar, events, event_id = read_columnar(path, return_events=True)
+    assert events.shape == (0, 3) and event_id == {}
+    assert list(columnar.annotations.description) == ['BAD_motion']
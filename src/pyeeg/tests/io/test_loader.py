@@ -0,0 +1,88 @@
+import numpy as np
+import mne
+import pytest
+
+from pyeeg.io.loader import WindowedReader
+
+
+def test_windowed_reader(tmp_path):
+    """Overlapping windows cover the file without preloading and respect the memory cap."""
+    data = np.random.default_rng(0).normal(size=(4, 1050))
+    raw_data = mne.io.RawArray(data, mne.create_info(['C3', 'C4', 'Cz', 'EOG'], 100.0, ['eeg'] * 3 + ['eog']), verbose='error')
+    fname = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(fname, verbose='error')
+
+    reader_parameters = {'window_duration': 2.0, 'overlap': 0.5, 'max_bytes': 2**20, 'dtype': 'float32'}
+    with WindowedReader(fname, picks='eeg', reader_parameters=reader_parameters) as reader:
+        assert not reader.raw_data.preload
+        windows = list(reader)
+        assert len(windows) == reader.n_windows == 7
+        for start, window in windows:
+            assert window.dtype == np.float32
+            np.testing.assert_allclose(window, data[:3, start:start + 200], rtol=1e-5)
+        assert windows[-1][0] + windows[-1][1].shape[-1] == 1050
+        assert reader.stats['bytes_read'] == 3 * 4 * sum(window.shape[-1] for _, window in windows)
+
+    with pytest.raises(MemoryError):
+        WindowedReader(fname, reader_parameters={**reader_parameters, 'max_bytes': 100})
+
+
+def test_read_raw_memmap(tmp_path):
+    """Recordings are decoded once and reopened from the mapped backing file."""
+    import os
+    from pyeeg.io.loader import read_raw_memmap
+
+    data = np.random.default_rng(0).normal(size=(3, 500))
+    raw_data = mne.io.RawArray(data, mne.create_info(['C3', 'C4', 'Cz'], 100.0, 'eeg'), verbose='error')
+    raw_data.set_annotations(mne.Annotations([1.0], [0.5], ['bad_blink']))
+    fname = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(fname, verbose='error')
+
+    cache_dir = str(tmp_path / 'memmap')
+    mapped = read_raw_memmap(fname, cache_dir=cache_dir)
+    assert isinstance(mapped._data, np.memmap)
+    np.testing.assert_allclose(mapped.get_data(), data)
+    assert list(mapped.annotations.description) == ['bad_blink']
+
+    backing_files = sorted(os.listdir(cache_dir))
+    mapped.apply_function(lambda x: x * 0)
+    reopened = read_raw_memmap(fname, cache_dir=cache_dir)
+    assert sorted(os.listdir(cache_dir)) == backing_files
+    np.testing.assert_allclose(reopened.get_data(), data)
+    np.testing.assert_allclose(read_raw_memmap(fname, dtype='float32', cache_dir=cache_dir).get_data(), data, rtol=1e-6)
+
+
+def test_load_many(tmp_path):
+    """Every path comes back once with timing, broken files carry their error."""
+    from pyeeg.io.loader import load_many
+
+    raw_data = mne.io.RawArray(np.zeros((2, 100)), mne.create_info(2, 100.0, 'eeg'), verbose='error')
+    paths = [str(tmp_path / f"rec{indx}_raw.fif") for indx in range(4)]
+    for fname in paths:
+        raw_data.save(fname, verbose='error')
+    paths.append(str(tmp_path / 'missing_raw.fif'))
+
+    results = {result['path']: result for result in load_many(paths, max_workers=3, preload=True)}
+    assert set(results) == set(paths)
+    assert results[paths[-1]]['raw_data'] is None and results[paths[-1]]['error']
+    for fname in paths[:-1]:
+        assert results[fname]['error'] is None and results[fname]['raw_data'].preload
+        assert results[fname]['seconds'] >= 0
+
+
+def test_read_raw_memmap_keeps_annotation_times(tmp_path):
+    """Annotations without orig_time stay at their time when the recording does not start at sample 0."""
+    from pyeeg.io.loader import read_raw_memmap
+
+    info = mne.create_info(['C3', 'C4'], 100.0, 'eeg')
+    raw_data = mne.io.RawArray(np.zeros((2, 2000)), info, first_samp=500, verbose='error')
+    raw_data.set_meas_date(None)
+    raw_data.set_annotations(mne.Annotations([8.0], [0.5], ['stim']))
+    fname = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(fname, verbose='error')
+    source = mne.io.read_raw_fif(fname, verbose='error')
+
+    mapped = read_raw_memmap(fname, cache_dir=str(tmp_path / 'memmap'))
+    np.testing.assert_allclose(mapped.annotations.onset, source.annotations.onset)
+    np.testing.assert_array_equal(mne.events_from_annotations(mapped, verbose='error')[0],
+                                  mne.events_from_annotations(source, verbose='error')[0])
@@ -0,0 +1,24 @@
+import numpy as np
+
+from pyeeg.io.writers import append_epochs, read_epochs, read_epoch_index
+
+
+def test_epoch_store_append_and_select(tmp_path):
+    """Batches append with a running index and subsets read back by subject and event."""
+    store_dir = str(tmp_path / 'psd_store')
+    rng = np.random.default_rng(0)
+    first = rng.normal(size=(3, 2, 5)).astype(np.float32)
+    second = rng.normal(size=(2, 2, 5)).astype(np.float32)
+
+    assert append_epochs(store_dir, first, 'sub01', ['rest', 'task', 'rest']) == 0
+    assert append_epochs(store_dir, second, 'sub01', ['task', 'task']) == 3
+    append_epochs(store_dir, second, 'sub02', [1, 2])
+
+    index = read_epoch_index(store_dir)
+    assert [row['epoch'] for row in index] == [0, 1, 2, 3, 4, 0, 1]
+    data, rows = read_epochs(store_dir, subjects=['sub01'], events=['task'])
+    assert data.dtype == np.float32
+    np.testing.assert_array_equal(data, np.concatenate([first[1:2], second]))
+    assert [row['epoch'] for row in rows] == [1, 3, 4]
+    data, _ = read_epochs(store_dir, subjects=['sub02'], events=[2])
+    np.testing.assert_array_equal(data, second[1:])
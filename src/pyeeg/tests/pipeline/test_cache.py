@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from pyeeg.pipeline.cache import StageCache, stage_key
+from pyeeg.pipeline.engine import run_pipeline
+from pyeeg.tests.pipeline.test_engine import make_recording
+
+
+def test_late_parameter_recomputes_only_late_stage(tmp_path):
+    """A second run with a new psd parameter reads the epochs from the cache and skips load and filter."""
+    fname = str(tmp_path / 'sub-01_raw.fif')
+    make_recording(fname)
+    stages = [{'name': 'load', 'type': 'load'},
+              {'name': 'filter', 'type': 'filter', 'params': {'l_freq': 1.0, 'h_freq': 30.0, 'verbose': 'error'}},
+              {'name': 'epochs', 'type': 'segment', 'params': {'events': ['Stimulus/*'], 'tmin': -0.2, 'tmax': 0.5}},
+              {'name': 'psd', 'type': 'psd', 'params': {'fmax': 30.0, 'verbose': 'error'}}]
+    cache = StageCache(str(tmp_path / 'cache'))
+
+    first, = run_pipeline({'stages': stages}, paths=[fname], n_jobs=1, cache=cache)
+    assert first['error'] is None and first['cached'] == []
+    assert first['cache_stats'] == {'hits': 0, 'misses': 3, 'writes': 3, 'evictions': 0}
+
+    stages[-1]['params']['fmax'] = 20.0
+    second, = run_pipeline({'stages': stages}, paths=[fname], n_jobs=1, cache=cache)
+    assert second['cached'] == ['epochs']
+    assert list(second['timings']) == ['epochs', 'psd']
+    assert second['cache_stats'] == {'hits': 1, 'misses': 1, 'writes': 1, 'evictions': 0}
+
+    third, = run_pipeline({'stages': stages}, paths=[fname], n_jobs=1, cache=cache)
+    assert third['cached'] == ['psd']
+
+
+def test_stage_cache_evicts_least_recently_used(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=None)
+    keys = [stage_key('psd', {'fmax': fmax}, ['source']) for fmax in range(3)]
+    assert len(set(keys)) == 3
+    for indx, key in enumerate(keys):
+        cache.put(key, {'data': np.zeros(1000), 'ch_names': ['Fz', 'Cz']})
+        os.utime(os.path.join(str(tmp_path), key + '.npz'), ns=(0, 10**9 * (indx + 1))) # written in order
+    entry_size = cache.size() // 3
+
+    assert cache.get(keys[0])['ch_names'] == ['Fz', 'Cz'] # reading keys[0] makes keys[1] the oldest entry
+    cache.max_bytes = 2 * entry_size
+    assert cache.evict() == 1
+    assert keys[1] not in cache and keys[0] in cache and keys[2] in cache
+    assert cache.get(keys[1]) is None
+    assert cache.stats == {'hits': 1, 'misses': 1, 'writes': 3, 'evictions': 1}
@@ -0,0 +1,75 @@
+import json
+
+import mne
+import numpy as np
+import pytest
+
+from pyeeg.pipeline.engine import run_pipeline, validate_spec, stage_order
+
+
+def make_recording(fname, sfreq=100.0):
+    rng = np.random.default_rng(0)
+    info = mne.create_info(['Fz', 'Cz', 'Pz'], sfreq, 'eeg')
+    raw_data = mne.io.RawArray(rng.normal(scale=5e-6, size=(3, 6000)), info, verbose='error')
+    onsets = np.arange(2.0, 58.0, 2.0)
+    descriptions = ['Stimulus/S 1' if indx % 2 else 'Stimulus/S 2' for indx in range(len(onsets))]
+    raw_data.set_annotations(mne.Annotations(np.append(onsets, 1.0), 0, descriptions + ['Comment/start']))
+    raw_data.save(fname, verbose='error')
+
+
+def test_run_pipeline_json_spec(tmp_path):
+    """A JSON spec runs unattended on every recording and exports the stage outputs."""
+    for subject in ('sub-01', 'sub-02'):
+        make_recording(str(tmp_path / f'{subject}_raw.fif'))
+    spec = {'name': 'psd',
+            'inputs': [str(tmp_path / '*_raw.fif')],
+            'stages': [{'name': 'load', 'type': 'load'},
+                       {'name': 'filter', 'type': 'filter', 'params': {'l_freq': 1.0, 'h_freq': 30.0, 'verbose': 'error'}},
+                       {'name': 'epochs', 'type': 'segment', 'params': {'events': ['Stimulus/*'], 'tmin': -0.2, 'tmax': 0.5,
+                                                                          'baseline': [None, 0]}},
+                       {'name': 'psd', 'type': 'psd', 'params': {'fmax': 30.0, 'verbose': 'error'}},
+                       {'name': 'export', 'type': 'export', 'inputs': ['psd'], 'params': {'export_dir': str(tmp_path / 'out')}}]}
+    spec_file = tmp_path / 'spec.json'
+    spec_file.write_text(json.dumps(spec))
+
+    results = run_pipeline(str(spec_file), n_jobs=1)
+    assert [result['subject'] for result in results] == ['sub-01_raw', 'sub-02_raw']
+    assert all(result['error'] is None for result in results)
+    assert list(results[0]['timings']) == ['load', 'filter', 'epochs', 'psd', 'export']
+    psd = np.load(results[0]['exports']['export'][0])
+    assert psd['data'].shape[:2] == (28, 3)
+    assert psd['freqs'].max() <= 30.0
+
+
+def test_spec_validation():
+    spec = validate_spec({'stages': [{'type': 'load'}, {'type': 'filter'},
+                                     {'name': 'psd', 'type': 'psd', 'inputs': 'load'}]})
+    assert [stage['inputs'] for stage in spec['stages']] == [[], ['load'], ['load']]
+    assert stage_order(spec)[0] == 'load'
+    with pytest.raises(ValueError):
+        validate_spec({'stages': [{'name': 'a', 'type': 'filter', 'inputs': ['b']},
+                                  {'name': 'b', 'type': 'filter', 'inputs': ['a']}]})
+    with pytest.raises(ValueError):
+        validate_spec({'stages': [{'type': 'ica'}]})
+
+
+def test_montage_fingerprints_saved(tmp_path):
+    """Montage layouts searched in a subject are saved by run_pipeline, so the next subject of the cap reads them."""
+    from pyeeg.preprocess.montage_fingerprint import load_fingerprint_cache
+
+    montage = mne.channels.make_standard_montage('biosemi32')
+    for subject in ('sub-01', 'sub-02'):
+        info = mne.create_info(montage.ch_names, 100.0, 'eeg')
+        raw_data = mne.io.RawArray(np.zeros((len(montage.ch_names), 500)), info, verbose='error')
+        raw_data.set_montage(montage)
+        raw_data.save(str(tmp_path / f'{subject}_raw.fif'), verbose='error')
+    cache_file = str(tmp_path / 'fingerprints.json')
+    spec = {'inputs': [str(tmp_path / '*_raw.fif')],
+            'stages': [{'name': 'load', 'type': 'load'},
+                       {'name': 'montage', 'type': 'montage', 'params': {'cache_file': cache_file}}]}
+
+    results = run_pipeline(spec, n_jobs=1)
+    assert all(result['error'] is None for result in results)
+    assert len(results[0]['fingerprints'][cache_file]) == 1
+    assert results[1]['fingerprints'] == {}
+    assert list(load_fingerprint_cache(cache_file)) == list(results[0]['fingerprints'][cache_file])
@@ -0,0 +1,33 @@
+import mne
+import numpy as np
+
+from pyeeg.preprocess.filtering import filter_raw_chunked, get_fir_kernel, _cached_fir_kernel
+from pyeeg.tests.preprocess.test_segmentation import make_raw
+
+
+def test_filter_raw_chunked_matches_mne():
+    """Block by block filtering of preloaded data equals mne, across skipped segments and for band-stops."""
+    raw_data = make_raw(n_times=20000)
+    raw_data.set_annotations(raw_data.annotations + mne.Annotations([80.0], [3.0], ['BAD_acq_skip'],
+                                                                    orig_time=raw_data.annotations.orig_time))
+    for l_freq, h_freq in [(0.5, 40.0), (None, 30.0), (30.0, 10.0)]:
+        expected = raw_data.copy().filter(l_freq, h_freq, verbose='error')
+        filtered = filter_raw_chunked(raw_data.copy(), l_freq, h_freq, block_size=1500)
+        np.testing.assert_allclose(filtered.get_data(), expected.get_data(), rtol=0, atol=1e-12)
+        assert (filtered.info['highpass'], filtered.info['lowpass']) == (expected.info['highpass'], expected.info['lowpass'])
+
+
+def test_filter_raw_chunked_lazy_reads_and_kernel_cache(tmp_path):
+    fname = str(tmp_path / 'recording_raw.fif')
+    make_raw().save(fname, verbose='error')
+    raw_data = mne.io.read_raw_fif(fname, verbose='error')
+
+    filtered = filter_raw_chunked(raw_data, 1.0, 40.0, picks=['Fz'], block_size=700)
+    expected = mne.io.read_raw_fif(fname, preload=True, verbose='error').filter(1.0, 40.0, picks=['Fz'], verbose='error')
+    assert not raw_data.preload
+    np.testing.assert_allclose(filtered.get_data(), expected.get_data(), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(filtered.annotations.onset, raw_data.annotations.onset)
+
+    hits = _cached_fir_kernel.cache_info().hits
+    assert get_fir_kernel(100, 1, 40.0) is get_fir_kernel(100.0, 1.0, 40)
+    assert _cached_fir_kernel.cache_info().hits >= hits + 1
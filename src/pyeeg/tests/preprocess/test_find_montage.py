@@ -0,0 +1,66 @@
+import numpy as np
+
+from pyeeg.preprocess.find_montage import check_pos_distance, position_distance_matrix, nearest_montage_chans
+
+
+def test_position_distance_matrix():
+    """Vectorized distances match check_pos_distance cell by cell, NAN rows included."""
+    rng = np.random.default_rng(0)
+    data_pos = rng.normal(0, 0.1, (12, 3))
+    data_pos[3, 1] = np.nan
+    montage_pos = rng.normal(0, 0.1, (20, 3))
+
+    position_matrix = position_distance_matrix(data_pos, montage_pos)
+    for datai in range(len(data_pos)):
+        for montagei in range(len(montage_pos)):
+            np.testing.assert_allclose(position_matrix[datai, montagei],
+                                       check_pos_distance(data_pos[datai], montage_pos[montagei]))
+
+    distances, indices = nearest_montage_chans(data_pos, montage_pos)
+    assert indices[3] == -1 and np.isnan(distances[3])
+    valid = indices >= 0
+    np.testing.assert_array_equal(indices[valid], np.argmin(position_matrix[valid], axis=1))
+    np.testing.assert_allclose(distances[valid], np.min(position_matrix[valid], axis=1))
+
+
+def test_assignment_matching():
+    """Assignment matching recovers shuffled montage channels and scores montages the same in a pool."""
+    from pyeeg.preprocess.find_montage import position_pipeline
+    from pyeeg.preprocess.montage_store import get_montage_positions
+
+    mchnames, mchpositions = get_montage_positions('biosemi32')
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(mchnames))
+    data_chan_info = {f"E{indx}": mchpositions[mchi] + rng.normal(0, 1e-4, 3) for indx, mchi in enumerate(order)}
+    data_chan_info['FAR'] = np.array([1.0, 1.0, 1.0])
+
+    serial_dict = position_pipeline(data_chan_info, position_method='assignment', n_jobs=1)
+    biosemi = serial_dict['biosemi32']
+    assert biosemi['valid'] and biosemi['match_info'] == f"{len(mchnames)}/{len(data_chan_info)}"
+    for indx, mchi in enumerate(order):
+        assert biosemi['chan_names'][f"E{indx}"] == mchnames[mchi]
+    assert biosemi['chan_names']['FAR'] == 'FAR' and np.isnan(biosemi['ch_pos_score']['FAR'])
+
+    pool_dict = position_pipeline(data_chan_info, position_method='assignment', n_jobs=2)
+    for montage_name, montage_entry in serial_dict.items():
+        assert pool_dict[montage_name]['position_score'] == montage_entry['position_score']
+        assert pool_dict[montage_name]['match_count'] == montage_entry['match_count']
+
+
+def test_partial_montage_loses():
+    """A montage matching two channels exactly ranks below one matching every channel with some distance."""
+    from pyeeg.preprocess.find_montage import assign_montage_chans, create_position_dict, get_scoreboard
+    from pyeeg.preprocess.montage_store import get_montage_positions
+
+    mchnames, mchpositions = get_montage_positions('biosemi64')
+    rng = np.random.default_rng(0)
+    data_chan_info = {ch_name: ch_pos + rng.normal(0, 2e-3, 3) for ch_name, ch_pos in zip(mchnames, mchpositions)}
+    data_chan_info[mchnames[0]] = mchpositions[0]
+    data_chan_info[mchnames[1]] = mchpositions[1]
+
+    loc_position_dict = {}
+    for montage_name, montage_chans in (('full', slice(None)), ('partial', slice(0, 2))):
+        loc_position_dict[montage_name] = assign_montage_chans(data_chan_info, mchnames[montage_chans], mchpositions[montage_chans],
+                                                               create_position_dict(data_chan_info)['biosemi64'])
+    assert loc_position_dict['partial']['position_score'] < loc_position_dict['full']['position_score']
+    assert get_scoreboard(loc_position_dict)[0] == 'full'
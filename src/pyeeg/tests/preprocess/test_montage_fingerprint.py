@@ -0,0 +1,56 @@
+import numpy as np
+import mne
+
+from pyeeg.preprocess.montage_fingerprint import chanlocs_fingerprint, detect_montages
+
+
+def test_detect_montages_once_per_layout(tmp_path, monkeypatch):
+    """Recordings from the same cap resolve with a single montage search."""
+    import pyeeg.preprocess.montage_fingerprint as montage_fingerprint
+
+    montage = mne.channels.make_standard_montage('biosemi32')
+    paths = []
+    for indx in range(3):
+        info = mne.create_info(montage.ch_names, 256.0, 'eeg')
+        raw_data = mne.io.RawArray(np.zeros((len(montage.ch_names), 256)), info, verbose='error')
+        raw_data.set_montage(montage)
+        paths.append(str(tmp_path / f"rec{indx}_raw.fif"))
+        raw_data.save(paths[-1], verbose='error')
+
+    calls = []
+    score_montages = montage_fingerprint.score_montages
+    monkeypatch.setattr(montage_fingerprint, 'score_montages', lambda *args, **kwargs: calls.append(1) or score_montages(*args, **kwargs))
+    cache_file = str(tmp_path / 'fingerprints.json')
+    montages = detect_montages(paths, cache_file=cache_file)
+    assert len(calls) == 1
+    assert len({result['fingerprint'] for result in montages.values()}) == 1
+    assert montages[paths[0]]['montage'] == montages[paths[0]]['scoreboard'][0][0]
+
+    detect_montages(paths, cache_file=cache_file)
+    assert len(calls) == 1
+    shifted = {ch_name: np.asarray(pos) + 1e-3 for ch_name, pos in montage._get_ch_pos().items()}
+    assert chanlocs_fingerprint(shifted) != chanlocs_fingerprint(montage._get_ch_pos())
+
+
+def test_detect_montages_keeps_concurrent_layouts(tmp_path, monkeypatch):
+    """Layouts written to the cache file by another run while detecting are kept."""
+    import json
+    import pyeeg.preprocess.montage_fingerprint as montage_fingerprint
+
+    montage = mne.channels.make_standard_montage('biosemi32')
+    info = mne.create_info(montage.ch_names, 256.0, 'eeg')
+    raw_data = mne.io.RawArray(np.zeros((len(montage.ch_names), 256)), info, verbose='error')
+    raw_data.set_montage(montage)
+    path = str(tmp_path / 'rec_raw.fif')
+    raw_data.save(path, verbose='error')
+    cache_file = str(tmp_path / 'fingerprints.json')
+
+    score_montages = montage_fingerprint.score_montages
+    def score_and_write(*args, **kwargs):
+        # another run saves its layout while this one searches
+        montage_fingerprint.save_fingerprint_cache({'other': {'montage': None, 'chan_names': {}, 'scoreboard': []}}, cache_file)
+        return score_montages(*args, **kwargs)
+    monkeypatch.setattr(montage_fingerprint, 'score_montages', score_and_write)
+    detect_montages([path], cache_file=cache_file)
+    with open(cache_file, 'r', encoding='utf8') as f:
+        assert len(json.load(f)) == 2
@@ -0,0 +1,17 @@
+import numpy as np
+
+from pyeeg.preprocess.montage_store import build_montage_store, save_montage_store, load_montage_store
+
+
+def test_montage_store_roundtrip(tmp_path):
+    """Stored montages load back with the same names and positions."""
+    montage_store = build_montage_store(['standard_1020', 'biosemi32'])
+    fname = str(tmp_path / 'montage_positions.npz')
+    save_montage_store(montage_store, fname)
+
+    loaded_store = load_montage_store(fname)
+    assert list(loaded_store) == list(montage_store)
+    for montage_name, (chan_names, chan_positions) in montage_store.items():
+        assert loaded_store[montage_name][0] == chan_names
+        np.testing.assert_array_equal(loaded_store[montage_name][1], chan_positions)
+    assert load_montage_store(str(tmp_path / 'missing.npz')) is None
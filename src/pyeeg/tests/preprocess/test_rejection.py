@@ -0,0 +1,30 @@
+import mne
+import numpy as np
+
+from pyeeg.preprocess.rejection import window_ptp
+from pyeeg.preprocess.segmentation import segment_data_continuous
+from pyeeg.tests.preprocess.test_segmentation import make_raw
+
+
+def test_window_ptp():
+    """Block and sliding filter paths give the peak-to-peak of every window."""
+    data = np.random.default_rng(1).normal(size=(3, 1000))
+    for starts, n_times in [(np.arange(0, 801, 100), 200), (np.array([3, 10, 500, 501, 790]), 210), (np.array([40]), 7)]:
+        expected = np.stack([np.ptp(data[:, start:start + n_times], axis=-1) for start in starts], axis=-1)
+        np.testing.assert_allclose(window_ptp(data, starts, n_times), expected)
+
+
+def test_segment_data_continuous_drop_log():
+    """Surviving epochs, selection and drop reasons are the ones of mne.Epochs rejection."""
+    raw_data = make_raw()
+    reject = dict(eeg=100e-6, eog=150e-6)
+    expected = mne.Epochs(raw_data, mne.make_fixed_length_events(raw_data, duration=1.0, overlap=0.5), tmin=0, tmax=0.99,
+                          baseline=None, preload=True, reject=reject, verbose='error')
+    epochs = segment_data_continuous(raw_data, epoch_duration=1.0, overlap=0.5, reject=reject)
+
+    assert epochs.drop_log == expected.drop_log
+    assert any(reason == ('BAD_motion',) for reason in epochs.drop_log)
+    assert any(reason == ('Fz',) for reason in epochs.drop_log)
+    np.testing.assert_array_equal(epochs.selection, expected.selection)
+    np.testing.assert_array_equal(epochs.events, expected.events)
+    np.testing.assert_allclose(epochs.get_data(), expected.get_data())
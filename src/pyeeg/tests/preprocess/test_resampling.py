@@ -0,0 +1,44 @@
+import mne
+import numpy as np
+
+from pyeeg.preprocess.resampling import resample_raw_chunked
+from pyeeg.preprocess.segmentation import create_epoch_dict, get_meta_data, get_event_index
+from pyeeg.tests.preprocess.test_segmentation import make_raw
+
+
+def test_resample_raw_chunked_matches_mne_polyphase(tmp_path):
+    """Blocks of a lazily read recording resample to the same data, events and info as mne."""
+    fname = str(tmp_path / 'recording_raw.fif')
+    make_raw(n_times=50000, sfreq=1000.0).save(fname, fmt='double', verbose='error')
+    raw_data = mne.io.read_raw_fif(fname, verbose='error')
+    events, _ = mne.events_from_annotations(raw_data, verbose='error')
+
+    expected, expected_events = mne.io.read_raw_fif(fname, preload=True, verbose='error').resample(
+        250.0, method='polyphase', events=events, verbose='error')
+    resampled, resampled_events = resample_raw_chunked(raw_data, 250.0, events=events, block_size=777)
+    assert not raw_data.preload
+    np.testing.assert_allclose(resampled.get_data(), expected.get_data(), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(resampled_events, expected_events)
+    assert (resampled.first_samp, resampled.info['sfreq'], resampled.info['lowpass']) == \
+           (expected.first_samp, expected.info['sfreq'], expected.info['lowpass'])
+    np.testing.assert_array_equal(resampled.annotations.onset, raw_data.annotations.onset)
+
+
+def test_event_samples_follow_resampling(tmp_path):
+    fname = str(tmp_path / 'recording_raw.fif')
+    raw_data = make_raw(n_times=50000, sfreq=1000.0)
+    raw_data.set_annotations(mne.Annotations(np.arange(1.0, 19.0, 0.7371), 0, 'stimulus',
+                                             orig_time=raw_data.annotations.orig_time))
+    raw_data.save(fname, verbose='error')
+    raw_data = mne.io.read_raw_fif(fname, verbose='error')
+    epoch_dict = get_meta_data(raw_data, create_epoch_dict())
+
+    resampled = resample_raw_chunked(raw_data, 100.0)
+    expected_events = mne.io.read_raw_fif(fname, preload=True, verbose='error').resample(
+        100.0, method='polyphase', events=epoch_dict['events'], verbose='error')[1]
+    np.testing.assert_array_equal(get_event_index(resampled).events, expected_events)
+    epoch_dict = get_meta_data(resampled, epoch_dict)
+    np.testing.assert_array_equal(epoch_dict['events'], expected_events)
+    assert epoch_dict['event_index'].sfreq == 100.0
+    # the index kept next to the recording stays at the rate of the recording
+    assert get_event_index(raw_data).sfreq == 1000.0
@@ -0,0 +1,103 @@
+import mne
+import numpy as np
+
+from pyeeg.preprocess.segmentation import segment_data_continuous, iter_epochs_continuous
+
+
+def make_raw(n_times=5000, sfreq=100.0):
+    rng = np.random.default_rng(0)
+    data = rng.normal(scale=5e-6, size=(4, n_times))
+    data[0, 1210:1230] += 300e-6 # eeg artifact
+    data[3, 3005] += 500e-6 # eog artifact
+    data[1, 4400:4420] += 900e-6 # artifact on a bad channel, ignored
+    info = mne.create_info(['Fz', 'Cz', 'Pz', 'EOG'], sfreq, ['eeg', 'eeg', 'eeg', 'eog'])
+    info['bads'] = ['Cz']
+    raw_data = mne.io.RawArray(data, info, first_samp=37, verbose='error')
+    raw_data.set_annotations(mne.Annotations([20.0, 33.3], [1.5, 0.1], ['BAD_motion', 'stimulus'],
+                                             orig_time=raw_data.annotations.orig_time))
+    return raw_data
+
+
+def test_iter_epochs_continuous_matches_epochs():
+    """Streamed batches hold the same epochs and events as the preloaded epochs object."""
+    raw_data = make_raw()
+    epochs = mne.Epochs(raw_data, mne.make_fixed_length_events(raw_data, duration=1.0, overlap=0.5), tmin=0, tmax=0.99,
+                        baseline=None, preload=True, reject=dict(eeg=100e-6, eog=150e-6), verbose='error')
+
+    batches = list(segment_data_continuous(raw_data, epoch_duration=1.0, overlap=0.5, batch_size=7))
+    data = np.concatenate([batch_data for batch_data, _ in batches])
+    events = np.concatenate([batch_events for _, batch_events in batches])
+    assert all(len(batch_data) <= 7 for batch_data, _ in batches)
+    assert len(events) < len(epochs.drop_log)
+    np.testing.assert_array_equal(events, epochs.events)
+    np.testing.assert_allclose(data, epochs.get_data())
+
+
+def test_iter_epochs_continuous_without_rejection():
+    raw_data = make_raw()
+    batches = list(iter_epochs_continuous(raw_data, epoch_duration=2.0, reject=None, reject_by_annotation=False,
+                                          picks=['Pz', 'Fz'], batch_size=100))
+    assert len(batches) == 1
+    data, events = batches[0]
+    assert data.shape == (25, 2, 200)
+    np.testing.assert_array_equal(data[3], raw_data.get_data(picks=['Pz', 'Fz'], start=600, stop=800))
+    np.testing.assert_array_equal(events[:, 0], np.arange(25) * 200 + raw_data.first_samp)
+
+
+def test_event_index_queries_and_metadata(tmp_path):
+    """Index counts, window queries and metadata agree with the full scans they replace."""
+    import pandas as pd
+    from pyeeg.preprocess.segmentation import EventIndex, get_event_index, event_index_path
+
+    rng = np.random.default_rng(2)
+    raw_data = make_raw(n_times=20000)
+    onsets = np.sort(rng.uniform(0, 199, 300))
+    raw_data.set_annotations(mne.Annotations(onsets, 0, rng.choice(['stim', 'resp', 'cue'], 300),
+                                             orig_time=raw_data.annotations.orig_time))
+    events, event_id = mne.events_from_annotations(raw_data, verbose='error')
+    event_index = EventIndex(events, event_id, raw_data.info['sfreq'])
+
+    assert event_index.counts == {name: np.count_nonzero(events[:, 2] == val) for name, val in event_id.items()}
+    start, stop = 3000, 9000
+    in_window = (events[:, 0] >= start) & (events[:, 0] < stop)
+    np.testing.assert_array_equal(event_index.events_between(start, stop), events[in_window])
+    np.testing.assert_array_equal(event_index.events_between(start, stop, ['resp']), 
+                                  events[in_window & (events[:, 2] == event_id['resp'])])
+    stim_samples = events[events[:, 2] == event_id['stim'], 0]
+    targets = np.array([0, stim_samples[5], stim_samples[5] + 1, 10**9])
+    np.testing.assert_array_equal(event_index.preceding(targets, 'stim'), [-1, stim_samples[4], stim_samples[5], stim_samples[-1]])
+
+    metadata, meta_events, meta_event_id = event_index.metadata(-0.5, 1.0)
+    expected, expected_events, expected_event_id = mne.epochs.make_metadata(events, event_id, tmin=-0.5, tmax=1.0, 
+                                                                            sfreq=raw_data.info['sfreq'])
+    pd.testing.assert_frame_equal(metadata, expected.reset_index(drop=True), check_dtype=False)
+    np.testing.assert_array_equal(meta_events, expected_events)
+    assert meta_event_id == expected_event_id
+
+    fname = str(tmp_path / 'recording.fif')
+    raw_data.save(fname, verbose='error')
+    saved_raw = mne.io.read_raw(fname, verbose='error')
+    event_index = get_event_index(saved_raw)
+    assert (tmp_path / 'recording-events.npz').is_file() and event_index_path(fname).endswith('recording-events.npz')
+    loaded = EventIndex.load(event_index_path(fname))
+    np.testing.assert_array_equal(loaded.events, event_index.events)
+    assert loaded.counts == event_index.counts
+    assert EventIndex.load(event_index_path(fname), key='other recording') is None
+
+
+def test_event_index_follows_annotations(tmp_path):
+    """Cropped or re-annotated data of a recording gets the events of its own annotations, not of the file."""
+    from pyeeg.preprocess.segmentation import get_event_index
+
+    raw_data = make_raw(n_times=20000)
+    raw_data.set_annotations(mne.Annotations(np.arange(1.0, 199.0, 2.0), 0, 'stim', orig_time=raw_data.annotations.orig_time))
+    fname = str(tmp_path / 'recording_raw.fif')
+    raw_data.save(fname, verbose='error')
+    assert len(get_event_index(mne.io.read_raw_fif(fname, verbose='error'))) == 99
+
+    cropped = mne.io.read_raw_fif(fname, verbose='error').crop(0, 50)
+    np.testing.assert_array_equal(get_event_index(cropped).events, mne.events_from_annotations(cropped, verbose='error')[0])
+    reannotated = mne.io.read_raw_fif(fname, verbose='error')
+    reannotated.set_annotations(mne.Annotations([5.0, 6.0], 0, ['cue', 'stim'], orig_time=reannotated.annotations.orig_time))
+    assert get_event_index(reannotated).counts == {'cue': 1, 'stim': 1}
+    assert len(get_event_index(mne.io.read_raw_fif(fname, verbose='error'))) == 99
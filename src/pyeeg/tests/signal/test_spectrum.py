@@ -0,0 +1,89 @@
+import numpy as np
+
+from pyeeg.signal.spectrum import fft_on_epochs
+
+
+def test_fft_on_epochs_amplitude():
+    """A pure sine gives its amplitude at its frequency, per epoch and channel, in any chunking."""
+    sampling_freq = 250
+    times = np.arange(500) / sampling_freq
+    data = np.empty((5, 2, len(times)))
+    data[:, 0] = 3.0 * np.sin(2 * np.pi * 10 * times)
+    data[:, 1] = 1.5 + np.cos(2 * np.pi * 40 * times)
+
+    fft_mag, freqs = fft_on_epochs(data, sampling_freq=sampling_freq, chunk_size=2)
+    assert fft_mag.shape == (5, 2, len(freqs)) and freqs[-1] == sampling_freq / 2
+    np.testing.assert_allclose(fft_mag[:, 0, freqs == 10], 3.0)
+    np.testing.assert_allclose(fft_mag[:, 1, freqs == 40], 1.0)
+    np.testing.assert_allclose(fft_mag[:, 1, 0], 1.5)
+
+    fft_mag32, _ = fft_on_epochs(data.astype(np.float32), sampling_freq=sampling_freq, workers=2)
+    assert fft_mag32.dtype == np.float32
+    np.testing.assert_allclose(fft_mag32, fft_mag, atol=1e-4)
+
+
+def test_welch_psd_raw():
+    """Streaming psd matches scipy's welch and skips bad or high amplitude windows."""
+    import mne
+    import scipy.signal
+    from pyeeg.signal.spectrum import welch_psd_raw
+
+    sfreq = 100.0
+    rng = np.random.default_rng(0)
+    data = rng.normal(0, 1e-6, (3, 6000))
+    info = mne.create_info(['C3', 'C4', 'EOG'], sfreq, ['eeg', 'eeg', 'eog'])
+    raw_data = mne.io.RawArray(data, info, verbose='error')
+    welch_parameters = {'window_duration': 2.0, 'overlap': 1.0, 'window': 'hann', 'block_windows': 7}
+
+    psd, freqs = welch_psd_raw(raw_data, welch_parameters=welch_parameters)
+    scipy_freqs, scipy_psd = scipy.signal.welch(data[:2], fs=sfreq, nperseg=200, noverlap=100)
+    np.testing.assert_allclose(freqs, scipy_freqs)
+    np.testing.assert_allclose(psd, scipy_psd)
+
+    # first 10 s are annotated bad and an eog artifact sits in the last 10 s
+    data[2, 5500] = 1e-3
+    raw_data = mne.io.RawArray(data, info, verbose='error')
+    raw_data.set_annotations(mne.Annotations([0], [10], ['bad_segment']))
+    psd, freqs = welch_psd_raw(raw_data, welch_parameters=welch_parameters)
+    # windows starting at samples 5400 and 5500 contain the artifact
+    _, before_psd = scipy.signal.welch(data[:2, 1000:5500], fs=sfreq, nperseg=200, noverlap=100)
+    _, after_psd = scipy.signal.welch(data[:2, 5600:], fs=sfreq, nperseg=200, noverlap=100)
+    np.testing.assert_allclose(psd, (44 * before_psd + 3 * after_psd) / 47)
+
+
+def test_get_band_power():
+    """Band power of a flat psd is the band width, relative power sums to one over complementary bands."""
+    from pyeeg.signal.spectrum import get_band_power
+
+    freqs = np.arange(0, 50.5, 0.5)
+    psd = np.ones((4, 3, len(freqs)))
+    bands = {'low': [0, 10], 'high': [10, 60]}
+
+    band_power, band_names = get_band_power(psd, bands=bands, freqs=freqs)
+    assert band_power.shape == (4, 3, 2) and band_names == ['low', 'high']
+    np.testing.assert_allclose(band_power[..., 0], 10)
+    relative_power, _ = get_band_power(psd, bands=bands, method='relative', freqs=freqs)
+    np.testing.assert_allclose(relative_power.sum(axis=-1), 1)
+    log_power, _ = get_band_power(psd, bands=bands, method='log', freqs=freqs)
+    np.testing.assert_allclose(log_power, 10 * np.log10(band_power))
+
+
+def test_stft_on_epochs():
+    """Strided stft matches scipy.signal.stft frame by frame and keeps float32."""
+    import scipy.signal
+    from pyeeg.signal.spectrum import stft_on_epochs
+
+    sampling_freq = 100
+    data = np.random.default_rng(0).normal(size=(4, 3, 500))
+    stft_parameters = {'window': 'hann', 'window_duration': 0.64, 'hop_duration': 0.2}
+
+    stft_data, freqs, times = stft_on_epochs(data, sampling_freq, stft_parameters, output='complex')
+    scipy_freqs, scipy_times, scipy_stft = scipy.signal.stft(data, fs=sampling_freq, nperseg=64, noverlap=44,
+                                                             boundary=None, padded=False, detrend=False)
+    np.testing.assert_allclose(freqs, scipy_freqs)
+    np.testing.assert_allclose(times, scipy_times)
+    np.testing.assert_allclose(stft_data, scipy_stft, atol=1e-12)
+
+    power, _, _ = stft_on_epochs(data.astype(np.float32), sampling_freq, stft_parameters)
+    assert power.dtype == np.float32
+    np.testing.assert_allclose(power, np.abs(scipy_stft) ** 2, rtol=1e-3, atol=1e-6)
@@ -0,0 +1,39 @@
+import numpy as np
+import pywt
+
+from pyeeg.signal.time_frequency import cwt_on_epochs
+
+
+def test_cwt_on_epochs_matches_pywt(tmp_path):
+    """Batched FFT convolution gives pywt.cwt coefficients, also into a memory-mapped output."""
+    srate = 128.0
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(3, 2, 200))
+    wavelet_parameters = {'wavelet': 'cmor1.5-1.0', 'f_range': [4, 30], 'f_count': 6, 'f_steps': 'lin'}
+
+    tfr, freqs = cwt_on_epochs(data, wavelet_parameters, output='complex', sampling_freq=srate, max_chunk_bytes=1)
+    scales = pywt.frequency2scale(wavelet_parameters['wavelet'], freqs / srate)
+    pywt_coefs, _ = pywt.cwt(data, scales, wavelet_parameters['wavelet'], sampling_period=1/srate)
+    assert tfr.shape == (3, 2, len(freqs), 200)
+    np.testing.assert_allclose(tfr, np.moveaxis(pywt_coefs, 0, 2), atol=1e-10)
+
+    power, _ = cwt_on_epochs(data, wavelet_parameters, out=str(tmp_path / 'power.npy'), sampling_freq=srate)
+    assert isinstance(power, np.memmap)
+    np.testing.assert_allclose(np.load(tmp_path / 'power.npy'), np.abs(tfr) ** 2, atol=1e-10)
+
+
+def test_wavelet_bank_cache(tmp_path):
+    """Same parameters reuse one bank, banks read from disk match freshly built ones."""
+    from pyeeg.signal.time_frequency import get_wavelet_bank, create_wavelet_bank, _cached_wavelet_bank
+
+    wavelet_parameters = {'wavelet': 'cmor1.5-1.0', 'f_range': [4, 30], 'f_count': 5, 'f_steps': 'lin'}
+    assert get_wavelet_bank(128, wavelet_parameters) is get_wavelet_bank(128.0, dict(wavelet_parameters))
+    assert get_wavelet_bank(256, wavelet_parameters) is not get_wavelet_bank(128, wavelet_parameters)
+
+    get_wavelet_bank(128, wavelet_parameters, cache_dir=str(tmp_path))
+    _cached_wavelet_bank.cache_clear()
+    disk_bank = get_wavelet_bank(128, wavelet_parameters, cache_dir=str(tmp_path))
+    fresh_bank = create_wavelet_bank(128, wavelet_parameters)
+    np.testing.assert_array_equal(disk_bank['offsets'], fresh_bank['offsets'])
+    for disk_kernel, fresh_kernel in zip(disk_bank['kernels'], fresh_bank['kernels']):
+        np.testing.assert_array_equal(disk_kernel, fresh_kernel)
@@ -0,0 +1,35 @@
+import os
+import sys
+import json
+import subprocess
+
+PYEEG_MODULES = ['pyeeg.signal.spectrum', 'pyeeg.signal.time_frequency',
+                 'pyeeg.preprocess.find_montage', 'pyeeg.preprocess.montage_store', 'pyeeg.preprocess.montage_fingerprint',
+                 'pyeeg.preprocess.segmentation', 'pyeeg.io.loader', 'pyeeg.io.columnar', 'pyeeg.io.catalog', 'pyeeg.io.writers']
+# loaded only when a function needs them
+HEAVY_MODULES = ['scipy.signal', 'scipy.fft', 'pywt', 'mne.io.edf', 'mne.io.eeglab', 'mne.channels.montage']
+# generous for slow CI machines, eager imports of the heavy modules took well above it
+STARTUP_BUDGET_SECONDS = 1.5
+
+IMPORT_SCRIPT = """
+import sys, time, json
+start_time = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+print(json.dumps({{'seconds': time.perf_counter() - start_time, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def run_imports(cwd) -> dict:
+    # mne itself is imported first so that the measure covers pyeeg only
+    script = "import mne, numpy\n" + IMPORT_SCRIPT.format(modules=PYEEG_MODULES, heavy=HEAVY_MODULES)
+    env = {**os.environ, 'LOG_DIR': 'logs', 'PYTHONPATH': os.pathsep.join(sys.path)}
+    output = subprocess.run([sys.executable, '-c', script], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def test_import_is_lazy_and_side_effect_free(tmp_path):
+    (tmp_path / 'logs').mkdir()
+    startup = run_imports(tmp_path)
+
+    assert startup['loaded'] == []
+    assert os.listdir(tmp_path / 'logs') == []
+    assert startup['seconds'] < STARTUP_BUDGET_SECONDS
@@ -0,0 +1,62 @@
+import io
+import logging
+
+from pyeeg.utils.logger import AggregatedLog, BackgroundQueueHandler, get_logger, set_log_level, parse_log_levels
+
+
+def test_background_logging_levels_and_aggregation():
+    """Records are written by the listener thread, module levels gate them and loop messages are summarized."""
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter("%(name)s %(levelname)s %(message)s"))
+    queue_handler = BackgroundQueueHandler([stream_handler])
+    module_logger = get_logger('tests.logger_module')
+    module_logger.addHandler(queue_handler)
+    try:
+        set_log_level('WARNING', 'pyeeg.tests.logger_module')
+        module_logger.info("hidden")
+        with AggregatedLog(module_logger) as nan_log:
+            nan_log.add("channels have NAN position values", 'Fp1')
+        assert not nan_log.enabled
+
+        set_log_level(logging.INFO, 'pyeeg.tests.logger_module')
+        with AggregatedLog(module_logger) as nan_log:
+            for indx in range(37):
+                nan_log.add("channels have NAN position values", f"E{indx}")
+        module_logger.warning("shown")
+        queue_handler.flush()
+    finally:
+        queue_handler.stop()
+        module_logger.removeHandler(queue_handler)
+        module_logger.setLevel(logging.NOTSET)
+
+    lines = stream.getvalue().splitlines()
+    assert lines == ["pyeeg.tests.logger_module INFO 37 channels have NAN position values: "
+                     + ", ".join(f"E{indx}" for indx in range(10)) + " (+27 more)",
+                     "pyeeg.tests.logger_module WARNING shown"]
+
+
+def test_parse_log_levels():
+    assert parse_log_levels(" info, pyeeg.preprocess.find_montage=warning ,") == {None: 'INFO', 'pyeeg.preprocess.find_montage': 'WARNING'}
+    assert parse_log_levels(None) == {}
+    assert parse_log_levels("INFO,pyeeg.io.loader=LOUD,pyeeg.io.catalog=30") == {None: 'INFO', 'pyeeg.io.catalog': 30}
+
+
+def test_levels_applied_on_first_record():
+    """Levels configured on start gate the record that started the listener."""
+    stream = io.StringIO()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    queue_handler = BackgroundQueueHandler([stream_handler], on_start=lambda: set_log_level('WARNING', 'pyeeg.tests.lazy_module'))
+    module_logger = get_logger('tests.lazy_module')
+    module_logger.addHandler(queue_handler)
+    try:
+        module_logger.info("hidden")
+        module_logger.warning("shown")
+        queue_handler.flush()
+    finally:
+        queue_handler.stop()
+        module_logger.removeHandler(queue_handler)
+        module_logger.setLevel(logging.NOTSET)
+    assert stream.getvalue().splitlines() == ["WARNING shown"]
+    assert queue_handler.on_start is None
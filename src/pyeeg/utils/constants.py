@@ -17,16 +17,91 @@ NON_STANDARD_CHANNEL_TYPES = {
 
 DEFAULT_REJECT_VALUES = dict(eeg=100e-6, 
                              eog=150e-6)
+DEFAULT_REJECT_BLOCK_WINDOWS = 1024 # windows read at once by find_bad_windows
 
 INVALID_POS_SCORE = 999 # assigned to invalid distances in find_montage()
 
 MNE_DEFAULT_MONTAGES = ['standard_1005', 'standard_1020', 'standard_alphabetic', 'standard_postfixed', 'standard_prefixed', 'standard_primed', 'biosemi16', 'biosemi32', 'biosemi64', 'biosemi128', 'biosemi160', 'biosemi256', 'easycap-M1', 'easycap-M10', 'easycap-M43', 'EGI_256', 'GSN-HydroCel-32', 'GSN-HydroCel-64_1.0', 'GSN-HydroCel-65_1.0', 'GSN-HydroCel-128', 'GSN-HydroCel-129', 'GSN-HydroCel-256', 'GSN-HydroCel-257', 'mgh60', 'mgh70', 'artinis-octamon', 'artinis-brite23', 'brainproducts-RNP-BA-128']
 
 DEFAULT_SEGMENTATION_WINDOW = [-0.5, 1]
+DEFAULT_EPOCH_BATCH_SIZE = 256 # epochs read and yielded at once by iter_epochs_continuous
+EVENT_INDEX_SUFFIX = '-events.npz' # event index written next to the recording
+EVENT_INDEX_VERSION = 1 # bump when the layout of event index files changes
 
 DEFAULT_WAVELET_PARAMETERS = {
     'wavelet': 'cmor1.5-1.0',
     'f_range': [2, 48],
     'f_count': 100,
     'f_steps': 'lin'
-}
\ No newline at end of file
+}
+MONTAGE_STORE_FILE = 'montage_positions.npz' # written under data/interim
+MONTAGE_STORE_VERSION = 1 # bump when the layout of the montage store changes
+
+DEFAULT_MATCH_DISTANCE = 0.02 # meters, largest electrode distance accepted by assignment matching
+
+FINGERPRINT_CACHE_FILE = 'montage_fingerprints.json' # written under data/interim
+FINGERPRINT_DECIMALS = 4 # position rounding (meters) before hashing a channel layout
+
+DEFAULT_FFT_CHUNK_SIZE = 256 # epochs transformed at once by fft_on_epochs
+
+DEFAULT_WELCH_PARAMETERS = {
+    'window_duration': 2.0,
+    'overlap': 1.0,
+    'window': 'hann',
+    'block_windows': 64
+}
+
+DEFAULT_FREQ_BANDS = {
+    'delta': [1, 4],
+    'theta': [4, 8],
+    'alpha': [8, 13],
+    'beta': [13, 30],
+    'gamma': [30, 45]
+}
+
+DEFAULT_CWT_CHUNK_BYTES = 2**28 # bound of the complex intermediate of a cwt_on_epochs chunk
+DEFAULT_CWT_PRECISION = 12 # wavelet sampling precision (2**precision points), same as pywt.cwt
+WAVELET_BANK_CACHE_SIZE = 8 # wavelet banks kept in memory by get_wavelet_bank
+KERNEL_FFT_CACHE_SIZE = 4 # kernel spectra (one per n_fft) kept in every wavelet bank by get_kernel_ffts
+
+DEFAULT_STFT_PARAMETERS = {
+    'window': 'hann',
+    'window_duration': 1.0,
+    'hop_duration': 0.5
+}
+
+DEFAULT_READER_PARAMETERS = {
+    'window_duration': 10.0,
+    'overlap': 0.0,
+    'max_bytes': 2**28,
+    'dtype': 'float64'
+}
+
+ORIG_FORMAT_BYTES = {'short': 2, 'int': 4, 'single': 4, 'double': 8} # bytes per sample of mne raw.orig_format
+EVENT_ANNOTATION_REGEXP = r'^(?![Bb][Aa][Dd]|[Ee][Dd][Gg][Ee]).*$' # annotations that are events, same as mne.events_from_annotations
+
+DEFAULT_MEMMAP_DTYPE = 'float64' # float64 backing files are mapped into mne without a copy
+MEMMAP_CACHE_DIR = 'memmap' # under data/interim
+
+COLUMNAR_CACHE_DIR = 'columnar' # under data/interim
+COLUMNAR_VERSION = 2 # bump when the layout of columnar recordings changes
+
+EPOCH_STORE_VERSION = 2 # bump when the layout of epoch stores changes
+
+CATALOG_FILE = 'catalog.sqlite' # written under data/interim
+CATALOG_EXTENSIONS = ('.edf', '.bdf', '.gdf', '.set', '.vhdr', '.fif', '.cnt')
+
+LOG_FILE = 'test.log' # written under LOG_DIR
+LOG_FORMAT = "%(asctime)s - %(module)s:%(lineno)d - %(levelname)s - %(message)s"
+LOG_SUMMARY_NAMES = 10 # items listed by an aggregated log message, the rest are counted
+
+STAGE_CACHE_DIR = 'stage_cache' # under data/interim
+STAGE_CACHE_VERSION = 1 # bump when stage outputs or their storage change
+DEFAULT_STAGE_CACHE_BYTES = 2**34 # size cap of the stage cache, least recently used entries are evicted above it
+
+DEFAULT_FILTER_BLOCK_SIZE = 2**16 # samples per overlap-save block of filter_raw_chunked, at least twice the kernel length
+FIR_KERNEL_CACHE_SIZE = 32 # FIR kernels kept in memory by get_fir_kernel
+
+DEFAULT_RESAMPLE_BLOCK_SIZE = 2**14 # output samples per block of resample_raw_chunked
+DEFAULT_RESAMPLE_WINDOW = ('kaiser', 5.0) # anti-aliasing window, same as scipy.signal.resample_poly and mne
+RESAMPLE_KERNEL_CACHE_SIZE = 16 # polyphase kernels kept in memory by get_polyphase_kernel
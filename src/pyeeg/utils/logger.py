@@ -1,10 +1,199 @@
+import os
+import queue
+import atexit
 import logging
+import logging.handlers
+
+from pyeeg.config.config import get_settings
 from pyeeg.io.getdir import set_logdir
+from pyeeg.utils.constants import LOG_FILE, LOG_FORMAT, LOG_SUMMARY_NAMES
+
+
+class DeferredFileHandler(logging.Handler):
+    """File handler that resolves the log folder and opens the file on the first record."""
+
+    def __init__(self, log_file):
+        super().__init__()
+        self.log_file = log_file
+        self.file_handler = None
+
+    def emit(self, record):
+        if self.file_handler is None:
+            self.file_handler = logging.FileHandler(set_logdir(self.log_file))
+            self.file_handler.setFormatter(self.formatter)
+        self.file_handler.emit(record)
+
+    def close(self):
+        if self.file_handler is not None:
+            self.file_handler.close()
+        super().close()
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a queue that a background thread writes to the target handlers.
+
+    The listener thread is started with the first record and stopped (after writing what is
+    left on the queue) at exit. Processes forked from the one that started it (e.g. process
+    pool workers) do not have the thread and write synchronously instead.
+
+    Args:
+        handlers (list): handlers the records are written to.
+        on_start (callable): called once when the listener thread first starts, e.g. to configure levels.
+    """
+
+    def __init__(self, handlers, on_start=None):
+        super().__init__(queue.SimpleQueue())
+        self.handlers = handlers
+        self.on_start = on_start
+        self.listener = None
+        self.listener_pid = None
+
+    def emit(self, record):
+        if self.listener is None:
+            self.start()
+            # levels set on start may disable the record that started the listener
+            if not logging.getLogger(record.name).isEnabledFor(record.levelno):
+                return
+        if os.getpid() != self.listener_pid:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+        super().emit(record)
+
+    def start(self):
+        on_start, self.on_start = self.on_start, None
+        self.listener = logging.handlers.QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.listener_pid = os.getpid()
+        atexit.register(self.stop)
+        # after the listener runs, so records logged by on_start are queued like any other
+        if on_start is not None:
+            on_start()
+
+    def stop(self):
+        """Writes the queued records and stops the listener thread."""
+        if self.listener is not None and os.getpid() == self.listener_pid:
+            self.listener.stop()
+            self.listener = None
+            atexit.unregister(self.stop)
+
+    def flush(self):
+        """Blocks until the queued records are written, the listener keeps running."""
+        if self.listener is not None and os.getpid() == self.listener_pid:
+            self.stop()
+            self.start()
+
+
+class AggregatedLog:
+    """
+    Collects repeated messages of an inner loop and logs each of them once with a count.
+
+    Example:
+        with AggregatedLog(logger) as nan_log:
+            for ch_name in ch_names:
+                nan_log.add("channels have NAN position values", ch_name)
+        # INFO: 37 channels have NAN position values: Fp1, Fp2, ... (+27 more)
+
+    Args:
+        logger (logging.Logger): logger the summaries are written to.
+        level (int): level of the summaries, nothing is collected if it is disabled.
+    """
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-logger.propagate = False
-handler = logging.FileHandler(set_logdir('test.log'))
-formatter = logging.Formatter("%(asctime)s - %(module)s:%(lineno)d - %(levelname)s - %(message)s")
+    def __init__(self, logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+        self.enabled = logger.isEnabledFor(level)
+        self.items = {}
+
+    def add(self, message, item=None):
+        if self.enabled:
+            self.items.setdefault(message, []).append(item)
+
+    def flush(self):
+        for message, items in self.items.items():
+            names = [str(item) for item in items if item is not None]
+            summary = f"{len(items)} {message}"
+            if names:
+                summary += ": " + ", ".join(names[:LOG_SUMMARY_NAMES])
+                if len(names) > LOG_SUMMARY_NAMES:
+                    summary += f" (+{len(names) - LOG_SUMMARY_NAMES} more)"
+            self.logger.log(self.level, summary, stacklevel=3)
+        self.items = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+
+def get_logger(name) -> logging.Logger:
+    """
+    Logger of a pyeeg module, records are handled by the package logger.
+
+    Args:
+        name (str): module name, usually __name__.
+
+    Returns:
+        logger (logging.Logger)
+    """
+    return logging.getLogger(name if name.startswith('pyeeg') else f"pyeeg.{name}")
+
+def set_log_level(level, module=None):
+    """
+    Sets the level of the package logger or of a single module.
+
+    Args:
+        level (int | str): logging level, e.g. 'WARNING' or logging.WARNING
+        module (str): module name (e.g. 'pyeeg.preprocess.find_montage'), None sets the package level.
+    """
+    get_logger(module or 'pyeeg').setLevel(level.upper() if isinstance(level, str) else level)
+
+def parse_log_levels(log_levels) -> dict:
+    """
+    Parses a level configuration such as 'INFO,pyeeg.preprocess.find_montage=WARNING'.
+
+    Args:
+        log_levels (str): comma separated levels, an entry without a module name sets the package level.
+
+    Returns:
+        levels (dict): module name (None for the package) -> level name or number, unknown levels are logged and skipped
+    """
+    levels = {}
+    for entry in filter(None, (entry.strip() for entry in (log_levels or '').split(','))):
+        module, _, level = entry.rpartition('=')
+        level = int(level) if level.strip().isdigit() else level.strip().upper()
+        if not isinstance(level, int) and not isinstance(logging.getLevelName(level), int):
+            package_logger.warning(f"Unknown log level in LOG_LEVELS entry '{entry}', it is skipped")
+            continue
+        levels[module.strip() or None] = level
+    return levels
+
+def apply_log_levels():
+    """
+    Sets the levels configured in LOG_LEVELS (environment or .env), see parse_log_levels.
+
+    Called with the first record of the package rather than at import, so importing pyeeg
+    does not read the settings. Levels below the package default (INFO) apply from then on.
+    """
+    for module, level in parse_log_levels(get_settings().getenv('LOG_LEVELS')).items():
+        set_log_level(level, module)
+
+def flush_logs():
+    """Blocks until all queued records are written to the log file."""
+    queue_handler.flush()
+
+
+package_logger = logging.getLogger('pyeeg')
+package_logger.setLevel(logging.INFO)
+package_logger.propagate = False
+handler = DeferredFileHandler(LOG_FILE)
+formatter = logging.Formatter(LOG_FORMAT)
 handler.setFormatter(formatter)
-logger.addHandler(handler)
+queue_handler = BackgroundQueueHandler([handler], on_start=apply_log_levels)
+package_logger.addHandler(queue_handler)
+
+# modules without a logger of their own log through the package logger
+logger = package_logger